@@ -0,0 +1,481 @@
+"""Batched feature extraction over all sliding windows of a recording
+
+All present sensors are stacked into one strided (n_sensors, n_windows,
+window_size) array, and every feature family is computed for all sensors and
+windows at once along the last axis: one Welch call, one wavelet
+decomposition and one set of moments per batch. Intermediate results are
+shared between families (the window std sets the ECG R-peak threshold), and
+the Welch band layout is computed once per window length. ECG R-peaks are
+detected per window by default, or once per recording with
+ECG_PEAK_MODE=recording (see hrv.py). The output columns follow
+ALL_FEATURE_NAMES exactly and match extract_window_features window by window
+in window peak mode.
+"""
+import math
+import os
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+import pywt
+
+from features import (
+    CFG, STEP, STRIDE, FEATURE_NAMES, ALL_FEATURE_NAMES, FREQ_BANDS,
+    hrv_features
+)
+from hrv import PeakIndex, StreamingPeakDetector, peak_mode
+from profiles import ChunkedResampler
+from observability import get_logger, stage
+
+logger = get_logger("features")
+
+N_TIME_FEATURES = 13
+N_FREQ_FEATURES = 11
+N_WAVELET_FEATURES = 20
+N_ECG_FEATURES = 4
+
+# Batched extraction configuration
+BATCH_CFG = {
+    # Window moments merged from blocks shared by overlapping windows instead
+    # of recomputed per window (equal up to floating-point rounding)
+    "incremental_stats": os.environ.get("FEATURE_INCREMENTAL_STATS", "1") != "0",
+}
+
+def count_windows(n_samples, window_size=STEP, stride_size=STRIDE):
+    """Number of complete windows in a recording of n_samples"""
+    if n_samples < window_size:
+        return 0
+    return (n_samples - window_size) // stride_size + 1
+
+def window_view(x, window_size=STEP, stride_size=STRIDE):
+    """Strided (..., n_windows, window_size) view over the last axis of x, without copying"""
+    x = np.asarray(x, dtype=float)
+    if x.shape[-1] < window_size:
+        return np.empty(x.shape[:-1] + (0, window_size))
+    return sliding_window_view(x, window_size, axis=-1)[..., ::stride_size, :]
+
+def window_moments(signals, n_windows, window_size=STEP, stride_size=STRIDE):
+    """Mean, central moments, range and absolute-difference sums of every window
+
+    Windows are split into blocks of gcd(window_size, stride_size) samples
+    (half a window with the default 10 s / 5 s setting), so overlapping
+    windows share blocks: each sample is visited once, and every window merges
+    the moments of its blocks with the parallel-moments formulas.
+
+    Args:
+        signals: (n_sensors, n_samples) array covering the n_windows windows
+
+    Returns:
+        dict of (n_sensors, n_windows) arrays: count, mean, m2, m3, m4 (sums of
+        centred powers), min, max and abs_diff (sum of |diff| inside the window)
+    """
+    block = math.gcd(window_size, stride_size)
+    per_window, step = window_size // block, stride_size // block
+    n_blocks = (n_windows - 1) * step + per_window
+    blocks = signals[:, :n_blocks * block].reshape(signals.shape[0], n_blocks, block)
+
+    block_mean = blocks.mean(axis=-1)
+    centred = blocks - block_mean[..., None]
+    squared = centred * centred
+    block_m2 = squared.sum(axis=-1)
+    # Contractions avoid materialising the cubed and fourth-power arrays
+    block_m3 = np.einsum("...i,...i->...", squared, centred)
+    block_m4 = np.einsum("...i,...i->...", squared, squared)
+    del centred, squared
+    block_abs_diff = np.abs(np.diff(blocks, axis=-1)).sum(axis=-1)
+    # Difference across the boundary between each block and the previous one
+    boundary = np.zeros_like(block_mean)
+    boundary[:, 1:] = np.abs(blocks[:, 1:, 0] - blocks[:, :-1, -1])
+
+    def windowed(values):
+        """(n_sensors, n_windows, per_window) view of per-block values"""
+        return sliding_window_view(values, per_window, axis=-1)[:, ::step]
+
+    means = windowed(block_mean)
+    mean = means.mean(axis=-1)
+    delta = means - mean[..., None]
+    m2_blocks, m3_blocks = windowed(block_m2), windowed(block_m3)
+    return {
+        "count": window_size,
+        "mean": mean,
+        "m2": (m2_blocks + block * delta**2).sum(axis=-1),
+        "m3": (m3_blocks + 3 * delta * m2_blocks + block * delta**3).sum(axis=-1),
+        "m4": (windowed(block_m4) + 4 * delta * m3_blocks + 6 * delta**2 * m2_blocks
+               + block * delta**4).sum(axis=-1),
+        "min": windowed(blocks.min(axis=-1)).min(axis=-1),
+        "max": windowed(blocks.max(axis=-1)).max(axis=-1),
+        "abs_diff": windowed(block_abs_diff).sum(axis=-1) + windowed(boundary)[..., 1:].sum(axis=-1),
+    }
+
+def zscore_windows(windows, moments=None):
+    """Z-score every window (last axis) independently, zeroing constant windows
+
+    Args:
+        moments: optional window_moments of the same windows, reused instead
+            of recomputing each window's mean and std
+    """
+    if moments is not None:
+        mean = moments["mean"][..., None]
+        std = np.sqrt(moments["m2"] / moments["count"])[..., None]
+        constant = (moments["max"] == moments["min"])[..., None]
+    else:
+        mean = windows.mean(axis=-1, keepdims=True)
+        std = windows.std(axis=-1, keepdims=True)
+        constant = std == 0
+    z = (windows - mean) / np.where(constant, 1.0, std)
+    z[np.broadcast_to(constant, z.shape)] = 0.0
+    return z
+
+@lru_cache(maxsize=None)
+def welch_layout(n, fs):
+    """Welch segment length, frequency grid and band slices for windows of n samples
+
+    Returns:
+        (nperseg, freqs, band_slices, mean_freq, std_freq); band_slices are
+        the contiguous index ranges of FREQ_BANDS over freqs
+    """
+    nperseg = min(256, n // 4)
+    freqs = np.fft.rfftfreq(nperseg, 1 / fs)
+    band_slices = []
+    for low, high in FREQ_BANDS.values():
+        indices = np.flatnonzero((freqs >= low) & (freqs <= high))
+        band_slices.append(slice(indices[0], indices[-1] + 1) if len(indices) else slice(0, 0))
+    return nperseg, freqs, tuple(band_slices), float(np.mean(freqs)), float(np.std(freqs))
+
+def sorted_percentiles(ordered, percentiles):
+    """np.percentile (linear method) along the last axis of an already sorted array"""
+    n = ordered.shape[-1]
+    results = []
+    for q in percentiles:
+        q = q / 100
+        # Same virtual index and interpolation as numpy's "linear" method (alpha = beta = 1)
+        alpha = beta = 1
+        virtual = n * q + (alpha + q * (1 - alpha - beta)) - 1
+        previous = int(np.clip(np.floor(virtual), 0, n - 1))
+        following = min(previous + 1, n - 1)
+        gamma = virtual - np.floor(virtual)
+        low, high = ordered[..., previous], ordered[..., following]
+        diff = high - low
+        results.append(high - diff * (1 - gamma) if gamma >= 0.5 else low + diff * gamma)
+    return results
+
+def batch_time_features(windows):
+    """Time-domain features along the last axis, shape (..., 13)"""
+    n = windows.shape[-1]
+    if n == 0:
+        return np.zeros(windows.shape[:-1] + (N_TIME_FEATURES,))
+
+    # Central moments from one centred copy; np.std/np.var/scipy.stats compute the same sums
+    mean_val = np.mean(windows, axis=-1)
+    centred = windows - mean_val[..., None]
+    squared = centred * centred
+    var_val = np.mean(squared, axis=-1)
+    std_val = np.sqrt(var_val)
+
+    # Constant windows get zero skew/kurtosis
+    varying = std_val != 0
+    safe_var = np.where(varying, var_val, 1.0)
+    skew_val = np.where(varying, np.mean(squared * centred, axis=-1) / safe_var ** 1.5, 0.0)
+    kurtosis_val = np.where(varying, np.mean(squared * squared, axis=-1) / safe_var ** 2 - 3.0, 0.0)
+    del centred, squared
+
+    # One (vectorised) sort gives min, max and the quartiles; faster than partitioning
+    ordered = np.sort(windows, axis=-1)
+    min_val = ordered[..., 0]
+    max_val = ordered[..., -1]
+    q25, median_val, q75 = sorted_percentiles(ordered, (25, 50, 75))
+    del ordered
+    if n > 1:
+        mad = np.mean(np.abs(np.diff(windows, axis=-1)), axis=-1)
+    else:
+        mad = np.zeros(windows.shape[:-1])
+    rms = np.sqrt(np.mean(windows * windows, axis=-1))
+
+    return np.stack([
+        mean_val, std_val, var_val, skew_val, kurtosis_val,
+        min_val, max_val, max_val - min_val,
+        median_val, q25, q75, mad, rms
+    ], axis=-1)
+
+def moment_time_features(windows, moments):
+    """Time-domain features of z-scored windows from the raw windows' moments, shape (..., 13)
+
+    After z-scoring, mean, std, var and rms are 0, 1, 1 and 1 by construction,
+    skew and kurtosis are scale-invariant and the mean absolute difference
+    scales with 1/std, so only the order statistics need the window itself.
+    """
+    n = moments["count"]
+    varying = moments["max"] != moments["min"]
+    var = np.where(varying, moments["m2"] / n, 1.0)
+    ones = varying.astype(float)
+
+    features = np.zeros(windows.shape[:-1] + (N_TIME_FEATURES,))
+    features[..., 1] = ones  # std
+    features[..., 2] = ones  # var
+    features[..., 3] = np.where(varying, moments["m3"] / n / var ** 1.5, 0.0)
+    features[..., 4] = np.where(varying, moments["m4"] / n / var ** 2 - 3.0, 0.0)
+
+    ordered = np.sort(windows, axis=-1)
+    features[..., 5] = ordered[..., 0]
+    features[..., 6] = ordered[..., -1]
+    features[..., 7] = ordered[..., -1] - ordered[..., 0]
+    features[..., 9], features[..., 8], features[..., 10] = sorted_percentiles(ordered, (25, 50, 75))
+    del ordered
+
+    if n > 1:
+        features[..., 11] = np.where(varying, moments["abs_diff"] / (n - 1) / np.sqrt(var), 0.0)
+    features[..., 12] = ones  # rms
+    return features
+
+def batch_freq_features(windows, fs=100):
+    """Frequency-domain features along the last axis, shape (..., 11)"""
+    n = windows.shape[-1]
+    features = np.zeros(windows.shape[:-1] + (N_FREQ_FEATURES,))
+    if n < 8 or windows.size == 0:
+        return features
+
+    nperseg, freqs, band_slices, mean_freq, std_freq = welch_layout(n, fs)
+    _, psd = signal.welch(windows, fs=fs, nperseg=nperseg, axis=-1)
+    total_power = np.sum(psd, axis=-1)
+    has_power = total_power != 0
+    safe_total = np.where(has_power, total_power, 1.0)
+
+    for i, band in enumerate(band_slices):
+        band_power = np.sum(psd[..., band], axis=-1)
+        features[..., 2 * i] = band_power
+        features[..., 2 * i + 1] = band_power / safe_total  # Relative power
+    features[..., 8] = mean_freq
+    features[..., 9] = std_freq
+    features[..., 10] = freqs[np.argmax(psd, axis=-1)]  # Peak frequency
+
+    # Windows without any spectral power keep all-zero features
+    features[~has_power] = 0.0
+    return features
+
+def batch_wavelet_features(windows):
+    """Wavelet features along the last axis, shape (..., 20)"""
+    features = np.zeros(windows.shape[:-1] + (N_WAVELET_FEATURES,))
+    if windows.size == 0:
+        return features
+
+    try:
+        coeffs = pywt.wavedec(windows, 'db4', level=4, axis=-1)
+    except Exception as e:
+        logger.warning(f"Wavelet feature extraction failed: {e}")
+        return features
+
+    column = 0
+    for coeff in coeffs:
+        if coeff.shape[-1] > 0 and column < N_WAVELET_FEATURES:
+            mean = np.mean(coeff, axis=-1)
+            centred = coeff - mean[..., None]
+            var = np.mean(centred * centred, axis=-1)
+            features[..., column] = mean
+            features[..., column + 1] = np.sqrt(var)
+            features[..., column + 2] = var
+            features[..., column + 3] = np.max(np.abs(coeff), axis=-1)
+            column += 4
+    return features
+
+def batch_ecg_features(windows, fs=100, height=None):
+    """ECG features for every window, shape (n_windows, 4)
+
+    R-peak detection has no batched equivalent in scipy, so this is the one
+    family that still runs find_peaks per window.
+
+    Args:
+        height: per-window R-peak threshold; defaults to the window std,
+            which callers that already have it can pass in
+    """
+    n_windows, n = windows.shape
+    if height is None:
+        height = np.std(windows, axis=-1)
+    features = np.zeros((n_windows, N_ECG_FEATURES))
+    for i in range(n_windows):
+        try:
+            peaks, _ = signal.find_peaks(windows[i], height=height[i], distance=fs//3)
+            features[i] = hrv_features(peaks, n, fs=fs)
+        except Exception as e:
+            logger.warning(f"ECG feature extraction failed: {e}")
+    return features
+
+def extract_stacked_features(windows, sensors, fs=100, moments=None, ecg_features=None):
+    """All features for z-scored windows of several sensors at once
+
+    Args:
+        windows: (n_sensors, n_windows, window_size) array
+        sensors: sensor names, in the order of the first axis
+        moments: optional window_moments of the raw windows, from which the
+            time-domain features are derived instead of recomputed
+        ecg_features: optional (n_windows, 4) HRV features from a PeakIndex,
+            used instead of detecting R-peaks in every window
+
+    Returns:
+        dict of sensor -> (n_windows, width) features in FEATURE_NAMES order
+    """
+    with stage("features_time"):
+        if moments is not None:
+            time_features = moment_time_features(windows, moments)
+        else:
+            time_features = batch_time_features(windows)
+    with stage("features_freq"):
+        freq_features = batch_freq_features(windows, fs=fs)
+    with stage("features_wavelet"):
+        wavelet_features = batch_wavelet_features(windows)
+
+    features = {}
+    for i, sensor in enumerate(sensors):
+        blocks = [time_features[i], freq_features[i], wavelet_features[i]]
+        if sensor == "ECG" and ecg_features is not None:
+            blocks.append(ecg_features)
+        elif sensor == "ECG":
+            with stage("features_ecg"):
+                # The std column of the time features is the R-peak threshold
+                blocks.append(batch_ecg_features(windows[i], fs=fs, height=time_features[i, :, 1]))
+        features[sensor] = np.hstack(blocks)
+    return features
+
+def extract_sensor_features(windows, sensor, fs=100):
+    """All features for one sensor's z-scored windows, in FEATURE_NAMES order"""
+    return extract_stacked_features(windows[None], [sensor], fs=fs)[sensor]
+
+def iter_batch_features(columns, n_samples=None, fs=CFG["fs"], window_size=STEP, stride_size=STRIDE,
+                        batch_size=256, incremental=None, peaks=None, windows=None):
+    """Features of every sliding window of a recording, one batch of windows at a time
+
+    Takes the same arguments as extract_batch_features, so a consumer can act
+    on early windows while later ones are still being extracted.
+
+    Yields:
+        (start, features): index of the batch's first window and its
+        (n_batch_windows, len(ALL_FEATURE_NAMES)) feature matrix
+    """
+    if n_samples is None:
+        n_samples = min((len(col) for col in columns.values()), default=0)
+    if incremental is None:
+        incremental = BATCH_CFG["incremental_stats"]
+    n_windows = count_windows(n_samples, window_size, stride_size)
+    if n_windows == 0:
+        return
+
+    # A missing sensor is zero-filled, and all-zero windows yield all-zero features
+    sensors = [sensor for sensor in CFG["sensors"] if sensor in columns]
+    if not sensors:
+        for start in range(0, n_windows, batch_size):
+            yield start, np.zeros((min(batch_size, n_windows - start), len(ALL_FEATURE_NAMES)))
+        return
+    offsets, offset = {}, 0
+    for sensor in CFG["sensors"]:
+        offsets[sensor] = offset
+        offset += len(FEATURE_NAMES[sensor])
+
+    with stage("windowing"):
+        signals = np.stack([np.asarray(columns[sensor], dtype=float)[:n_samples] for sensor in sensors])
+        view = window_view(signals, window_size, stride_size)  # (n_sensors, n_windows, window_size)
+    if peaks is None and "ECG" in sensors and peak_mode() == "recording":
+        with stage("features_ecg"):
+            peaks = PeakIndex.from_ecg(signals[sensors.index("ECG")], fs)
+    selected = None
+    if windows is not None:
+        selected = np.zeros(n_windows, dtype=bool)
+        selected[np.asarray(windows, dtype=np.int64)] = True
+    for start in range(0, n_windows, batch_size):
+        stop = min(start + batch_size, n_windows)
+        X = np.zeros((stop - start, len(ALL_FEATURE_NAMES)))
+        # Positions in the batch of the windows to extract
+        rows = slice(None) if selected is None else np.flatnonzero(selected[start:stop])
+        if selected is not None and len(rows) == 0:
+            yield start, X
+            continue
+        with stage("windowing"):
+            moments = None
+            if incremental:
+                covered = signals[:, start * stride_size:(stop - 1) * stride_size + window_size]
+                moments = window_moments(covered, stop - start, window_size, stride_size)
+                if selected is not None:
+                    moments = {key: value if np.isscalar(value) else value[:, rows] for key, value in moments.items()}
+            batch = zscore_windows(view[:, start:stop][:, rows], moments)
+        ecg_features = None
+        if peaks is not None and "ECG" in sensors:
+            with stage("features_ecg"):
+                ecg_features = peaks.window_features(np.arange(start, stop)[rows] * stride_size, window_size)
+        for sensor, features in extract_stacked_features(batch, sensors, fs=fs, moments=moments,
+                                                         ecg_features=ecg_features).items():
+            X[rows, offsets[sensor]:offsets[sensor] + features.shape[1]] = features
+        yield start, X
+
+def extract_batch_features(columns, n_samples=None, fs=CFG["fs"], window_size=STEP, stride_size=STRIDE,
+                           batch_size=256, incremental=None, peaks=None, windows=None):
+    """Extract features for every sliding window of a recording
+
+    Args:
+        columns: mapping of sensor name -> 1-D signal; sensors missing from
+            the mapping are treated as all-zero, like process_csv_data does
+        n_samples: recording length, required only if columns is empty
+        batch_size: windows processed per chunk, bounding the z-scored copy
+            of all sensors and the intermediate arrays
+        incremental: share window statistics between overlapping windows
+            (default: BATCH_CFG["incremental_stats"])
+        peaks: optional PeakIndex of the ECG column, in its sample indices;
+            by default R-peaks are detected here according to ECG_PEAK_MODE
+        windows: optional indices of the windows to extract; the rows of the
+            other windows are left at zero (see signal_quality.py)
+
+    Returns:
+        (n_windows, len(ALL_FEATURE_NAMES)) feature matrix
+    """
+    if n_samples is None:
+        n_samples = min((len(col) for col in columns.values()), default=0)
+    X = np.zeros((count_windows(n_samples, window_size, stride_size), len(ALL_FEATURE_NAMES)))
+    for start, features in iter_batch_features(columns, n_samples, fs, window_size, stride_size,
+                                               batch_size, incremental, peaks, windows):
+        X[start:start + len(features)] = features
+    return X
+
+def iter_window_blocks(chunks, profile, window_size=STEP):
+    """Consecutive runs of complete windows of a chunked recording
+
+    Samples after the last complete window of a chunk are carried into the
+    next one, and in recording peak mode ECG R-peaks are detected across
+    chunks by one StreamingPeakDetector. Yields (first window index, columns, n_samples,
+    peaks), where columns start at the first window's first sample and peaks
+    is a PeakIndex in the same sample indices (None in window peak mode).
+    """
+    stride = profile.stride_size
+    resampler = ChunkedResampler(profile.source_fs) if profile.needs_resampling else None
+    detector = StreamingPeakDetector() if peak_mode() == "recording" else None
+    carry = None
+    first_window = 0
+
+    def blocks():
+        for columns in chunks:
+            yield resampler.push(columns) if resampler else columns
+        if resampler:
+            yield resampler.flush()
+
+    for columns in blocks():
+        if not columns:
+            continue
+        peaks = None
+        if detector is not None and "ECG" in columns:
+            detector.push(columns["ECG"])
+            offset = first_window * stride
+            peaks = PeakIndex(detector.peaks().peaks - offset)
+        if carry is not None:
+            columns = {sensor: np.concatenate((carry[sensor], columns[sensor])) for sensor in columns}
+        n_samples = min(len(col) for col in columns.values())
+        n_windows = count_windows(n_samples, window_size, stride)
+        if n_windows:
+            yield first_window, columns, n_samples, peaks
+            first_window += n_windows
+            if detector is not None:
+                detector.discard_before(first_window * stride)
+        carry = {sensor: col[n_windows * stride:n_samples] for sensor, col in columns.items()}
+
+def iter_feature_blocks(chunks, profile, window_size=STEP):
+    """Feature matrices of consecutive windows of a chunked recording
+
+    Yields (first window index, features) for each block of iter_window_blocks.
+    """
+    for first_window, columns, n_samples, peaks in iter_window_blocks(chunks, profile, window_size):
+        yield first_window, extract_batch_features(columns, n_samples, stride_size=profile.stride_size, peaks=peaks)
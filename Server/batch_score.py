@@ -0,0 +1,283 @@
+"""Offline batch scoring of a directory of recordings
+
+Walks a directory for recordings (CSV, .npy, .npz, Parquet, Arrow IPC and
+WESAD subject .pkl files) and scores every window of each one with the
+physiological model. Files are spread over a process pool, and each worker
+loads the served model (PHYSIO_MODEL_PATH) once. Recordings are read in
+chunks of rows where the format allows it (CSV, .npy, Parquet). Each chunk is
+resampled, windowed and scored, then written out before the next one is
+read, so memory stays bounded by the chunk size rather than the recording
+length. Windows that span two chunks are carried over, so the output matches
+scoring the whole file at once. With ECG_PEAK_MODE=recording, R-peaks are
+tracked across chunks and later chunks use the stream's running threshold.
+
+Output is partitioned by recording, as <output>/recording=<path>/part-0.parquet
+(or .csv), with one row per window. Progress is appended to
+<output>/_progress.jsonl as each file completes, and a rerun skips files that
+are already done and unchanged, so an interrupted run can be resumed.
+
+Usage (from Server/):
+    python batch_score.py /data/WESAD --output scores
+    python batch_score.py /data/recordings --output scores --format csv --workers 4
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from features import CFG
+from batch_features import iter_feature_blocks
+from ingest import SUPPORTED_EXTENSIONS, read_chunks
+from profiles import resolve_profile
+from compiled_model import compile_model
+from model_sharing import PHYSIO_MODEL_PATH, load_model
+from observability import get_logger
+
+logger = get_logger("batch_score")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Batch scoring configuration
+SCORE_CFG = {
+    "output": "scores",
+    "format": "parquet",
+    "workers": os.cpu_count() or 1,
+    # Rows read per chunk of a recording
+    "chunk_rows": 500_000,
+    # Profile of recordings that do not declare a rate (.pkl files are WESAD chest, 700 Hz)
+    "signal_profile": None,
+    "wesad_profile": "wesad_chest",
+    "progress_file": "_progress.jsonl",
+}
+
+RECORDING_EXTENSIONS = SUPPORTED_EXTENSIONS + (".pkl",)
+
+CLASS_NAMES = ["Low", "Medium", "High"]
+
+# === Discovery ===
+
+def find_recordings(root):
+    """Recording files under root, as paths relative to it, in a stable order"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(RECORDING_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return found
+
+def recording_name(relpath):
+    """Partition name of a recording: its relative path, with "__" between directories"""
+    return relpath.replace(os.sep, "__")
+
+# === Output ===
+
+class PartitionWriter:
+    """Writes one recording's rows chunk by chunk, to a temporary file renamed on close"""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.tmp_path = path + ".tmp"
+        self.rows = 0
+        self._writer = None
+
+    def write(self, frame):
+        if not self.rows:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.fmt == "parquet":
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.tmp_path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += len(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self.rows:
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def window_frame(name, first_window, probs, stride_sec):
+    """Output rows for a block of scored windows (columns as in predict_wesad.py, plus timing)"""
+    window = np.arange(first_window, first_window + len(probs))
+    predictions = np.argmax(probs, axis=1)
+    frame = pd.DataFrame({
+        "recording": name,
+        "window_id": window,
+        "start_sec": window * stride_sec,
+        "end_sec": window * stride_sec + CFG["window_sec"],
+        "prediction": predictions,
+        "predicted_class": np.array(CLASS_NAMES)[predictions]
+    })
+    for i, class_name in enumerate(CLASS_NAMES):
+        frame[f"prob_{class_name}"] = probs[:, i]
+    return frame
+
+# === Workers ===
+
+_worker = {}
+
+def _init_worker(backend):
+    """Load (and optionally compile) the served model once per worker process"""
+    if not os.path.exists(PHYSIO_MODEL_PATH):
+        _worker["model"] = None
+        return
+    _worker["model"] = compile_model(load_model(PHYSIO_MODEL_PATH), backend)
+
+def score_file(root, relpath, output, fmt, chunk_rows, signal_profile):
+    """Score every window of one recording into its output partition
+
+    Returns:
+        Progress entry for the file
+    """
+    start = time.perf_counter()
+    model = _worker.get("model")
+    if model is None:
+        raise RuntimeError(f"No physiological model at {PHYSIO_MODEL_PATH}")
+    path = os.path.join(root, relpath)
+    name = recording_name(relpath)
+    profile = resolve_profile(SCORE_CFG["wesad_profile"] if relpath.lower().endswith(".pkl") else signal_profile)
+    out_path = os.path.join(output, f"recording={name}", f"part-0.{fmt}")
+
+    writer = PartitionWriter(out_path, fmt)
+    class_counts = np.zeros(len(CLASS_NAMES), dtype=int)
+    try:
+        for first_window, X in iter_feature_blocks(read_chunks(path, chunk_rows), profile):
+            X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+            probs = model.predict_proba(X)
+            class_counts += np.bincount(np.argmax(probs, axis=1), minlength=len(CLASS_NAMES))
+            writer.write(window_frame(name, first_window, probs, profile.stride_sec))
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    return {
+        "status": "done" if writer.rows else "skipped",
+        "windows": writer.rows,
+        "class_counts": dict(zip(CLASS_NAMES, class_counts.tolist())),
+        "output": os.path.relpath(out_path, output) if writer.rows else None,
+        "signal_profile": profile.name,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+# === Progress ===
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+def load_progress(output):
+    """Latest progress entry per file from earlier runs"""
+    progress = {}
+    path = os.path.join(output, SCORE_CFG["progress_file"])
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line of an interrupted run
+                progress[entry["file"]] = entry
+    return progress
+
+def is_complete(entry, signature, output):
+    if entry is None or entry.get("status") not in ("done", "skipped"):
+        return False
+    if entry.get("size") != signature["size"] or entry.get("mtime") != signature["mtime"]:
+        return False
+    return entry["status"] == "skipped" or os.path.exists(os.path.join(output, entry["output"]))
+
+def run(root, output=None, fmt=None, workers=None, chunk_rows=None, signal_profile=None, resume=True,
+        backend=None):
+    """Score every recording under root; returns the progress entries of this run"""
+    output = output or SCORE_CFG["output"]
+    fmt = fmt or SCORE_CFG["format"]
+    workers = SCORE_CFG["workers"] if workers is None else workers
+    chunk_rows = chunk_rows or SCORE_CFG["chunk_rows"]
+    signal_profile = signal_profile or SCORE_CFG["signal_profile"]
+    if fmt not in ("parquet", "csv"):
+        raise ValueError(f"Unknown output format '{fmt}'. Expected parquet or csv")
+    if fmt == "parquet" and pq is None:
+        raise ValueError("Parquet output requires the 'pyarrow' package (or use --format csv)")
+    resolve_profile(signal_profile)
+    os.makedirs(output, exist_ok=True)
+
+    progress = load_progress(output) if resume else {}
+    todo, already_done = [], 0
+    for relpath in find_recordings(root):
+        signature = file_signature(os.path.join(root, relpath))
+        if is_complete(progress.get(relpath), signature, output):
+            already_done += 1
+            continue
+        todo.append((relpath, signature))
+    logger.info(f"{len(todo)} recordings to score", extra={"already_done": already_done})
+
+    entries = []
+    progress_path = os.path.join(output, SCORE_CFG["progress_file"])
+    with open(progress_path, "a") as progress_file:
+        def record(relpath, signature, entry):
+            entry = {"file": relpath, **signature, **entry}
+            progress_file.write(json.dumps(entry) + "\n")
+            progress_file.flush()
+            os.fsync(progress_file.fileno())
+            entries.append(entry)
+            logger.info(f"{entry['status']}: {relpath}", extra={"windows": entry.get("windows", 0)})
+
+        args = (output, fmt, chunk_rows, signal_profile)
+        if workers <= 0:
+            _init_worker(backend)
+            for relpath, signature in todo:
+                try:
+                    record(relpath, signature, score_file(root, relpath, *args))
+                except Exception as e:
+                    record(relpath, signature, {"status": "failed", "error": str(e)})
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend,)) as pool:
+                futures = {pool.submit(score_file, root, relpath, *args): (relpath, signature)
+                           for relpath, signature in todo}
+                for future in as_completed(futures):
+                    relpath, signature = futures[future]
+                    try:
+                        record(relpath, signature, future.result())
+                    except Exception as e:
+                        record(relpath, signature, {"status": "failed", "error": str(e)})
+    return entries
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score every window of a directory of recordings")
+    parser.add_argument("input", help="Directory of recordings (CSV, .npy, .npz, Parquet, Arrow IPC, WESAD .pkl)")
+    parser.add_argument("--output", default=SCORE_CFG["output"], help="Output directory, partitioned by recording")
+    parser.add_argument("--format", default=SCORE_CFG["format"], choices=("parquet", "csv"))
+    parser.add_argument("--workers", type=int, default=SCORE_CFG["workers"], help="Worker processes (0 runs in this process)")
+    parser.add_argument("--chunk-rows", type=int, default=SCORE_CFG["chunk_rows"], help="Rows read per chunk")
+    parser.add_argument("--signal-profile", help="Profile of non-WESAD recordings (see profiles.py)")
+    parser.add_argument("--backend", help="Physiological model backend: sklearn, flat or onnx (default: PHYSIO_BACKEND)")
+    parser.add_argument("--no-resume", action="store_true", help="Rescore files already recorded as done")
+    args = parser.parse_args()
+
+    entries = run(args.input, args.output, args.format, args.workers, args.chunk_rows,
+                  args.signal_profile, not args.no_resume, args.backend)
+    counts = {status: sum(entry["status"] == status for entry in entries) for status in ("done", "skipped", "failed")}
+    print(f"Scored {counts['done']} recordings ({sum(e.get('windows', 0) for e in entries)} windows), "
+          f"{counts['skipped']} without sensor data, {counts['failed']} failed. Output in {args.output}")
+    for entry in entries:
+        if entry["status"] == "failed":
+            print(f"  failed: {entry['file']}: {entry['error']}")
@@ -0,0 +1,331 @@
+"""Benchmarks for the feature-extraction and prediction pipeline
+
+Generates synthetic ECG/EDA/EMG/Temp recordings at CFG["fs"] and times, for
+each recording length:
+    - process_csv_data on a CSV file
+    - the per-window extract_*_features functions and their batched versions
+    - the physiological model, as loaded and compiled to flat arrays
+    - PhysioDominantFusion.predict_proba (single input and vectorized batch)
+    - the XAIExplainer.explain_* methods
+    - the full /predict round trip through a local test client
+Each length runs in its own process so its peak RSS can be reported. Results
+are written as JSON and can be compared against an earlier run.
+
+Runs offline: if the trained models in models/ are missing (or --stand-in is
+given), small models of the same shape are trained on random data instead.
+
+Usage (from Server/):
+    python benchmark.py --lengths 1m,10m,1h,8h --output bench.json
+    python benchmark.py --lengths 1m,1h --compare bench.json
+"""
+import os
+
+# Benchmark the pipeline itself: in-process work, no feature cache, quiet logs
+os.environ.setdefault("STARTUP_MODE", "lazy")
+os.environ.setdefault("PREDICT_WORKERS", "0")
+os.environ.setdefault("FEATURE_STORE_ENABLED", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from features import (
+    CFG, STEP, STRIDE, zscore,
+    extract_time_features, extract_freq_features, extract_wavelet_features, extract_ecg_features
+)
+from batch_features import (
+    window_view, zscore_windows,
+    batch_time_features, batch_freq_features, batch_wavelet_features, batch_ecg_features
+)
+from compiled_model import compile_model
+from hrv import PeakIndex
+
+# Benchmark configuration
+BENCH_CFG = {
+    "lengths": "1m,10m,1h,8h",
+    "repeats": 3,
+    # Calls per timing of the per-window and single-input functions
+    "inner_loops": 200,
+    # Windows explained when timing explain_physio_prediction on long recordings
+    "max_explain_windows": 1000,
+    "seed": 0,
+}
+
+MODEL_PATHS = {
+    "physio_model": "models/regularized_global_model.pkl",
+    "dass21_model": "models/stacking_classifier_model.pkl",
+    "dass21_scaler": "models/scaler.pkl",
+}
+
+DASS21_RESPONSES = "[1,2,0,3,1,2,0]"
+
+_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+def parse_length(length):
+    """Seconds in a length such as "90s", "10m" or "8h" """
+    length = length.strip().lower()
+    if length[-1] in _UNITS:
+        return int(float(length[:-1]) * _UNITS[length[-1]])
+    return int(length)
+
+def synthetic_recording(n_samples, fs=CFG["fs"], seed=0):
+    """Deterministic ECG/EDA/EMG/Temp recording with physiologically shaped signals"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / fs
+    heart_rate = 1.2 + 0.1 * np.sin(2 * np.pi * t / 300)  # ~72 bpm with slow variation
+    ecg = np.sin(np.pi * np.cumsum(heart_rate) / fs) ** 40 + 0.05 * rng.standard_normal(n_samples)
+    eda = 2 + 0.5 * np.sin(2 * np.pi * t / 600) + 0.05 * rng.standard_normal(n_samples)
+    emg = rng.standard_normal(n_samples) * (0.2 + (np.sin(2 * np.pi * t / 20) > 0.9))
+    temp = 33 + 0.3 * np.sin(2 * np.pi * t / 3600) + 0.01 * rng.standard_normal(n_samples)
+    return pd.DataFrame({"ECG": ecg, "EDA": eda, "EMG": emg, "Temp": temp})
+
+def build_stand_in_models(seed=0):
+    """Small models with the inputs and outputs of the trained ones"""
+    from sklearn.ensemble import RandomForestClassifier, StackingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import StandardScaler
+    from features import ALL_FEATURE_NAMES
+
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((500, len(ALL_FEATURE_NAMES)))
+    y = rng.integers(0, 3, len(X))
+    physio_model = RandomForestClassifier(n_estimators=100, max_depth=8, random_state=seed).fit(X, y)
+
+    D = rng.integers(0, 4, (500, 7)).astype(float)
+    yd = np.clip(D.sum(axis=1) // 7, 0, 2).astype(int)
+    scaler = StandardScaler().fit(D)
+    dass21_model = StackingClassifier(
+        [("rf", RandomForestClassifier(n_estimators=50, random_state=seed)), ("lr", LogisticRegression())],
+        final_estimator=LogisticRegression()
+    ).fit(scaler.transform(D), yd)
+    return physio_model, dass21_model, scaler
+
+def load_main(stand_in=False):
+    """Import the serving module, swapping in stand-in models when needed
+
+    Returns:
+        (main module, whether stand-ins are used)
+    """
+    import main
+    stand_in = stand_in or not all(os.path.exists(path) for path in MODEL_PATHS.values())
+    if stand_in:
+        physio_model, dass21_model, scaler = build_stand_in_models()
+        main.components.register("physio_model", lambda: physio_model)
+        main.components.register("dass21_model", lambda: dass21_model)
+        main.components.register("dass21_scaler", lambda: scaler)
+        main.components.register("dass21_table", lambda: None)  # Built for the real models
+    return main, stand_in
+
+def time_call(fn, repeats, inner_loops=1):
+    """Wall time per call in ms over `repeats` timings of `inner_loops` calls"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(inner_loops):
+            fn()
+        times.append((time.perf_counter() - start) * 1000 / inner_loops)
+    return {
+        "min_ms": round(min(times), 4),
+        "median_ms": round(float(np.median(times)), 4),
+        "mean_ms": round(float(np.mean(times)), 4),
+        "repeats": repeats,
+        "inner_loops": inner_loops
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+def run_length(length, repeats, inner_loops, stand_in=False, seed=0):
+    """All benchmark cases for one recording length (run in a fresh process)"""
+    from fastapi.testclient import TestClient
+
+    main, stand_in = load_main(stand_in)
+    n_samples = parse_length(length) * CFG["fs"]
+    recording = synthetic_recording(n_samples, seed=seed)
+    cases = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, f"recording_{length}.csv")
+        recording.to_csv(csv_path, index=False)
+        csv_bytes = os.path.getsize(csv_path)
+
+        # === Parsing and batched feature extraction ===
+        X = main.process_csv_data(csv_path)
+        cases["process_csv_data"] = time_call(lambda: main.process_csv_data(csv_path), repeats)
+
+        # === Per-window and batched feature families ===
+        window = zscore(recording["ECG"].to_numpy()[:STEP])
+        windows = zscore_windows(window_view(recording["ECG"].to_numpy(), STEP, STRIDE))
+        per_window = {
+            "extract_time_features": lambda: extract_time_features(window),
+            "extract_freq_features": lambda: extract_freq_features(window),
+            "extract_wavelet_features": lambda: extract_wavelet_features(window),
+            "extract_ecg_features": lambda: extract_ecg_features(window),
+        }
+        for name, fn in per_window.items():
+            cases[name] = time_call(fn, repeats, inner_loops)
+        batched = {
+            "batch_time_features": lambda: batch_time_features(windows),
+            "batch_freq_features": lambda: batch_freq_features(windows),
+            "batch_wavelet_features": lambda: batch_wavelet_features(windows),
+            "batch_ecg_features": lambda: batch_ecg_features(windows),
+            "peak_index_ecg_features": lambda: PeakIndex.from_ecg(recording["ECG"].to_numpy()).window_features(
+                np.arange(len(windows)) * STRIDE),
+        }
+        for name, fn in batched.items():
+            cases[name] = time_call(fn, repeats)
+
+        # === Models and fusion ===
+        physio_model = main.components.get("physio_model")
+        cases["physio_predict_proba"] = time_call(lambda: physio_model.predict_proba(X), repeats)
+        cases["physio_predict_proba_window"] = time_call(lambda: physio_model.predict_proba(X[:1]), repeats, inner_loops)
+        flat_model = compile_model(physio_model, backend="flat")
+        if flat_model is not physio_model:
+            cases["physio_predict_proba_flat"] = time_call(lambda: flat_model.predict_proba(X), repeats)
+            cases["physio_predict_proba_flat_window"] = time_call(
+                lambda: flat_model.predict_proba(X[:1]), repeats, inner_loops
+            )
+        physio_probs = physio_model.predict_proba(X)
+        dass21_probs = main.predict_dass21_proba(main.validate_and_parse_dass21(DASS21_RESPONSES))
+        fusion_input = {"phys": physio_probs.mean(axis=0), "text": dass21_probs, "voice": np.array([0.33, 0.34, 0.33])}
+        cases["fusion_predict_proba"] = time_call(
+            lambda: main.fusion_model.predict_proba(fusion_input), repeats, inner_loops
+        )
+        fusion_X = np.hstack([physio_probs, np.tile(dass21_probs, (len(X), 1)), np.full((len(X), 3), 1 / 3)])
+        cases["fusion_predict_proba_batch"] = time_call(
+            lambda: main.fusion_model.predict_proba_from_features(fusion_X), repeats
+        )
+
+        # === Explanations ===
+        xai = main.components.get("xai_explainer")
+        X_explain = X[:BENCH_CFG["max_explain_windows"]]
+        cases["explain_physio_prediction"] = time_call(lambda: xai.explain_physio_prediction(X_explain), repeats)
+        cases["explain_physio_prediction"]["windows"] = len(X_explain)
+        answers = np.random.default_rng(seed).integers(0, 4, (repeats, 7)).astype(float)
+        dass21_times = []
+        for row in answers:
+            xai.dass21_shap_cache.clear()  # Time the uncached path
+            dass21_times.append(time_call(lambda: xai.explain_dass21_prediction(row[None, :]), 1)["min_ms"])
+        cases["explain_dass21_prediction"] = {
+            "min_ms": min(dass21_times), "median_ms": round(float(np.median(dass21_times)), 4),
+            "mean_ms": round(float(np.mean(dass21_times)), 4), "repeats": repeats, "inner_loops": 1
+        }
+        cases["explain_fusion_decision"] = time_call(
+            lambda: xai.explain_fusion_decision(fusion_input, main.fusion_model.predict_proba(fusion_input)),
+            repeats, inner_loops
+        )
+
+        # === Full /predict round trip ===
+        with open(csv_path, "rb") as f:
+            payload = f.read()
+        client = TestClient(main.app)
+        def round_trip():
+            response = client.post(
+                "/predict",
+                files={"physiological_file": ("recording.csv", payload, "text/csv")},
+                data={"dass21_responses": DASS21_RESPONSES}
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"/predict returned {response.status_code}: {response.text[:200]}")
+            return response.json()
+        stage_timings = round_trip()["metadata"].get("stage_timings_ms", {})
+        cases["predict_round_trip"] = time_call(round_trip, repeats)
+        cases["predict_round_trip"]["stage_timings_ms"] = stage_timings
+
+    return {
+        "length": length,
+        "n_samples": n_samples,
+        "n_windows": int(X.shape[0]),
+        "csv_bytes": csv_bytes,
+        "stand_in_models": stand_in,
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": cases
+    }
+
+def environment_info():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import scipy, sklearn
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "sklearn": sklearn.__version__,
+        "cfg": CFG
+    }
+
+def run_benchmarks(lengths, repeats, inner_loops, stand_in=False, isolate=True, seed=0):
+    """Benchmark every length, each in a fresh process unless isolate is False"""
+    results = []
+    for length in lengths:
+        print(f"Benchmarking {length} recording...", flush=True)
+        if isolate:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_length, length, repeats, inner_loops, stand_in, seed).result()
+        else:
+            result = run_length(length, repeats, inner_loops, stand_in, seed)
+        results.append(result)
+        print_result(result)
+    return {"environment": environment_info(), "config": {"repeats": repeats, "inner_loops": inner_loops}, "results": results}
+
+def print_result(result, baseline=None):
+    print(f"\n{result['length']}: {result['n_samples']} samples, {result['n_windows']} windows, "
+          f"peak RSS {result['peak_rss_mb']} MB" + (" (stand-in models)" if result["stand_in_models"] else ""))
+    for name, case in result["cases"].items():
+        line = f"  {name:<30} {case['median_ms']:>12.3f} ms"
+        if baseline is not None and name in baseline["cases"]:
+            before = baseline["cases"][name]["median_ms"]
+            line += f"   was {before:>12.3f} ms ({before / case['median_ms']:.2f}x)" if case["median_ms"] else ""
+        print(line)
+
+def compare(current, baseline):
+    """Print current results next to a previous run, matched by recording length"""
+    previous = {result["length"]: result for result in baseline["results"]}
+    print(f"\nCompared with {baseline['environment'].get('git_commit')} ({baseline['environment']['timestamp']})")
+    for result in current["results"]:
+        print_result(result, previous.get(result["length"]))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark feature extraction and prediction")
+    parser.add_argument("--lengths", default=BENCH_CFG["lengths"], help="Comma-separated recording lengths, e.g. 1m,10m,1h,8h")
+    parser.add_argument("--repeats", type=int, default=BENCH_CFG["repeats"])
+    parser.add_argument("--inner-loops", type=int, default=BENCH_CFG["inner_loops"])
+    parser.add_argument("--stand-in", action="store_true", help="Use stand-in models even if models/ has the trained ones")
+    parser.add_argument("--no-isolate", action="store_true", help="Run all lengths in this process (peak RSS is then cumulative)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args()
+
+    report = run_benchmarks(
+        [length for length in args.lengths.split(",") if length.strip()],
+        args.repeats, args.inner_loops, args.stand_in, not args.no_isolate, BENCH_CFG["seed"]
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
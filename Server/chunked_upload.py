@@ -0,0 +1,227 @@
+"""Constant-memory processing of large /predict uploads
+
+Starlette spools a multipart upload to a temporary file as it arrives, but
+reading it with UploadFile.read() loads the whole recording, and parsing it
+builds a full table next to the raw bytes. Uploads of at least
+UPLOAD_CHUNKED_MIN_MB are instead copied to a named spool file in fixed-size
+pieces (so a worker process can open it) and read back chunk_rows rows at a
+time. Each chunk is resampled, checked for signal quality, windowed and
+scored before the next one is read. Only the samples after the last complete
+window are carried into the next chunk, so memory is bounded by the chunk
+size, not by the recording length. Per window, only its four quality flag
+bytes are kept until the end.
+
+The result matches whole-file processing except that, with
+ECG_PEAK_MODE=recording, R-peaks after the first chunk use the stream's
+running threshold (see hrv.StreamingPeakDetector), and that the feature
+store is not used, since it keys recordings by a hash
+of the whole upload. Explanations (top_k, full) are computed over a bounded
+uniform sample of the scored windows (WindowSample), plus any windows the
+request names. /predict/batch spools large archives the same way and scores
+large members chunk by chunk.
+
+test_chunked_upload.py checks that peak memory does not grow with the
+recording size.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from batch_features import count_windows, extract_batch_features, iter_window_blocks
+from ingest import file_format, read_chunks
+from signal_quality import assess_windows, window_weights, quality_summary, quality_mode, profile_ranges
+from observability import get_logger, stage
+
+logger = get_logger("chunked_upload")
+
+# Formats that can be read a chunk of rows at a time
+CHUNKED_FORMATS = ("csv", "npy", "parquet")
+# Archives of /predict/batch, which are opened from their spool file
+ARCHIVE_EXTENSIONS = (".zip",)
+
+# Chunked upload configuration
+UPLOAD_CFG = {
+    # Set to 0 to always read uploads whole
+    "enabled": os.environ.get("UPLOAD_CHUNKED", "1") != "0",
+    # Uploads at least this large are processed chunk by chunk
+    "min_bytes": int(float(os.environ.get("UPLOAD_CHUNKED_MIN_MB", 64)) * 2**20),
+    # Source rows read per chunk (10 minutes at 100 Hz)
+    "chunk_rows": int(os.environ.get("UPLOAD_CHUNK_ROWS", 60_000)),
+    # Bytes copied per read of the upload into the spool file
+    "copy_bytes": 2**20,
+    # Where spool files are written (default: the system temporary directory)
+    "spool_dir": os.environ.get("UPLOAD_SPOOL_DIR") or None,
+}
+
+def use_chunked(size, filename):
+    """Whether an upload of size bytes should be processed chunk by chunk"""
+    if not UPLOAD_CFG["enabled"] or size is None or size < UPLOAD_CFG["min_bytes"]:
+        return False
+    if (filename or "").lower().endswith(ARCHIVE_EXTENSIONS):
+        return True
+    return file_format(filename) in CHUNKED_FORMATS
+
+async def spool_upload(upload, directory=None):
+    """Copy an UploadFile to a named temporary file, piece by piece; returns its path
+
+    The caller removes the file when done with it.
+    """
+    directory = directory or UPLOAD_CFG["spool_dir"]
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                piece = await upload.read(UPLOAD_CFG["copy_bytes"])
+                if not piece:
+                    break
+                f.write(piece)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def spool_member(archive, member, directory=None):
+    """Extract a zip archive member to a named temporary file, piece by piece; returns its path"""
+    directory = directory or UPLOAD_CFG["spool_dir"]
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(member)[1].lower(), prefix="upload-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f, archive.open(member) as source:
+            shutil.copyfileobj(source, f, UPLOAD_CFG["copy_bytes"])
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+class WindowSample:
+    """Bounded uniform sample of scored windows' features, for explanations
+
+    Keeps at most size rows chosen by reservoir sampling, plus the rows of
+    the windows in keep (windows a request asks individual attributions for).
+
+    Args:
+        size: rows kept by reservoir sampling
+        keep: recording window indices that are always kept when scored
+    """
+
+    def __init__(self, size, keep=(), seed=0):
+        self.size = size
+        self.keep = set(int(w) for w in keep)
+        self.rng = np.random.default_rng(seed)
+        self.seen = 0
+        self.windows = np.empty(0, dtype=np.int64)
+        self.rows = None
+        self.kept = {}
+
+    def add(self, windows, X):
+        """Offer the rows of X, the features of recording windows `windows`"""
+        for window, row in zip(windows, X):
+            if int(window) in self.keep:
+                self.kept[int(window)] = row.copy()
+        if self.rows is None:
+            self.rows = np.empty((self.size, X.shape[1]))
+            self.windows = np.empty(self.size, dtype=np.int64)
+        fill = min(max(self.size - self.seen, 0), len(X))
+        self.rows[self.seen:self.seen + fill] = X[:fill]
+        self.windows[self.seen:self.seen + fill] = windows[:fill]
+        # Algorithm R: row i of the stream replaces a random slot with probability size / (i + 1)
+        positions = self.seen + np.arange(fill, len(X))
+        slots = self.rng.integers(0, positions + 1) if len(positions) else positions
+        for i, slot in zip(range(fill, len(X)), slots):
+            if slot < self.size:
+                self.rows[slot] = X[i]
+                self.windows[slot] = windows[i]
+        self.seen += len(X)
+
+    def __len__(self):
+        return min(self.seen, self.size)
+
+    def result(self):
+        """(windows, X): sampled and kept windows in recording order, and their features"""
+        n = len(self)
+        windows = {int(w): row for w, row in zip(self.windows[:n], self.rows[:n] if n else [])}
+        windows.update(self.kept)
+        order = sorted(windows)
+        X = np.array([windows[w] for w in order]) if order else np.empty((0, 0))
+        return np.array(order, dtype=np.int64), X
+
+def score_chunks(chunks, profile, predict_proba, mode=None, sample=None):
+    """Signal-quality-weighted average of per-window probabilities of a chunked recording
+
+    Windows are gated like in a whole-recording /predict: failing windows
+    are not extracted or scored, unless no window of the recording passes.
+    Until the first window passes, every window is scored, so that this
+    fallback is still available without a second pass over the recording.
+
+    Args:
+        chunks: iterable of dicts of sensor -> 1-D array, at the profile's source rate
+        predict_proba: function from a feature matrix to per-window probabilities
+        sample: optional WindowSample that collects the features of scored
+            windows, for explanations
+
+    Returns:
+        dict with physio_probs (the average), n_windows, n_scored and
+        signal_quality (quality_summary, or None when SIGNAL_QUALITY=off);
+        with a sample, also explain_windows and explain_X, its result()
+    """
+    mode = mode or quality_mode()
+    ranges = profile_ranges(profile)
+    weighted_sum, weight_total = 0.0, 0.0
+    unweighted_sum = 0.0  # every window, kept until some window passes
+    flag_blocks = []
+    n_windows = 0
+    # Failing windows, sampled in case no window of the recording passes
+    fallback_sample = WindowSample(sample.size, sample.keep) if sample is not None else None
+    for first_window, columns, n_samples, peaks in iter_window_blocks(chunks, profile):
+        count = count_windows(n_samples, stride_size=profile.stride_size)
+        if mode == "off":
+            weights = np.ones(count)
+        else:
+            with stage("signal_quality"):
+                flags = assess_windows(columns, n_samples, stride_size=profile.stride_size, peaks=peaks,
+                                       ranges=ranges)
+            flag_blocks.append(flags)
+            weights = window_weights(flags, mode, fallback=False)
+        fallback_needed = weight_total == 0
+        selected = np.arange(count) if fallback_needed else np.flatnonzero(weights > 0)
+        n_windows += count
+        if not len(selected):
+            continue
+        X = extract_batch_features(columns, n_samples, stride_size=profile.stride_size,
+                                   peaks=peaks, windows=selected)[selected]
+        probs = predict_proba(np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0))
+        if fallback_needed:
+            unweighted_sum = unweighted_sum + probs.sum(axis=0)
+        if sample is not None:
+            passing = weights[selected] > 0
+            sample.add(first_window + selected[passing], X[passing])
+            if fallback_needed:
+                fallback_sample.add(first_window + selected[~passing], X[~passing])
+        weighted_sum = weighted_sum + (probs * weights[selected, None]).sum(axis=0)
+        weight_total += weights[selected].sum()
+
+    if n_windows == 0:
+        raise ValueError("No features extracted from data. Check data length and format.")
+    signal_quality = None
+    n_scored = n_windows
+    if flag_blocks:
+        flags = np.concatenate(flag_blocks)
+        weights = window_weights(flags, mode)
+        signal_quality = quality_summary(flags, weights, mode)
+        n_scored = signal_quality["windows_used"]
+    physio_probs = weighted_sum / weight_total if weight_total > 0 else unweighted_sum / n_windows
+    result = {
+        "physio_probs": np.asarray(physio_probs),
+        "n_windows": n_windows,
+        "n_scored": n_scored,
+        "signal_quality": signal_quality
+    }
+    if sample is not None:
+        result["explain_windows"], result["explain_X"] = (sample if weight_total > 0 else fallback_sample).result()
+    return result
+
+def score_upload(path, profile, predict_proba, chunk_rows=None, sample=None):
+    """score_chunks over a spooled upload, read chunk_rows rows at a time"""
+    chunks = read_chunks(path, chunk_rows or UPLOAD_CFG["chunk_rows"])
+    return score_chunks(chunks, profile, predict_proba, sample=sample)
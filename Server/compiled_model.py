@@ -0,0 +1,290 @@
+"""Compiled inference backends for the physiological model
+
+sklearn's predict_proba spends most of a single-window call on input
+validation and per-tree Python dispatch (RandomForest also goes through
+joblib). For serving, the fitted model can be converted once at load time:
+
+    - "flat": tree ensembles become one set of node arrays traversed for all
+      trees at once, linear models a matrix product, both in NumPy
+    - "onnx": the model is exported with skl2onnx and run by onnxruntime
+      (optional dependencies, float32 inputs)
+
+The converted model is checked against sklearn's predict_proba on probe
+inputs before it is used. If the model type is unsupported, a dependency is
+missing or parity fails, the sklearn model is served instead (or loading
+fails, with PHYSIO_BACKEND_STRICT=1).
+"""
+import os
+import numpy as np
+
+from observability import get_logger
+
+logger = get_logger("compiled_model")
+
+BACKENDS = ("sklearn", "flat", "onnx")
+
+# Inference configuration
+INFERENCE_CFG = {
+    # "sklearn" serves the model as loaded; "flat" or "onnx" compile it
+    "backend": os.environ.get("PHYSIO_BACKEND", "sklearn"),
+    # Raise instead of falling back to sklearn when compilation or parity fails
+    "strict": os.environ.get("PHYSIO_BACKEND_STRICT", "0") == "1",
+    # Probe rows compared against sklearn at load time
+    "parity_samples": int(os.environ.get("PHYSIO_PARITY_SAMPLES", 512)),
+    # Largest allowed absolute probability difference; onnx runs in float32
+    "parity_atol": {"flat": 1e-9, "onnx": 1e-4},
+    "seed": 0,
+}
+
+if os.environ.get("PHYSIO_PARITY_ATOL"):
+    INFERENCE_CFG["parity_atol"] = dict.fromkeys(INFERENCE_CFG["parity_atol"], float(os.environ["PHYSIO_PARITY_ATOL"]))
+
+def _final_estimator(model):
+    """(preprocessing steps, final estimator) of a model or Pipeline"""
+    steps = getattr(model, "steps", None)
+    if steps is None:
+        return [], model
+    return [step for _, step in steps[:-1] if step not in (None, "passthrough")], steps[-1][1]
+
+def _affine_steps(steps):
+    """Pipeline preprocessing as (offset, scale) pairs: x -> (x - offset) / scale"""
+    affine = []
+    for step in steps:
+        name = type(step).__name__
+        if name == "StandardScaler":
+            offset = step.mean_ if step.mean_ is not None else 0.0
+            scale = step.scale_ if step.scale_ is not None else 1.0
+            affine.append((offset, scale))
+        else:
+            raise ValueError(f"Cannot compile pipeline step {name}")
+    return affine
+
+class FlatTreeEnsemble:
+    """A fitted sklearn tree classifier or forest as flat node arrays
+
+    Leaves point to themselves, so every tree is advanced max_depth times in
+    lock-step without branching on which nodes are leaves. Features are
+    compared in float32 like sklearn's tree code, so the same leaves are
+    reached for the same inputs.
+    """
+
+    backend = "flat"
+
+    def __init__(self, model):
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        estimators = getattr(model, "estimators_", [model])
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output tree classifiers can be compiled")
+
+        features, thresholds, children_left, children_right, leaf_probs, roots = [], [], [], [], [], []
+        offset = 0
+        self.max_depth = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            nodes = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children_left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            children_right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            # DecisionTreeClassifier.predict_proba normalises the leaf values
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_probs.append(value / normalizer)
+            roots.append(offset)
+            offset += n_nodes
+            self.max_depth = max(self.max_depth, tree.max_depth)
+
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        self.children_left = np.concatenate(children_left).astype(np.intp)
+        self.children_right = np.concatenate(children_right).astype(np.intp)
+        self.leaf_probs = np.concatenate(leaf_probs)
+        self.roots = np.array(roots, dtype=np.intp)
+
+    def split_values(self):
+        """Thresholds used for each feature, for probing parity at the split points"""
+        is_split = np.isfinite(self.threshold)
+        return self.feature[is_split], self.threshold[is_split]
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+        return self.leaf_probs[nodes].mean(axis=1)
+
+class FlatLinearModel:
+    """A fitted sklearn LogisticRegression (optionally after scaling) as one matrix product"""
+
+    backend = "flat"
+
+    def __init__(self, model, affine=()):
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        coef = np.asarray(model.coef_, dtype=float)
+        intercept = np.asarray(model.intercept_, dtype=float)
+        # Fold the scaling steps into the weights: w . ((x - m) / s) = (w / s) . x - (w / s) . m
+        for offset, scale in reversed(affine):
+            coef = coef / scale
+            intercept = intercept - coef @ np.broadcast_to(offset, coef.shape[1:])
+        self.coef_ = coef.T
+        self.intercept_ = intercept
+        self.one_vs_rest = getattr(model, "solver", None) == "liblinear" and len(self.classes_) > 2
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        scores = X @ self.coef_ + self.intercept_
+        if scores.shape[1] == 1:
+            positive = 1.0 / (1.0 + np.exp(-scores[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        if self.one_vs_rest:
+            probs = 1.0 / (1.0 + np.exp(-scores))
+            return probs / probs.sum(axis=1, keepdims=True)
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+class FlatScaledModel:
+    """A compiled model behind the affine preprocessing of its Pipeline"""
+
+    backend = "flat"
+
+    def __init__(self, model, affine):
+        self.model = model
+        self.affine = affine
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+
+    def split_values(self):
+        """Split thresholds mapped back through the scaling to raw feature values"""
+        features, thresholds = self.model.split_values()
+        for offset, scale in reversed(self.affine):
+            scale = np.broadcast_to(scale, (self.n_features_in_,))[features]
+            offset = np.broadcast_to(offset, (self.n_features_in_,))[features]
+            thresholds = thresholds * scale + offset
+        return features, thresholds
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=float)
+        for offset, scale in self.affine:
+            X = (X - offset) / scale
+        return self.model.predict_proba(X)
+
+class OnnxModel:
+    """A fitted sklearn model exported to ONNX and run by onnxruntime"""
+
+    backend = "onnx"
+
+    def __init__(self, model):
+        try:
+            import onnxruntime
+            from skl2onnx import convert_sklearn
+            from skl2onnx.common.data_types import FloatTensorType
+        except ImportError as e:
+            raise ValueError("The onnx backend requires the 'skl2onnx' and 'onnxruntime' packages") from e
+
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        _, final = _final_estimator(model)
+        graph = convert_sklearn(
+            model,
+            initial_types=[("X", FloatTensorType([None, self.n_features_in_]))],
+            options={id(final): {"zipmap": False}}
+        )
+        self.session = onnxruntime.InferenceSession(graph.SerializeToString(), providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        # Outputs are (label, probabilities)
+        self.output_name = self.session.get_outputs()[1].name
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        return self.session.run([self.output_name], {self.input_name: X})[0].astype(float)
+
+def compile_flat(model):
+    """FlatTreeEnsemble or FlatLinearModel for a supported sklearn classifier
+
+    Raises:
+        ValueError: unsupported model or pipeline step
+    """
+    steps, final = _final_estimator(model)
+    affine = _affine_steps(steps)
+    name = type(final).__name__
+    if name in ("RandomForestClassifier", "ExtraTreesClassifier", "DecisionTreeClassifier", "ExtraTreeClassifier"):
+        compiled = FlatTreeEnsemble(final)
+        return FlatScaledModel(compiled, affine) if affine else compiled
+    if name == "LogisticRegression":
+        return FlatLinearModel(final, affine)
+    raise ValueError(f"No flat representation for {name}")
+
+def probe_inputs(compiled, n_features, n_samples, seed=0):
+    """Random rows plus rows that sit exactly on the compiled model's split thresholds"""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_samples, n_features))
+    split_values = getattr(compiled, "split_values", None)
+    if split_values is not None:
+        features, thresholds = split_values()
+        if len(thresholds):
+            # Half the rows take each feature's values from the split points
+            picks = rng.integers(0, len(thresholds), (n_samples // 2, n_features))
+            on_split = X[:n_samples // 2]
+            for column in range(n_features):
+                candidates = thresholds[features == column]
+                if len(candidates):
+                    on_split[:, column] = candidates[picks[:, column] % len(candidates)]
+    return X
+
+def check_parity(model, compiled, n_samples=None, atol=None, seed=None):
+    """Compare compiled and sklearn probabilities on probe inputs
+
+    Returns:
+        Largest absolute difference
+
+    Raises:
+        ValueError: difference above atol
+    """
+    n_samples = n_samples or INFERENCE_CFG["parity_samples"]
+    atol = INFERENCE_CFG["parity_atol"][compiled.backend] if atol is None else atol
+    X = probe_inputs(compiled, model.n_features_in_, n_samples, INFERENCE_CFG["seed"] if seed is None else seed)
+    expected = model.predict_proba(X)
+    actual = compiled.predict_proba(X)
+    if actual.shape != expected.shape:
+        raise ValueError(f"Compiled model returned shape {actual.shape}, expected {expected.shape}")
+    max_diff = float(np.max(np.abs(actual - expected)))
+    if not max_diff <= atol:
+        raise ValueError(f"Compiled model differs from sklearn by {max_diff:.3g} (tolerance {atol:g})")
+    return max_diff
+
+def compile_model(model, backend=None, strict=None):
+    """The predictor to serve for a fitted model under the configured backend
+
+    Returns the compiled model after a parity check, or the model itself for
+    the sklearn backend or when compilation fails and strict is off.
+    """
+    backend = backend or INFERENCE_CFG["backend"]
+    strict = INFERENCE_CFG["strict"] if strict is None else strict
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown physiological model backend '{backend}'. Expected one of {BACKENDS}")
+    if backend == "sklearn":
+        return model
+    try:
+        compiled = compile_flat(model) if backend == "flat" else OnnxModel(model)
+        max_diff = check_parity(model, compiled)
+    except Exception as e:
+        if strict:
+            raise
+        logger.warning(f"Serving the sklearn model, {backend} backend unavailable: {e}", extra={"backend": backend})
+        return model
+    logger.info("Compiled physiological model", extra={"backend": backend, "parity_max_diff": max_diff})
+    return compiled
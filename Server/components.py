@@ -0,0 +1,107 @@
+"""Deferred loading of models and other heavy serving components
+
+Each component is registered with a loader and only loaded on first use (or
+by an explicit warm-up), so the API process can start serving health checks
+before joblib/SHAP imports and model deserialisation have finished.
+"""
+import os
+import threading
+import time
+
+from observability import get_logger
+
+logger = get_logger("components")
+
+# Startup configuration
+STARTUP_CFG = {
+    # "eager": load everything at import and fail fast (default)
+    # "warm":  start immediately and load everything in a background thread
+    # "lazy":  load each component on its first use
+    "mode": os.environ.get("STARTUP_MODE", "eager"),
+}
+
+STARTUP_MODES = ("eager", "warm", "lazy")
+
+class LazyComponent:
+    """A value produced by a loader the first time it is needed"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = "not_loaded"  # not_loaded -> loading -> loaded | failed
+        self.load_time_ms = None
+        self.error = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Load on first call and return the value; re-raises load failures"""
+        if self.state != "loaded":
+            with self._lock:
+                if self.state != "loaded":
+                    self._load()
+        return self._value
+
+    def _load(self):
+        self.state = "loading"
+        start = time.perf_counter()
+        try:
+            self._value = self.loader()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            self.load_time_ms = (time.perf_counter() - start) * 1000
+            logger.error(f"Failed to load {self.name}: {e}", extra={"component": self.name})
+            raise
+        self.load_time_ms = (time.perf_counter() - start) * 1000
+        self.state = "loaded"
+        self.error = None
+        logger.info(f"Loaded {self.name}", extra={"component": self.name, "load_time_ms": round(self.load_time_ms, 1)})
+
+    def status(self):
+        return {
+            "state": self.state,
+            "load_time_ms": None if self.load_time_ms is None else round(self.load_time_ms, 1),
+            "error": self.error
+        }
+
+class ComponentRegistry:
+    """Named lazy components with warm-up and readiness reporting"""
+
+    def __init__(self, mode=None):
+        self.mode = mode or STARTUP_CFG["mode"]
+        if self.mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown startup mode '{self.mode}'. Expected one of {STARTUP_MODES}")
+        self._components = {}
+
+    def register(self, name, loader):
+        self._components[name] = LazyComponent(name, loader)
+
+    def get(self, name):
+        return self._components[name].get()
+
+    def load_all(self):
+        """Load every component now, raising on the first failure"""
+        for component in self._components.values():
+            component.get()
+
+    def warm_up(self, names=None):
+        """Load the given components (default: all), recording failures instead of raising"""
+        for name in names or list(self._components):
+            try:
+                self._components[name].get()
+            except Exception:
+                pass  # Reported through status()
+
+    def warm_up_in_background(self, names=None):
+        thread = threading.Thread(target=self.warm_up, args=(names,), name="component-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        components = {name: component.status() for name, component in self._components.items()}
+        failed = any(c["state"] == "failed" for c in components.values())
+        all_loaded = all(c["state"] == "loaded" for c in components.values())
+        # In lazy mode unloaded components are expected; they load on first use
+        ready = not failed and (all_loaded or self.mode == "lazy")
+        return {"ready": ready, "mode": self.mode, "components": components}
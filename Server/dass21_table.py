@@ -0,0 +1,133 @@
+"""Precomputed DASS-21 prediction and explanation lookup table
+
+Each of the 7 DASS-21 items is answered 0-3, so there are only 4^7 = 16384
+possible integer answer vectors. The table stores the stacking model's
+probabilities (and optionally SHAP attributions) for every one of them,
+indexed by the base-4 encoding of the answers, so serving is an array lookup.
+"""
+import hashlib
+import os
+import numpy as np
+import joblib
+
+from observability import get_logger
+
+logger = get_logger("dass21_table")
+
+N_ITEMS = 7
+N_LEVELS = 4
+N_VECTORS = N_LEVELS ** N_ITEMS
+
+DASS21_MODEL_PATH = "models/stacking_classifier_model.pkl"
+DASS21_SCALER_PATH = "models/scaler.pkl"
+DASS21_TABLE_PATH = "models/dass21_table.npz"
+
+# Place value of each item in the base-4 index (first item most significant)
+_PLACE_VALUES = N_LEVELS ** np.arange(N_ITEMS - 1, -1, -1)
+
+def encode_dass21(values):
+    """Base-4 table index of an answer vector, or None if it is not integer 0-3"""
+    values = np.asarray(values, dtype=float)
+    if values.shape != (N_ITEMS,) or not np.all(values == np.round(values)):
+        return None
+    if np.any(values < 0) or np.any(values >= N_LEVELS):
+        return None
+    return int(values.astype(int) @ _PLACE_VALUES)
+
+def all_answer_vectors():
+    """Every possible answer vector, as a (16384, 7) array in table order"""
+    indices = np.arange(N_VECTORS)[:, None]
+    return ((indices // _PLACE_VALUES) % N_LEVELS).astype(float)
+
+def model_fingerprint(paths=(DASS21_MODEL_PATH, DASS21_SCALER_PATH)):
+    """SHA-256 over the model and scaler files, used to detect stale tables"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+class DASS21Table:
+    """O(1) lookup of DASS-21 probabilities and SHAP values"""
+
+    def __init__(self, probs, shap_table=None, fingerprint=""):
+        self.probs = probs
+        self.shap_table = shap_table
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def load(cls, path=DASS21_TABLE_PATH, model_paths=(DASS21_MODEL_PATH, DASS21_SCALER_PATH)):
+        """Load the table, or return None if it is missing or was built for other models"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            probs = f["probs"]
+            shap_values = f["shap_values"] if "shap_values" in f.files else None
+            fingerprint = str(f["fingerprint"])
+        if probs.shape[0] != N_VECTORS:
+            logger.warning(f"Ignoring DASS-21 table: expected {N_VECTORS} rows, got {probs.shape[0]}",
+                           extra={"path": path})
+            return None
+        if all(os.path.exists(p) for p in model_paths) and fingerprint != model_fingerprint(model_paths):
+            logger.warning("Ignoring stale DASS-21 table: models have changed since it was built",
+                           extra={"path": path})
+            return None
+        return cls(probs, shap_values, fingerprint)
+
+    def predict_proba(self, values):
+        """Class probabilities for an answer vector, or None if it is not in the table"""
+        index = encode_dass21(values)
+        return None if index is None else self.probs[index]
+
+    def shap_values(self, values):
+        """Class-averaged SHAP values for an answer vector, or None if not precomputed"""
+        if self.shap_table is None:
+            return None
+        index = encode_dass21(values)
+        return None if index is None else self.shap_table[index].astype(float)
+
+def build_dass21_table(model, scaler, explainer=None, path=DASS21_TABLE_PATH,
+                       model_paths=(DASS21_MODEL_PATH, DASS21_SCALER_PATH)):
+    """Enumerate every answer vector once and persist the lookup table
+
+    Args:
+        explainer: optional XAIExplainer; when given, the SHAP values from
+            dass21_shap_values are stored alongside the probabilities
+    """
+    X = all_answer_vectors()
+    probs = model.predict_proba(scaler.transform(X))
+    arrays = {"probs": probs, "fingerprint": np.array(model_fingerprint(model_paths))}
+
+    if explainer is not None:
+        shap_values = np.zeros((N_VECTORS, N_ITEMS), dtype=np.float32)
+        for i, x in enumerate(X):
+            shap_values[i] = explainer.dass21_shap_values(x)
+            if (i + 1) % 1024 == 0:
+                logger.info(f"DASS-21 SHAP values: {i + 1}/{N_VECTORS}")
+        arrays["shap_values"] = shap_values
+
+    np.savez(path, **arrays)
+    logger.info(f"Saved DASS-21 lookup table ({N_VECTORS} answer vectors)", extra={"path": path})
+    return DASS21Table(probs, arrays.get("shap_values"), str(arrays["fingerprint"]))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute the DASS-21 lookup table for /predict")
+    parser.add_argument("--with-shap", action="store_true", help="Also precompute SHAP attributions (slow)")
+    args = parser.parse_args()
+
+    dass21_model = joblib.load(DASS21_MODEL_PATH)
+    dass21_scaler = joblib.load(DASS21_SCALER_PATH)
+
+    explainer = None
+    if args.with_shap:
+        from explainers import XAI_CFG, XAIExplainer, load_background
+        if load_background(XAI_CFG["dass21_background_path"]) is None:
+            parser.error(f"--with-shap needs the k-means background at {XAI_CFG['dass21_background_path']}; "
+                         "persist it first with python explainers.py --dass21-data ...")
+        explainer = XAIExplainer()
+        explainer.setup_dass21_explainer(dass21_model, dass21_scaler)
+
+    build_dass21_table(dass21_model, dass21_scaler, explainer)
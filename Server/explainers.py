@@ -0,0 +1,619 @@
+"""Explainable AI components for the stress detection models"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from features import ALL_FEATURE_NAMES
+from observability import get_logger
+
+logger = get_logger("explainers")
+
+DASS21_FEATURE_NAMES = [
+    "DASS21_Q1_breathing_difficulty",
+    "DASS21_Q2_dry_mouth", 
+    "DASS21_Q3_positive_feelings",
+    "DASS21_Q4_breathing_shortness",
+    "DASS21_Q5_action_initiative",
+    "DASS21_Q6_overreact_tendency",
+    "DASS21_Q7_trembling_hands"
+]
+
+# Explainer configuration
+XAI_CFG = {
+    # "tree", "kernel" or "permutation" (see EXPLAINER_KINDS)
+    "physio_explainer": os.environ.get("PHYSIO_EXPLAINER", "tree"),
+    "dass21_explainer": os.environ.get("DASS21_EXPLAINER", "kernel"),
+    "background_k": 50,              # k-means centroids kept from the training data
+    "physio_background_path": "models/physio_background.npz",
+    "dass21_background_path": "models/dass21_background.npz",
+    # Explanation level when a request does not name one (see EXPLAIN_LEVELS)
+    "explain_level": os.environ.get("EXPLAIN_LEVEL", "top_k"),
+    "top_k": 10,
+    # Physiological explanations kept per feature matrix for the top_k level
+    "physio_cache_entries": 128,
+    # Budgets for explaining long recordings: windows sampled by predicted class,
+    # and SHAP time after which no further chunk of windows is started
+    "max_windows": int(os.environ.get("EXPLAIN_MAX_WINDOWS", 256)),
+    "time_budget_sec": float(os.environ.get("EXPLAIN_TIME_BUDGET", 10)),
+    "explain_chunk": 32,
+    # Windows a request may ask individual attributions for
+    "max_window_attributions": 50,
+    "seed": 0,
+}
+
+EXPLAINER_KINDS = ("tree", "kernel", "permutation")
+
+# "none":   predictions only, SHAP is never loaded
+# "fusion": modality contributions of the fusion decision (no SHAP)
+# "top_k":  top-k SHAP features per modality, cached per feature matrix and answer vector
+# "full":   SHAP importance of every feature, recomputed on each call
+EXPLAIN_LEVELS = ("none", "fusion", "top_k", "full")
+
+def explain_level(level=None):
+    """Validated explanation level, defaulting to XAI_CFG["explain_level"]"""
+    level = (level or XAI_CFG["explain_level"]).lower().replace("-", "_")
+    if level not in EXPLAIN_LEVELS:
+        raise ValueError(f"Unknown explain level '{level}'. Expected one of {EXPLAIN_LEVELS}")
+    return level
+
+def summarize_background(X, k=XAI_CFG["background_k"]):
+    """Summarise background data as k-means centroids and their cluster weights"""
+    X = np.asarray(X, dtype=float)
+    if len(X) <= k:
+        return X, np.ones(len(X))
+    import shap
+    summary = shap.kmeans(X, k)
+    return np.asarray(summary.data), np.asarray(summary.weights)
+
+def save_background(X, path, k=XAI_CFG["background_k"]):
+    """Persist a k-means background summary next to the models"""
+    data, weights = summarize_background(X, k)
+    np.savez(path, data=data, weights=weights)
+    logger.info(f"Saved {len(data)}-sample background summary to {path}")
+    return data, weights
+
+def load_background(path):
+    """Load a persisted background summary, or None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return f["data"], f["weights"]
+
+def stratified_order(labels, max_windows, seed=0):
+    """Indices of at most max_windows rows, allocated to each label in proportion
+    
+    Every label present gets at least one row when max_windows allows. Rows are
+    interleaved across labels, so any prefix of the order is stratified too.
+    """
+    labels = np.asarray(labels)
+    n = len(labels)
+    if n <= max_windows:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    classes, counts = np.unique(labels, return_counts=True)
+    # Largest-remainder allocation with a floor of one row per label
+    quota = counts * max_windows / n
+    allocation = np.minimum(np.maximum(np.floor(quota).astype(int), 1), counts)
+    for i in np.argsort(allocation - quota)[:max(0, max_windows - allocation.sum())]:
+        allocation[i] = min(allocation[i] + 1, counts[i])
+    picked, position = [], []
+    for label, n_label in zip(classes, allocation):
+        rows = rng.choice(np.flatnonzero(labels == label), n_label, replace=False)
+        picked.append(rows)
+        position.append(np.arange(n_label) / n_label)
+    picked, position = np.concatenate(picked), np.concatenate(position)
+    return picked[np.argsort(position, kind="stable")][:max_windows]
+
+def stratified_mean(values, labels, explained):
+    """Label-weighted mean of the explained rows' values and its standard error
+    
+    values holds one row per index in explained. Each label's mean is weighted
+    by its share of all rows, with the finite-population correction, so
+    explaining every row gives the plain mean with zero error. Labels with no
+    explained rows are left out and the weights renormalised.
+    """
+    labels = np.asarray(labels)
+    explained_labels = labels[explained]
+    total = np.zeros(values.shape[1])
+    variance = np.zeros(values.shape[1])
+    covered = 0
+    for label in np.unique(explained_labels):
+        rows = values[explained_labels == label]
+        n_label, population = len(rows), int(np.sum(labels == label))
+        total += population * rows.mean(axis=0)
+        if n_label > 1:
+            variance += population ** 2 * (1 - n_label / population) * rows.var(axis=0, ddof=1) / n_label
+        covered += population
+    return total / covered, np.sqrt(variance) / covered
+
+def per_class_shap(shap_values):
+    """Normalise SHAP output to a list of (n_samples, n_features) arrays, one per class"""
+    if isinstance(shap_values, list):
+        return shap_values
+    shap_values = np.asarray(shap_values)
+    if shap_values.ndim == 3:
+        return [shap_values[:, :, c] for c in range(shap_values.shape[2])]
+    return [shap_values]
+
+def weighted_rows(data, weights, n_rows=100):
+    """Background rows repeated about in proportion to their weights, each at least once"""
+    weights = np.asarray(weights, dtype=float)
+    counts = np.maximum(np.round(weights / weights.sum() * n_rows), 1).astype(int)
+    return np.repeat(np.asarray(data, dtype=float), counts, axis=0)
+
+def build_explainer(kind, model, predict_fn, background):
+    """Build a SHAP explainer of the given kind over a (data, weights) background
+    
+    TreeExplainer uses the model's own tree statistics and ignores the background.
+    shap is imported here rather than at module import, as it is slow to load.
+    """
+    import shap
+    if kind == "tree":
+        return shap.TreeExplainer(model)
+    data, weights = background
+    if kind == "kernel":
+        # DenseData keeps the k-means cluster weights in the expectation. It is
+        # private to shap (pinned in requirements.txt), so other releases get
+        # the centroids repeated in proportion to their weights instead.
+        try:
+            from shap.utils._legacy import DenseData
+        except ImportError:
+            return shap.KernelExplainer(predict_fn, weighted_rows(data, weights))
+        group_names = [str(i) for i in range(data.shape[1])]
+        return shap.KernelExplainer(predict_fn, DenseData(data, group_names, None, np.array(weights, dtype=float)))
+    if kind == "permutation":
+        return shap.PermutationExplainer(predict_fn, data)
+    raise ValueError(f"Unknown explainer kind '{kind}'. Expected one of {EXPLAINER_KINDS}")
+
+class XAIExplainer:
+    """Explainable AI component for stress detection models
+    
+    Models are registered with the setup_* methods and their SHAP explainers
+    are only built on first use, over the persisted k-means background
+    summaries when available.
+    """
+    
+    def __init__(self, config=None):
+        self.config = dict(XAI_CFG, **(config or {}))
+        for key in ("physio_explainer", "dass21_explainer"):
+            if self.config[key] not in EXPLAINER_KINDS:
+                raise ValueError(f"Unknown {key} '{self.config[key]}'. Expected one of {EXPLAINER_KINDS}")
+        self.physio_explainer = None
+        self.dass21_explainer = None
+        self.physio_model = None
+        self.dass21_model = None
+        self.dass21_scaler = None
+        self.dass21_table = None
+        self._physio_fallback_background = None
+        self._dass21_fallback_background = None
+        self._lock = threading.Lock()
+        # Sorted physiological feature importance per feature matrix digest
+        self.feature_importance_cache = OrderedDict()
+        # SHAP values per integer DASS-21 answer vector (at most 4^7 entries)
+        self.dass21_shap_cache = {}
+        
+    def setup_physio_explainer(self, model, X_background=None):
+        """Register the physiological model; its explainer is built lazily"""
+        self.physio_model = model
+        self._physio_fallback_background = X_background
+        self.physio_explainer = None
+        self.feature_importance_cache.clear()
+            
+    def setup_dass21_explainer(self, model, scaler, X_background=None, lookup_table=None):
+        """Register the DASS-21 model and scaler; its explainer is built lazily
+        
+        A DASS21Table with precomputed SHAP values answers integer inputs directly.
+        """
+        self.dass21_model = model
+        self.dass21_scaler = scaler
+        self.dass21_table = lookup_table
+        self._dass21_fallback_background = X_background
+        self.dass21_explainer = None
+        self.dass21_shap_cache = {}
+    
+    def _background(self, path, fallback, name):
+        """Persisted background summary, else the first 100 rows of the fallback data"""
+        background = load_background(path)
+        if background is not None:
+            return background
+        if fallback is None:
+            raise ValueError(f"No background data for {name} explainer (expected {path})")
+        logger.warning(f"No persisted background at {path}, using fallback data for {name} explainer")
+        fallback = np.asarray(fallback, dtype=float)[:100]
+        return fallback, np.ones(len(fallback))
+    
+    def _build(self, name, kind, model, predict_fn, path, fallback):
+        """Build an explainer, falling back from Tree to Kernel for non-tree models"""
+        background = None
+        if kind != "tree":
+            background = self._background(path, fallback, name)
+        try:
+            explainer = build_explainer(kind, model, predict_fn, background)
+        except Exception as e:
+            if kind != "tree":
+                raise
+            logger.warning(f"TreeExplainer unavailable for {name} model ({e}), falling back to KernelExplainer")
+            kind = "kernel"
+            explainer = build_explainer(kind, model, predict_fn, self._background(path, fallback, name))
+        logger.info(f"{type(explainer).__name__} initialized for {name} model")
+        return explainer
+    
+    def get_physio_explainer(self):
+        """Physiological SHAP explainer, built on first call"""
+        if self.physio_explainer is None and self.physio_model is not None:
+            with self._lock:
+                if self.physio_explainer is None:
+                    model = self.physio_model
+                    self.physio_explainer = self._build(
+                        "physiological", self.config["physio_explainer"], model, model.predict_proba,
+                        self.config["physio_background_path"], self._physio_fallback_background
+                    )
+        return self.physio_explainer
+    
+    def get_dass21_explainer(self):
+        """DASS-21 SHAP explainer, built on first call"""
+        if self.dass21_explainer is None and self.dass21_model is not None:
+            with self._lock:
+                if self.dass21_explainer is None:
+                    model, scaler = self.dass21_model, self.dass21_scaler
+                    
+                    def model_predict(X):
+                        X_scaled = scaler.transform(X)
+                        return model.predict_proba(X_scaled)
+                    
+                    self.dass21_explainer = self._build(
+                        "DASS-21", self.config["dass21_explainer"], model, model_predict,
+                        self.config["dass21_background_path"], self._dass21_fallback_background
+                    )
+        return self.dass21_explainer
+    
+    def _cached_physio_importance(self, key):
+        with self._lock:
+            feature_importance = self.feature_importance_cache.get(key)
+            if feature_importance is not None:
+                self.feature_importance_cache.move_to_end(key)
+            return feature_importance
+    
+    def _cache_physio_importance(self, key, feature_importance):
+        with self._lock:
+            self.feature_importance_cache[key] = feature_importance
+            while len(self.feature_importance_cache) > self.config["physio_cache_entries"]:
+                self.feature_importance_cache.popitem(last=False)
+    
+    def _physio_shap(self, explainer, X, explained_class, time_budget_sec=None):
+        """SHAP values of one class for the rows of X, in chunks until the time budget runs out
+        
+        The first chunk always runs. Returns (values for the rows explained, whether the budget stopped it).
+        """
+        chunk = self.config["explain_chunk"]
+        values = []
+        start = time.perf_counter()
+        for offset in range(0, len(X), chunk):
+            if values and time_budget_sec is not None and time.perf_counter() - start > time_budget_sec:
+                return np.vstack(values), True
+            shap_values = per_class_shap(explainer.shap_values(X[offset:offset + chunk]))
+            values.append(np.atleast_2d(shap_values[explained_class] if len(shap_values) > 1 else shap_values[0]))
+        return np.vstack(values), False
+    
+    def _ranked_importance(self, values, standard_error=None):
+        """Feature importance entries sorted by absolute importance"""
+        feature_importance = []
+        for i, importance in enumerate(values):
+            if i < len(ALL_FEATURE_NAMES):
+                entry = {
+                    "feature": ALL_FEATURE_NAMES[i],
+                    "importance": float(importance),
+                    "abs_importance": float(abs(importance))
+                }
+                if standard_error is not None:
+                    entry["standard_error"] = float(standard_error[i])
+                feature_importance.append(entry)
+        feature_importance.sort(key=lambda x: x["abs_importance"], reverse=True)
+        return feature_importance
+    
+    def explain_physio_windows(self, X_sample, windows, top_k=10, window_classes=None):
+        """Attributions of individual windows, each for the class predicted for that window"""
+        windows = [int(w) for w in windows]
+        if len(windows) > self.config["max_window_attributions"]:
+            raise ValueError(
+                f"At most {self.config['max_window_attributions']} windows can be explained individually, got {len(windows)}"
+            )
+        if window_classes is None:
+            window_classes = np.argmax(self.physio_model.predict_proba(X_sample[windows]), axis=1)
+        else:
+            window_classes = window_classes[windows]
+        shap_values = per_class_shap(self.get_physio_explainer().shap_values(X_sample[windows]))
+        attributions = []
+        for row, (window, window_class) in enumerate(zip(windows, window_classes)):
+            values = shap_values[window_class] if len(shap_values) > 1 else shap_values[0]
+            attributions.append({
+                "window": window,
+                "explained_class": int(window_class),
+                "feature_importance": self._ranked_importance(values[row])[:top_k]
+            })
+        return attributions
+    
+    def explain_physio_prediction(self, X_sample, top_k=10, use_cache=False, max_windows=None,
+                                  time_budget_sec=None, windows=None):
+        """Generate explanations for physiological predictions
+        
+        top_k=None returns every feature. Long recordings are explained on at
+        most max_windows windows, sampled by per-window predicted class and
+        weighted back to the class mix of the recording, within time_budget_sec
+        of SHAP time. The sample used and the standard error of each mean
+        importance are reported. windows lists window indices to attribute
+        individually. With use_cache, the ranking is reused for an identical
+        feature matrix (e.g. the same recording sent again).
+        """
+        explanations = {
+            "available": False,
+            "method": "SHAP",
+            "feature_importance": [],
+            "summary": ""
+        }
+        
+        if self.physio_model is None:
+            return explanations
+        
+        max_windows = self.config["max_windows"] if max_windows is None else min(max_windows, self.config["max_windows"])
+        time_budget_sec = self.config["time_budget_sec"] if time_budget_sec is None else min(time_budget_sec, self.config["time_budget_sec"])
+        
+        try:
+            probs = self.physio_model.predict_proba(X_sample)
+            window_classes = np.argmax(probs, axis=1)
+            
+            key = None
+            cached = None
+            if use_cache:
+                X_sample = np.ascontiguousarray(X_sample)
+                key = hashlib.sha1(X_sample.tobytes()).hexdigest() + str(X_sample.shape) + str(max_windows)
+                cached = self._cached_physio_importance(key)
+            
+            if cached is not None:
+                feature_importance, sampling = cached
+            else:
+                explainer = self.get_physio_explainer()
+                
+                # Explain the class the model predicts on average, on a class-stratified sample of windows
+                predicted_class = int(np.argmax(probs.mean(axis=0)))
+                order = stratified_order(window_classes, max_windows, self.config["seed"])
+                shap_values_class, stopped = self._physio_shap(explainer, X_sample[order], predicted_class, time_budget_sec)
+                explained = order[:len(shap_values_class)]
+                
+                # Class-weighted mean across windows, with its standard error
+                mean_shap, standard_error = stratified_mean(shap_values_class, window_classes, explained)
+                feature_importance = self._ranked_importance(mean_shap, standard_error)
+                sampling = {
+                    "windows_total": int(len(X_sample)),
+                    "windows_explained": int(len(explained)),
+                    "strategy": "all" if len(explained) == len(X_sample) else "stratified",
+                    "windows_per_class": {
+                        str(c): int(n) for c, n in zip(*np.unique(window_classes[explained], return_counts=True))
+                    },
+                    "stopped_by_time_budget": stopped,
+                    "max_standard_error": float(standard_error.max()) if len(standard_error) else 0.0,
+                    "explainer": type(explainer).__name__
+                }
+                if key is not None:
+                    self._cache_physio_importance(key, (feature_importance, sampling))
+            
+            if key is not None:
+                explanations["cached"] = cached is not None
+            explanations.update({
+                "available": True,
+                "feature_importance": feature_importance[:top_k],
+                "sampling": sampling,
+                "summary": self._generate_physio_summary(feature_importance[:top_k])
+            })
+            if windows:
+                explanations["window_attributions"] = self.explain_physio_windows(
+                    X_sample, windows, top_k or self.config["top_k"], window_classes
+                )
+            
+        except Exception as e:
+            logger.warning(f"Failed to generate physio explanations: {e}")
+            explanations["error"] = str(e)
+            
+        return explanations
+    
+    def dass21_shap_values(self, dass21_values):
+        """Class-averaged SHAP values for one DASS-21 answer vector
+        
+        Integer answer vectors are cached, so each of the 4^7 possible inputs
+        is only explained once per process.
+        """
+        values = np.asarray(dass21_values, dtype=float)
+        if self.dass21_table is not None:
+            precomputed = self.dass21_table.shap_values(values)
+            if precomputed is not None:
+                return precomputed
+        
+        key = tuple(int(v) for v in values) if np.all(values == np.round(values)) else None
+        if key is not None and key in self.dass21_shap_cache:
+            return self.dass21_shap_cache[key]
+        
+        shap_values = per_class_shap(self.get_dass21_explainer().shap_values(values.reshape(1, -1)))
+        # Average across classes
+        mean_shap = np.mean([sv[0] for sv in shap_values], axis=0)
+        
+        if key is not None:
+            self.dass21_shap_cache[key] = mean_shap
+        return mean_shap
+    
+    def explain_dass21_prediction(self, X_sample, top_k=7):
+        """Generate explanations for DASS-21 predictions"""
+        explanations = {
+            "available": False,
+            "method": "SHAP",
+            "feature_importance": [],
+            "summary": ""
+        }
+        
+        if self.dass21_model is None:
+            return explanations
+            
+        try:
+            mean_shap = self.dass21_shap_values(X_sample[0])
+            
+            # Get feature importance
+            feature_importance = []
+            for i, importance in enumerate(mean_shap):
+                if i < len(DASS21_FEATURE_NAMES):
+                    feature_importance.append({
+                        "feature": DASS21_FEATURE_NAMES[i],
+                        "importance": float(importance),
+                        "abs_importance": float(abs(importance)),
+                        "value": float(X_sample[0][i])
+                    })
+            
+            # Sort by absolute importance
+            feature_importance.sort(key=lambda x: x["abs_importance"], reverse=True)
+            
+            explanations.update({
+                "available": True,
+                "feature_importance": feature_importance[:top_k],
+                "summary": self._generate_dass21_summary(feature_importance[:top_k])
+            })
+            
+        except Exception as e:
+            logger.warning(f"Failed to generate DASS-21 explanations: {e}")
+            explanations["error"] = str(e)
+            
+        return explanations
+    
+    def explain_fusion_decision(self, fusion_input, fusion_probs):
+        """Generate explanations for fusion model decisions"""
+        explanations = {
+            "available": True,
+            "method": "Weight Analysis",
+            "modality_contributions": [],
+            "summary": ""
+        }
+        
+        try:
+            # Analyze modality contributions
+            modalities = ["physiological", "questionnaire", "voice"]
+            contributions = []
+            
+            for i, modality in enumerate(modalities):
+                if modality == "physiological":
+                    prob_dist = fusion_input["phys"]
+                elif modality == "questionnaire":
+                    prob_dist = fusion_input["text"]
+                else:  # voice
+                    prob_dist = fusion_input["voice"]
+                
+                # Calculate contribution metrics
+                entropy = -np.sum(prob_dist * np.log(prob_dist + 1e-10))
+                confidence = np.max(prob_dist)
+                predicted_class = np.argmax(prob_dist)
+                
+                contributions.append({
+                    "modality": modality,
+                    "probabilities": prob_dist.tolist(),
+                    "predicted_class": int(predicted_class),
+                    "confidence": float(confidence),
+                    "entropy": float(entropy),
+                    "contribution_score": float(confidence * (1 - entropy/np.log(3)))
+                })
+            
+            # Sort by contribution score
+            contributions.sort(key=lambda x: x["contribution_score"], reverse=True)
+            
+            explanations.update({
+                "modality_contributions": contributions,
+                "summary": self._generate_fusion_summary(contributions, fusion_probs)
+            })
+            
+        except Exception as e:
+            logger.warning(f"Failed to generate fusion explanations: {e}")
+            explanations["error"] = str(e)
+            
+        return explanations
+    
+    def _generate_physio_summary(self, feature_importance):
+        """Generate human-readable summary for physiological explanations"""
+        if not feature_importance:
+            return "No physiological features available for explanation."
+        
+        top_features = feature_importance[:3]
+        summary_parts = []
+        
+        for feat in top_features:
+            feature_name = feat["feature"]
+            importance = feat["importance"]
+            
+            # Parse sensor and feature type
+            sensor = feature_name.split("_")[0]
+            feature_type = "_".join(feature_name.split("_")[1:])
+            
+            direction = "increases" if importance > 0 else "decreases"
+            summary_parts.append(f"{sensor} {feature_type} {direction} stress likelihood")
+        
+        return f"Key factors: {'; '.join(summary_parts[:2])}."
+    
+    def _generate_dass21_summary(self, feature_importance):
+        """Generate human-readable summary for DASS-21 explanations"""
+        if not feature_importance:
+            return "No questionnaire responses available for explanation."
+        
+        top_features = feature_importance[:2]
+        summary_parts = []
+        
+        for feat in top_features:
+            feature_name = feat["feature"].replace("DASS21_", "").replace("_", " ")
+            importance = feat["importance"]
+            value = feat["value"]
+            
+            impact = "increases" if importance > 0 else "decreases"
+            summary_parts.append(f"{feature_name} (score: {value:.1f}) {impact} stress")
+        
+        return f"Main questionnaire factors: {'; '.join(summary_parts)}."
+    
+    def _generate_fusion_summary(self, contributions, fusion_probs):
+        """Generate human-readable summary for fusion explanations"""
+        predicted_class = np.argmax(fusion_probs)
+        confidence = np.max(fusion_probs)
+        class_names = ["Low", "Medium", "High"]
+        
+        # Find most contributing modality
+        top_modality = contributions[0]["modality"]
+        
+        summary = f"Predicted stress level: {class_names[predicted_class]} " \
+                 f"(confidence: {confidence:.2f}). "
+        summary += f"Primary evidence from {top_modality} signals."
+        
+        return summary
+
+def _load_matrix(path, columns):
+    """Load a .npy or .csv matrix, selecting the named columns when present"""
+    if path.endswith(".npy"):
+        X = np.load(path)
+    else:
+        data = pd.read_csv(path)
+        if set(columns).issubset(data.columns):
+            data = data[columns]
+        X = data.select_dtypes(include=[np.number]).values
+    if X.ndim != 2 or X.shape[1] != len(columns):
+        raise ValueError(f"{path}: expected {len(columns)} columns, got shape {X.shape}")
+    return X
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Persist k-means background summaries for the SHAP explainers")
+    parser.add_argument("--physio-data", help="Training feature matrix (.npy or .csv, n_windows x 180)")
+    parser.add_argument("--dass21-data", help="Training DASS-21 responses (.npy or .csv, n x 7)")
+    parser.add_argument("-k", type=int, default=XAI_CFG["background_k"], help="Number of k-means centroids")
+    args = parser.parse_args()
+    
+    if not args.physio_data and not args.dass21_data:
+        parser.error("Provide --physio-data and/or --dass21-data")
+    if args.physio_data:
+        save_background(_load_matrix(args.physio_data, ALL_FEATURE_NAMES), XAI_CFG["physio_background_path"], args.k)
+    if args.dass21_data:
+        save_background(_load_matrix(args.dass21_data, DASS21_FEATURE_NAMES), XAI_CFG["dass21_background_path"], args.k)
@@ -0,0 +1,106 @@
+"""Background explanation jobs for /predict with explain_async
+
+The prediction is returned as soon as it is ready and its SHAP explanations
+are computed afterwards, in the prediction pool, as a job polled through
+/explanations/{job_id}. Jobs live in the memory of the serving process and
+finished ones are dropped after JOBS_CFG["ttl_sec"]. At most
+JOBS_CFG["max_pending"] jobs run at once; past that, submitting raises
+ServerBusyError before a job ID is issued.
+"""
+import asyncio
+import os
+import time
+import uuid
+
+from worker_pool import ServerBusyError
+from observability import get_logger, metrics
+
+logger = get_logger("explanation_jobs")
+
+# Job store configuration
+JOBS_CFG = {
+    # Seconds a finished job stays available
+    "ttl_sec": float(os.environ.get("EXPLANATION_JOB_TTL", 600)),
+    # Finished jobs kept at most; the oldest are dropped first
+    "max_jobs": int(os.environ.get("EXPLANATION_JOB_MAX", 1000)),
+    # Jobs pending at most; more are refused
+    "max_pending": int(os.environ.get("EXPLANATION_JOB_MAX_PENDING", 100)),
+}
+
+class ExplanationJobs:
+    """In-memory store of explanation jobs run as asyncio tasks"""
+
+    def __init__(self, ttl_sec=None, max_jobs=None, max_pending=None):
+        self.ttl_sec = JOBS_CFG["ttl_sec"] if ttl_sec is None else ttl_sec
+        self.max_jobs = JOBS_CFG["max_jobs"] if max_jobs is None else max_jobs
+        self.max_pending = JOBS_CFG["max_pending"] if max_pending is None else max_pending
+        self._jobs = {}  # job_id -> job dict, in submission order
+        self._tasks = {}  # job_id -> running task (keeps it referenced)
+
+    @property
+    def pending(self):
+        return len(self._tasks)
+
+    def check_capacity(self):
+        """Raise ServerBusyError if no more jobs can be submitted"""
+        if self.pending >= self.max_pending:
+            raise ServerBusyError(
+                f"Too many explanation jobs pending ({self.pending}/{self.max_pending}), try again shortly"
+            )
+
+    def submit(self, awaitable, level):
+        """Start a job that awaits the explanations; returns the job ID
+
+        Raises ServerBusyError (and closes awaitable) if max_pending jobs are
+        already running.
+        """
+        try:
+            self.check_capacity()
+        except ServerBusyError:
+            awaitable.close()
+            raise
+        self._evict()
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "status": "pending",
+            "explain": level,
+            "created_at": time.time(),
+            "completed_at": None
+        }
+        self._tasks[job_id] = asyncio.ensure_future(self._run(job_id, awaitable))
+        return job_id
+
+    async def _run(self, job_id, awaitable):
+        job = self._jobs[job_id]
+        try:
+            result = await awaitable
+            job.update({"status": "done", "explanations": result["explanations"]})
+            metrics.observe_stages(result["metadata"].get("stage_timings_ms", {}))
+        except asyncio.CancelledError:
+            # Server shutdown; CancelledError is not an Exception
+            logger.warning("Explanation job cancelled", extra={"job_id": job_id})
+            job.update({"status": "cancelled", "message": "Explanation job was cancelled"})
+            raise
+        except Exception as e:
+            logger.warning(f"Explanation job failed: {e}", extra={"job_id": job_id})
+            job.update({"status": "failed", "message": str(e)})
+        finally:
+            job["completed_at"] = time.time()
+            self._tasks.pop(job_id, None)
+            metrics.inc("explanation_jobs_total", status=job["status"])
+
+    def get(self, job_id):
+        """The job's state (and explanations once done), or None if unknown or expired"""
+        self._evict()
+        job = self._jobs.get(job_id)
+        return None if job is None else dict(job)
+
+    def _evict(self):
+        now = time.time()
+        finished = [job_id for job_id, job in self._jobs.items() if job["completed_at"] is not None]
+        expired = {job_id for job_id in finished if now - self._jobs[job_id]["completed_at"] > self.ttl_sec}
+        remaining = [job_id for job_id in finished if job_id not in expired]
+        expired.update(remaining[:max(0, len(remaining) - self.max_jobs)])
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,148 @@
+"""Persistent feature store for extracted physiological windows
+
+Feature matrices are keyed by a content hash of the uploaded recording plus the
+windowing parameters, so re-submitting the same recording (e.g. with different
+DASS-21 answers) skips feature extraction. Two tiers:
+    - an in-process LRU of recently used matrices
+    - memory-mapped .npy files on disk, evicted least-recently-used once the
+      directory exceeds its byte budget (shared by all worker processes)
+
+The store is off unless FEATURE_STORE_DIR names its directory.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from features import CFG
+from hrv import peak_mode
+from signal_quality import quality_params
+from observability import get_logger
+
+logger = get_logger("feature_store")
+
+# Bump when feature extraction changes so stale entries are never served
+FEATURE_VERSION = 2
+
+# Feature store configuration
+FEATURE_STORE_CFG = {
+    # No default directory: the cache is only written where it is asked for
+    "directory": os.environ.get("FEATURE_STORE_DIR") or None,
+    "enabled": os.environ.get("FEATURE_STORE_ENABLED", "1") != "0",
+    "max_disk_bytes": int(os.environ.get("FEATURE_STORE_MAX_BYTES", 1024 ** 3)),
+    "memory_entries": int(os.environ.get("FEATURE_STORE_MEMORY_ENTRIES", 32)),
+    # Temporary files older than this are left over from a crashed put
+    "stale_tmp_sec": 3600,
+}
+
+def recording_key(content, profile=None):
+    """Cache key for an uploaded recording under the current window parameters
+
+    Args:
+        profile: optional SignalProfile the recording is read with
+    """
+    params = {
+        "version": FEATURE_VERSION,
+        "fs": CFG["fs"],
+        "window_sec": CFG["window_sec"],
+        "stride_sec": CFG["stride_sec"],
+        "sensors": CFG["sensors"],
+        "ecg_peaks": peak_mode(),
+        "signal_quality": quality_params(profile),
+    }
+    if profile is not None:
+        params["source_fs"] = profile.source_fs
+        params["stride_sec"] = profile.stride_sec
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    digest.update(memoryview(content))
+    return digest.hexdigest()
+
+class FeatureStore:
+    """Two-tier LRU cache of feature matrices"""
+
+    def __init__(self, directory=None, max_disk_bytes=None, memory_entries=None, enabled=None):
+        self.directory = directory or FEATURE_STORE_CFG["directory"]
+        self.max_disk_bytes = FEATURE_STORE_CFG["max_disk_bytes"] if max_disk_bytes is None else max_disk_bytes
+        self.memory_entries = FEATURE_STORE_CFG["memory_entries"] if memory_entries is None else memory_entries
+        self.enabled = (FEATURE_STORE_CFG["enabled"] if enabled is None else enabled) and self.directory is not None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _remember(self, key, X):
+        with self._lock:
+            self._memory[key] = X
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Cached feature matrix for key, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            X = np.load(path, mmap_mode="r")
+            os.utime(path)  # Mark as recently used for disk eviction
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        self._remember(key, X)
+        return X
+
+    def put(self, key, X):
+        """Store a feature matrix in both tiers and enforce the disk budget"""
+        if not self.enabled:
+            return
+        self._remember(key, X)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first so readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(X))
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Failed to persist features to {self.directory}: {e}")
+
+    def _evict(self):
+        """Delete least recently used files until the directory fits the budget
+
+        Temporary files a crashed put left behind are deleted too.
+        """
+        entries = []
+        stale_before = time.time() - FEATURE_STORE_CFG["stale_tmp_sec"]
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                try:
+                    if entry.stat().st_mtime < stale_before:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass  # Renamed or removed by another worker
+            elif entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # Evicted by another worker
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,250 @@
+"""Signal configuration and per-window feature extraction for physiological data"""
+import numpy as np
+from scipy import signal
+from scipy.stats import skew, kurtosis
+import pywt
+
+from observability import get_logger
+
+logger = get_logger("features")
+
+# Configuration
+CFG = {
+    "orig_fs": 700,
+    "fs": 100,
+    "window_sec": 10,
+    "stride_sec": 5,
+    "sensors": ["ECG", "EDA", "EMG", "Temp"],
+}
+
+DOWN_F = CFG["orig_fs"] // CFG["fs"]
+STEP = CFG["window_sec"] * CFG["fs"]
+STRIDE = CFG["stride_sec"] * CFG["fs"]
+
+# Feature names for interpretability
+FEATURE_NAMES = {
+    "ECG": [
+        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
+        "q25", "q75", "mean_abs_diff", "rms",
+        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
+        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
+        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
+        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
+        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
+        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max",
+        "mean_rr", "std_rr", "rmssd", "heart_rate"
+    ],
+    "EDA": [
+        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
+        "q25", "q75", "mean_abs_diff", "rms",
+        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
+        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
+        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
+        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
+        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
+        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
+    ],
+    "EMG": [
+        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
+        "q25", "q75", "mean_abs_diff", "rms",
+        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
+        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
+        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
+        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
+        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
+        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
+    ],
+    "Temp": [
+        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
+        "q25", "q75", "mean_abs_diff", "rms",
+        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
+        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
+        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
+        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
+        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
+        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
+    ]
+}
+
+# Create flat feature names list
+ALL_FEATURE_NAMES = []
+for sensor in CFG["sensors"]:
+    for feature in FEATURE_NAMES[sensor]:
+        ALL_FEATURE_NAMES.append(f"{sensor}_{feature}")
+
+# Frequency bands (Hz) for band power features
+FREQ_BANDS = {
+    'very_low': (0.0, 0.04), 
+    'low': (0.04, 0.15), 
+    'mid': (0.15, 0.4), 
+    'high': (0.4, 0.5)
+}
+
+# === Feature Extraction Functions ===
+def zscore(x):
+    """Z-score normalization with numerical stability"""
+    x = np.asarray(x)
+    std = x.std()
+    if std == 0:
+        return np.zeros_like(x)
+    return (x - x.mean()) / std
+
+def extract_time_features(signal_data):
+    """Extract time-domain features from signal"""
+    signal_data = np.asarray(signal_data).astype(float)
+    
+    # Handle edge cases
+    if len(signal_data) == 0:
+        return [0.0] * 13
+    
+    # Basic statistics
+    mean_val = np.mean(signal_data)
+    std_val = np.std(signal_data)
+    var_val = np.var(signal_data)
+    
+    # Handle constant signals
+    if std_val == 0:
+        skew_val = kurtosis_val = 0.0
+    else:
+        skew_val = skew(signal_data)
+        kurtosis_val = kurtosis(signal_data)
+    
+    return [
+        mean_val, std_val, var_val, skew_val, kurtosis_val,
+        np.min(signal_data), np.max(signal_data), np.ptp(signal_data),
+        np.median(signal_data), np.percentile(signal_data, 25),
+        np.percentile(signal_data, 75),
+        np.mean(np.abs(np.diff(signal_data))) if len(signal_data) > 1 else 0.0,
+        np.sqrt(np.mean(signal_data**2))
+    ]
+
+def extract_freq_features(signal_data, fs=100):
+    """Extract frequency-domain features using Welch's method"""
+    signal_data = np.asarray(signal_data).astype(float)
+    
+    if len(signal_data) < 8:
+        return [0.0] * 11
+    
+    try:
+        freqs, psd = signal.welch(signal_data, fs=fs, nperseg=min(256, len(signal_data)//4))
+        total_power = np.sum(psd)
+        if total_power == 0:
+            return [0.0] * 11
+        
+        features = []
+        for low, high in FREQ_BANDS.values():
+            mask = (freqs >= low) & (freqs <= high)
+            band_power = np.sum(psd[mask])
+            features.append(band_power)
+            features.append(band_power / total_power)  # Relative power
+        
+        # Additional frequency features
+        features.extend([
+            np.mean(freqs), 
+            np.std(freqs), 
+            freqs[np.argmax(psd)]  # Peak frequency
+        ])
+        
+        return features
+        
+    except Exception as e:
+        logger.warning(f"Frequency feature extraction failed: {e}")
+        return [0.0] * 11
+
+def extract_wavelet_features(signal_data):
+    """Extract wavelet-based features"""
+    signal_data = np.asarray(signal_data).astype(float)
+    
+    try:
+        coeffs = pywt.wavedec(signal_data, 'db4', level=4)
+        features = []
+        
+        for coeff in coeffs:
+            if len(coeff) > 0:
+                features.extend([
+                    np.mean(coeff),
+                    np.std(coeff),
+                    np.var(coeff),
+                    np.max(np.abs(coeff))
+                ])
+        
+        # Pad or truncate to consistent length
+        target_length = 20  # 5 levels * 4 features
+        if len(features) < target_length:
+            features.extend([0.0] * (target_length - len(features)))
+        else:
+            features = features[:target_length]
+            
+        return features
+        
+    except Exception as e:
+        logger.warning(f"Wavelet feature extraction failed: {e}")
+        return [0.0] * 20
+
+def hrv_features(peaks, n_samples, fs=100):
+    """Heart rate variability features from the R-peak indices of a window"""
+    if len(peaks) > 1:
+        # Calculate RR intervals in milliseconds
+        rr_intervals = np.diff(peaks) / fs * 1000
+        
+        # HRV features
+        mean_rr = np.mean(rr_intervals)
+        std_rr = np.std(rr_intervals)
+        rmssd = np.sqrt(np.mean(np.diff(rr_intervals)**2))
+        heart_rate = len(peaks) / (n_samples / fs) * 60
+        
+        return [mean_rr, std_rr, rmssd, heart_rate]
+    return [0.0] * 4
+
+def extract_ecg_features(signal_data, fs=100):
+    """Extract ECG-specific features (heart rate variability)"""
+    signal_data = np.asarray(signal_data).astype(float)
+    
+    try:
+        # Find R-peaks
+        peaks, _ = signal.find_peaks(
+            signal_data, 
+            height=np.std(signal_data), 
+            distance=fs//3  # Minimum 200ms between peaks
+        )
+        
+        return hrv_features(peaks, len(signal_data), fs=fs)
+            
+    except Exception as e:
+        logger.warning(f"ECG feature extraction failed: {e}")
+        return [0.0] * 4
+
+def extract_window_features(sigs, ecg_features=None):
+    """Extract all features for a window of signals
+
+    Args:
+        ecg_features: optional HRV features of the window from a recording's
+            R-peak index (hrv.PeakIndex), used instead of detecting its peaks
+    """
+    features = []
+    
+    for sensor in CFG["sensors"]:
+        if sensor in sigs:
+            data = sigs[sensor]
+            
+            # Time-domain features
+            features.extend(extract_time_features(data))
+            
+            # Frequency-domain features
+            features.extend(extract_freq_features(data))
+            
+            # Wavelet features
+            features.extend(extract_wavelet_features(data))
+            
+            # ECG-specific features
+            if sensor == "ECG":
+                features.extend(extract_ecg_features(data) if ecg_features is None else ecg_features)
+        else:
+            # If sensor data is missing, pad with zeros
+            features.extend([0.0] * 13)  # Time features
+            features.extend([0.0] * 11)  # Frequency features
+            features.extend([0.0] * 20)  # Wavelet features
+            if sensor == "ECG":
+                features.extend([0.0] * 4)  # ECG features
+    
+    return np.array(features)
@@ -0,0 +1,173 @@
+"""R-peak index and heart rate variability features over whole ECG recordings
+
+R-peaks are detected once per recording, in one find_peaks pass over the
+z-scored ECG, and kept as a sorted array of sample indices. The HRV features of
+each window are then computed from the peaks that fall inside it, located by
+binary search. Overlapping windows share the detection, and beats at window
+edges are found because their neighbouring samples are available. Live streams
+grow the same index chunk by chunk with StreamingPeakDetector.
+
+Recording-level detection is opt-in with ECG_PEAK_MODE=recording. The default,
+"window", detects peaks inside each z-scored window, the way the physiological
+model's training features were computed. Recording mode changes the mean_rr,
+std_rr, rmssd and heart_rate inputs, so keep the default until the model is
+retrained or validated on recording-mode features.
+"""
+import os
+import numpy as np
+from scipy import signal
+
+from features import CFG, STEP, zscore, hrv_features
+from observability import get_logger
+
+logger = get_logger("features")
+
+PEAK_MODES = ("recording", "window")
+
+# HRV configuration
+HRV_CFG = {
+    # "recording": detect R-peaks once per recording; "window": once per window
+    "peak_mode": os.environ.get("ECG_PEAK_MODE", "window"),
+}
+
+def peak_mode():
+    """Validated R-peak detection mode from HRV_CFG"""
+    mode = HRV_CFG["peak_mode"].lower()
+    if mode not in PEAK_MODES:
+        raise ValueError(f"Unknown ECG peak mode '{mode}'. Expected one of {PEAK_MODES}")
+    return mode
+
+def peak_distance(fs):
+    """Minimum samples between R-peaks (about 330 ms)"""
+    return max(1, fs // 3)
+
+def detect_r_peaks(ecg, fs=CFG["fs"]):
+    """Sorted R-peak sample indices of a whole ECG recording
+
+    Peaks must rise one standard deviation above the mean of the recording,
+    which is the per-window threshold applied to the recording's z-score.
+    """
+    z = zscore(np.asarray(ecg, dtype=float))
+    if not z.any():
+        return np.empty(0, dtype=np.int64)
+    peaks, _ = signal.find_peaks(z, height=1.0, distance=peak_distance(fs))
+    return peaks.astype(np.int64)
+
+class PeakIndex:
+    """Sorted R-peak sample indices of a recording, queried by window"""
+
+    def __init__(self, peaks=None, fs=CFG["fs"]):
+        self.fs = fs
+        self.peaks = np.empty(0, dtype=np.int64) if peaks is None else np.asarray(peaks, dtype=np.int64)
+
+    @classmethod
+    def from_ecg(cls, ecg, fs=CFG["fs"]):
+        return cls(detect_r_peaks(ecg, fs), fs)
+
+    def __len__(self):
+        return len(self.peaks)
+
+    def extend(self, peaks):
+        """Append peaks that all follow the last indexed one"""
+        peaks = np.asarray(peaks, dtype=np.int64)
+        if len(peaks) and len(self.peaks) and peaks[0] <= self.peaks[-1]:
+            raise ValueError("Appended R-peaks must follow the indexed ones")
+        self.peaks = np.concatenate((self.peaks, peaks))
+
+    def discard_before(self, sample):
+        """Drop peaks before a sample index, bounding the index of a long stream"""
+        self.peaks = self.peaks[np.searchsorted(self.peaks, sample):]
+
+    def bounds(self, starts, window_size=STEP):
+        """(lo, hi) positions in peaks of the peaks inside each window"""
+        starts = np.asarray(starts, dtype=np.int64)
+        return (np.searchsorted(self.peaks, starts, side="left"),
+                np.searchsorted(self.peaks, starts + window_size, side="left"))
+
+    def window_peaks(self, start, window_size=STEP):
+        """Peaks of one window, relative to its first sample"""
+        lo, hi = self.bounds([start], window_size)
+        return self.peaks[lo[0]:hi[0]] - start
+
+    def window_features(self, starts, window_size=STEP):
+        """HRV features of windows starting at the given samples, shape (n_windows, 4)"""
+        lo, hi = self.bounds(starts, window_size)
+        features = np.zeros((len(lo), 4))
+        for i in np.flatnonzero(hi - lo > 1):
+            features[i] = hrv_features(self.peaks[lo[i]:hi[i]], window_size, fs=self.fs)
+        return features
+
+class StreamingPeakDetector:
+    """PeakIndex grown chunk by chunk from a live ECG stream
+
+    The threshold uses the running mean and standard deviation of the stream
+    so far. find_peaks keeps the highest of any candidates closer than
+    peak_distance, so a run of such candidates that could still be joined by
+    samples yet to arrive is held as pending and re-detected with the next
+    chunk. peaks() includes the pending ones, letting a window that ends at
+    the newest sample use its edge beats. With a fixed threshold the final
+    peaks match detect_r_peaks on the whole stream for any chunking, as long
+    as no run of competing candidates is longer than a window.
+    """
+
+    def __init__(self, fs=CFG["fs"]):
+        self.fs = fs
+        self.distance = peak_distance(fs)
+        self.max_pending = STEP
+        self.index = PeakIndex(fs=fs)
+        self.pending = np.empty(0, dtype=np.int64)
+        self.tail = np.empty(0)  # samples from tail_start, kept for re-detection
+        self.tail_start = 0
+        self.committed_until = 0  # peaks before this sample are final
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _update_stats(self, x):
+        n, mean = len(x), x.mean()
+        delta = mean - self.mean
+        total = self.count + n
+        self.m2 += ((x - mean) ** 2).sum() + delta ** 2 * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+
+    def push(self, ecg):
+        """Add new ECG samples and update the peak index"""
+        ecg = np.asarray(ecg, dtype=float)
+        if not len(ecg):
+            return
+        self._update_stats(ecg)
+        self.tail = np.concatenate((self.tail, ecg))
+        end = self.tail_start + len(self.tail)
+
+        final = end - self.distance
+        peaks = np.empty(0, dtype=np.int64)
+        std = np.sqrt(self.m2 / self.count)
+        if std > 0:
+            height = self.mean + std
+            candidates = signal.find_peaks(self.tail, height=height)[0] + self.tail_start
+            # The next sample can complete a candidate at end - 1, which
+            # competes with the run of candidates closer than distance to it
+            if len(candidates) and candidates[-1] > end - 1 - self.distance:
+                breaks = np.flatnonzero(np.diff(candidates) >= self.distance)
+                final = candidates[breaks[-1] + 1] if len(breaks) else candidates[0]
+            peaks = signal.find_peaks(self.tail, height=height, distance=self.distance)[0] + self.tail_start
+        # Bound the tail on noise, where candidates may never stop competing
+        final = max(self.committed_until, final, end - self.max_pending)
+        self.index.extend(peaks[(peaks >= self.committed_until) & (peaks < final)])
+        self.pending = peaks[peaks >= final]
+        self.committed_until = final
+
+        # Candidates before the final run stay in reach of it for distance samples
+        drop = self.committed_until - self.distance - self.tail_start
+        if drop > 0:
+            self.tail = self.tail[drop:]
+            self.tail_start += drop
+
+    def peaks(self):
+        """Final and pending peaks, as a PeakIndex"""
+        return PeakIndex(np.concatenate((self.index.peaks, self.pending)), self.fs)
+
+    def discard_before(self, sample):
+        """Drop final peaks before a sample index"""
+        self.index.discard_before(sample)
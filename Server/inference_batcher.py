@@ -0,0 +1,149 @@
+"""Cross-request micro-batching of model inference
+
+Concurrent /predict requests each score a small matrix (the windows of one
+recording, or one DASS-21 answer vector), and sklearn pays a fixed overhead
+per predict_proba call. A MicroBatcher queues these calls in the serving
+process, runs one predict_proba over the stacked rows of everything queued,
+and hands each request its own slice of the result.
+
+A batch waits up to max_wait_ms for more requests, but only while other
+requests are still being prepared and could join it (counted by an InFlight
+around their preparation). A request arriving at an idle server is therefore
+scored at once, and at low load latency is the same as without batching.
+
+The serving process needs its own copy of the batched models, in addition
+to the prediction workers' copies, unless it shares them with the workers
+(SHARED_MODELS=1) or the workers are threads (PREDICT_WORKERS=0).
+"""
+import asyncio
+import os
+import time
+import numpy as np
+
+from observability import get_logger, metrics
+
+logger = get_logger("inference_batcher")
+
+# Micro-batching configuration
+INFERENCE_BATCH_CFG = {
+    # Set to 0 to run every request's inference in its own worker task
+    "enabled": os.environ.get("INFERENCE_BATCHING", "1") != "0",
+    # Longest a batch waits for more requests after its first one arrives
+    "max_wait_ms": float(os.environ.get("INFERENCE_BATCH_WAIT_MS", 5)),
+    # Rows (windows) stacked into one model call at most
+    "max_rows": int(os.environ.get("INFERENCE_BATCH_MAX_ROWS", 8192)),
+}
+
+class InFlight:
+    """Number of requests inside a `with` block, e.g. those preparing inputs that may join a batch"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        self.count += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.count -= 1
+
+    def __call__(self):
+        return self.count
+
+class MicroBatcher:
+    """Coalesces concurrent predict_proba calls on one model into stacked calls
+
+    Args:
+        name: model label of the batcher's metrics
+        predict_proba: function from a stacked (n_rows, n_features) matrix to
+            (n_rows, n_classes) probabilities; runs in a thread so the event
+            loop keeps accepting requests
+        in_flight: optional callable giving the number of requests that may
+            still join a batch; batches are only held back while it is positive
+    """
+
+    def __init__(self, name, predict_proba, in_flight=None, max_wait_ms=None, max_rows=None):
+        self.name = name
+        self.predict_proba_fn = predict_proba
+        self.in_flight = in_flight or (lambda: 0)
+        self.max_wait_ms = INFERENCE_BATCH_CFG["max_wait_ms"] if max_wait_ms is None else max_wait_ms
+        self.max_rows = INFERENCE_BATCH_CFG["max_rows"] if max_rows is None else max_rows
+        self._queue = []  # (rows, future, arrival time)
+        self._arrived = None
+        self._dispatcher = None
+
+    async def predict_proba(self, X):
+        """Probabilities for the rows of X, computed in a batch with other requests"""
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError(f"Expected a 2-D matrix, got shape {X.shape}")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((X, future, time.perf_counter()))
+        metrics.set("inference_queue_depth", len(self._queue), model=self.name)
+        if self._dispatcher is None or self._dispatcher.done():
+            # A fresh event per dispatcher, on the loop serving this request
+            self._arrived = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        self._arrived.set()
+        return await future
+
+    async def _gather(self):
+        """Wait until the queue fills max_rows, the oldest request's wait runs out, or nobody can join"""
+        deadline = self._queue[0][2] + self.max_wait_ms / 1000
+        while sum(len(X) for X, _, _ in self._queue) < self.max_rows and self.in_flight() > 0:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+
+    def _take(self):
+        """Pop queued requests up to max_rows (always at least one)"""
+        rows, count = 0, 0
+        for X, _, _ in self._queue:
+            if count and rows + len(X) > self.max_rows:
+                break
+            rows += len(X)
+            count += 1
+        batch, self._queue = self._queue[:count], self._queue[count:]
+        metrics.set("inference_queue_depth", len(self._queue), model=self.name)
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            await self._gather()
+            batch = self._take()
+            sizes = [len(X) for X, _, _ in batch]
+            metrics.observe("inference_batch_requests", len(batch), model=self.name)
+            metrics.observe("inference_batch_rows", sum(sizes), model=self.name)
+            try:
+                stacked = batch[0][0] if len(batch) == 1 else np.vstack([X for X, _, _ in batch])
+                probs = await loop.run_in_executor(None, self.predict_proba_fn, stacked)
+            except Exception as e:
+                if len(batch) == 1:
+                    _resolve(batch[0][1], error=e)
+                    continue
+                # Score the requests one by one so that only the failing one errors
+                logger.warning(f"Batched {self.name} inference failed, retrying unbatched: {e}",
+                               extra={"requests": len(batch)})
+                for X, future, _ in batch:
+                    try:
+                        _resolve(future, await loop.run_in_executor(None, self.predict_proba_fn, X))
+                    except Exception as request_error:
+                        _resolve(future, error=request_error)
+                continue
+            for (_, future, _), part in zip(batch, np.split(probs, np.cumsum(sizes)[:-1])):
+                _resolve(future, part)
+
+def _resolve(future, result=None, error=None):
+    """Complete a request's future unless it was cancelled meanwhile"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
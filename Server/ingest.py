@@ -0,0 +1,211 @@
+"""Columnar ingestion of uploaded physiological recordings
+
+Only the CFG["sensors"] columns are read, straight from the uploaded bytes
+into NumPy arrays. Besides CSV, binary formats are accepted through the same
+endpoint: .npy (2-D in sensor order, or a structured array with sensor
+fields), .npz (one array per sensor), Parquet and Arrow IPC. pyarrow is an
+optional dependency, needed for Parquet/Arrow and used to speed up CSV.
+
+read_chunks reads a recording on disk a chunk of rows at a time, for the
+offline batch scorer and for large uploads spooled to disk.
+"""
+import csv
+import io
+import pickle
+import numpy as np
+import pandas as pd
+
+from features import CFG
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+SUPPORTED_EXTENSIONS = (".csv", ".npy", ".npz", ".parquet", ".arrow", ".feather", ".ipc")
+
+def file_format(filename):
+    """Upload format from the file extension, or raise ValueError"""
+    name = (filename or "").lower()
+    for ext in SUPPORTED_EXTENSIONS:
+        if name.endswith(ext):
+            return ext.lstrip(".")
+    raise ValueError(f"Physiological file must be one of {', '.join(SUPPORTED_EXTENSIONS)}, got '{filename}'")
+
+def _require_pyarrow(fmt):
+    if pa is None:
+        raise ValueError(f"{fmt} uploads require the 'pyarrow' package")
+
+def _csv_header(content):
+    """Column names from the first line of a CSV payload"""
+    end = content.find(b"\n")
+    first_line = bytes(content[:end if end >= 0 else len(content)]).decode("utf-8-sig").strip()
+    return next(csv.reader([first_line]), [])
+
+def _read_csv(content, sensors, dtype):
+    header = _csv_header(content)
+    usecols = [sensor for sensor in sensors if sensor in header]
+    if not usecols:
+        return {}
+    buffer = io.BytesIO(content)  # Shares the payload, no decoded text copy
+    engine = "pyarrow" if pa is not None else "c"
+    data = pd.read_csv(buffer, usecols=usecols, dtype={col: dtype for col in usecols}, engine=engine)
+    return {col: data[col].to_numpy(dtype=dtype, copy=False) for col in usecols}
+
+def _columns_from_array(array, sensors):
+    """Sensor columns from a structured array or a 2-D (n_samples, n_sensors) array"""
+    if array.dtype.names:
+        return {sensor: array[sensor] for sensor in sensors if sensor in array.dtype.names}
+    if array.ndim == 2 and array.shape[1] == len(sensors):
+        return {sensor: array[:, i] for i, sensor in enumerate(sensors)}
+    raise ValueError(
+        f"Array uploads must be structured with {sensors} fields or have shape (n_samples, {len(sensors)}), "
+        f"got shape {array.shape}"
+    )
+
+def _read_npy(content, sensors):
+    """Map an .npy payload without copying it"""
+    buffer = io.BytesIO(content)
+    version = np.lib.format.read_magic(buffer)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buffer)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buffer)
+    if dtype.hasobject:
+        raise ValueError("Object arrays are not supported")
+    count = int(np.prod(shape))
+    array = np.frombuffer(content, dtype=dtype, count=count, offset=buffer.tell())
+    array = array.reshape(shape, order="F" if fortran_order else "C")
+    return _columns_from_array(array, sensors)
+
+def _read_npz(content, sensors):
+    with np.load(io.BytesIO(content), allow_pickle=False) as archive:
+        if any(sensor in archive.files for sensor in sensors):
+            return {sensor: archive[sensor] for sensor in sensors if sensor in archive.files}
+        if len(archive.files) == 1:
+            return _columns_from_array(archive[archive.files[0]], sensors)
+    raise ValueError(f".npz uploads must contain arrays named {sensors} or a single array")
+
+def _columns_from_table(table, sensors):
+    present = [sensor for sensor in sensors if sensor in table.column_names]
+    # Zero-copy when a column is a single chunk without nulls
+    return {sensor: table.column(sensor).to_numpy() for sensor in present}
+
+def _read_parquet(content, sensors):
+    _require_pyarrow("Parquet")
+    import pyarrow.parquet as pq
+    source = pa.BufferReader(content)
+    schema_names = pq.read_schema(source).names
+    present = [sensor for sensor in sensors if sensor in schema_names]
+    table = pq.read_table(pa.BufferReader(content), columns=present)
+    return _columns_from_table(table, present)
+
+def _read_arrow(content, sensors):
+    _require_pyarrow("Arrow IPC")
+    source = pa.py_buffer(content)
+    try:
+        table = pa.ipc.open_file(source).read_all()
+    except pa.ArrowInvalid:
+        table = pa.ipc.open_stream(source).read_all()
+    return _columns_from_table(table, sensors)
+
+def load_sensor_columns(content, filename, dtype=np.float64, sensors=None):
+    """Read the sensor columns of an uploaded recording
+
+    Args:
+        content: raw upload bytes (or any buffer-protocol object)
+        filename: used to pick the format from its extension
+        dtype: np.float64 (default) or np.float32
+
+    Returns:
+        (columns, n_samples): dict of sensor -> 1-D array for the sensors
+        present in the file, and the recording length
+    """
+    sensors = list(sensors or CFG["sensors"])
+    fmt = file_format(filename)
+    if fmt == "csv":
+        columns = _read_csv(content, sensors, dtype)
+    elif fmt == "npy":
+        columns = _read_npy(content, sensors)
+    elif fmt == "npz":
+        columns = _read_npz(content, sensors)
+    elif fmt == "parquet":
+        columns = _read_parquet(content, sensors)
+    else:
+        columns = _read_arrow(content, sensors)
+
+    if not columns:
+        raise ValueError(f"No sensor columns found, expected any of {sensors}")
+    columns = {sensor: np.asarray(col).astype(dtype, copy=False).reshape(-1) for sensor, col in columns.items()}
+    lengths = {len(col) for col in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Sensor columns have different lengths: {sorted(lengths)}")
+    n_samples = lengths.pop() if lengths else 0
+    return columns, n_samples
+
+# === Chunked reading of recordings on disk ===
+
+def _slices(n, chunk_rows):
+    return ((start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows))
+
+def _read_csv_chunks(path, sensors, chunk_rows):
+    columns = [c for c in pd.read_csv(path, nrows=0).columns if c in sensors]
+    if not columns:
+        return
+    for chunk in pd.read_csv(path, usecols=columns, dtype=float, chunksize=chunk_rows):
+        yield {sensor: chunk[sensor].to_numpy() for sensor in columns}
+
+def _read_npy_chunks(path, sensors, chunk_rows):
+    array = np.load(path, mmap_mode="r")
+    if array.dtype.names:
+        columns = [sensor for sensor in sensors if sensor in array.dtype.names]
+        for start, stop in _slices(len(array), chunk_rows):
+            yield {sensor: np.asarray(array[sensor][start:stop], dtype=float) for sensor in columns}
+    else:
+        if array.ndim != 2 or array.shape[1] != len(sensors):
+            raise ValueError(f"Expected a 2-D array with {len(sensors)} columns, got shape {array.shape}")
+        for start, stop in _slices(len(array), chunk_rows):
+            block = np.asarray(array[start:stop], dtype=float)
+            yield {sensor: block[:, i] for i, sensor in enumerate(sensors)}
+
+def _read_parquet_chunks(path, sensors, chunk_rows):
+    _require_pyarrow("Parquet")
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path)
+    columns = [sensor for sensor in sensors if sensor in parquet.schema_arrow.names]
+    if not columns:
+        return
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield {sensor: batch.column(sensor).to_numpy(zero_copy_only=False).astype(float) for sensor in columns}
+
+def _read_wesad_chunks(path, sensors, chunk_rows):
+    # Pickles can only be loaded whole; only the chest sensors are kept
+    with open(path, "rb") as f:
+        data = pickle.load(f, encoding="latin1")
+    chest = data["signal"]["chest"]
+    columns = {sensor: np.asarray(chest[sensor], dtype=float).ravel() for sensor in sensors if sensor in chest}
+    del data, chest
+    n = min((len(col) for col in columns.values()), default=0)
+    for start, stop in _slices(n, chunk_rows):
+        yield {sensor: col[start:stop] for sensor, col in columns.items()}
+
+def _read_whole_chunks(path, sensors, chunk_rows):
+    # .npz and Arrow IPC go through the upload reader, which loads the file at once
+    with open(path, "rb") as f:
+        columns, n = load_sensor_columns(f.read(), path, sensors=sensors)
+    for start, stop in _slices(n, chunk_rows):
+        yield {sensor: col[start:stop] for sensor, col in columns.items()}
+
+def read_chunks(path, chunk_rows, sensors=None):
+    """Sensor columns of a recording, chunk_rows rows at a time"""
+    sensors = list(sensors or CFG["sensors"])
+    name = path.lower()
+    if name.endswith(".pkl"):
+        return _read_wesad_chunks(path, sensors, chunk_rows)
+    if name.endswith(".csv"):
+        return _read_csv_chunks(path, sensors, chunk_rows)
+    if name.endswith(".npy"):
+        return _read_npy_chunks(path, sensors, chunk_rows)
+    if name.endswith(".parquet"):
+        return _read_parquet_chunks(path, sensors, chunk_rows)
+    return _read_whole_chunks(path, sensors, chunk_rows)
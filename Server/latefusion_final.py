@@ -55,28 +55,54 @@ class PhysioDominantFusion(BaseEstimator, ClassifierMixin):
         fused = sum(weighted)
         return fused / fused.sum()  # Normalize
 
+    def predict_proba_batch(self, phys=None, text=None, voice=None, present=None):
+        """Vectorized fusion over N samples
+        
+        Each modality is an (N, 3) array (or None if absent for every row).
+        present is an optional (N, 3) boolean mask of which modalities
+        [phys, text, voice] each row has; by default a modality counts as
+        present when any of its probabilities is non-zero. Rows without any
+        modality get the neutral [0.33, 0.33, 0.33].
+        """
+        blocks = [phys, text, voice]
+        n = next((len(b) for b in blocks if b is not None), 0)
+        
+        arrays = []
+        for mod, block in zip(['phys', 'text', 'voice'], blocks):
+            if block is None:
+                block = np.zeros((n, 3))
+            block = np.asarray(block)
+            if block.shape != (n, 3):
+                raise ValueError(f"{mod} probabilities must have shape ({n}, 3), got {block.shape}")
+            arrays.append(block)
+        
+        if present is None:
+            present = np.column_stack([np.any(block != 0, axis=1) for block in arrays])
+        present = np.asarray(present, dtype=bool).reshape(n, 3)
+        
+        # Same operation order as predict_proba, so results are bit-identical:
+        # sum(p * max(p) * weight) over present modalities, then normalise
+        fused = 0
+        for i, (mod, block) in enumerate(zip(['phys', 'text', 'voice'], arrays)):
+            conf = np.max(block, axis=1, keepdims=True)
+            weighted = block * conf * self.mod_weights[mod]
+            fused = fused + np.where(present[:, i:i+1], weighted, 0.0)
+        
+        any_present = present.any(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = fused / fused.sum(axis=1, keepdims=True)  # Normalize
+        result[~any_present] = [0.33, 0.33, 0.33]  # Neutral if no data
+        return result
+
     def predict_proba_from_features(self, X):
         
+        X = np.asarray(X)
         if X.ndim == 1:
             X = X.reshape(1, -1)
+        if X.shape[1] != 9:
+            raise ValueError(f"Expected 9 features (3 modalities x 3 classes), got {X.shape[1]}")
         
-        results = []
-        for row in X:
-            mod_probs = {}
-            if np.any(row[0:3] != 0):
-                mod_probs['phys'] = row[0:3]
-            if np.any(row[3:6] != 0):
-                mod_probs['text'] = row[3:6]
-            if np.any(row[6:9] != 0):
-                mod_probs['voice'] = row[6:9]
-            
-            if mod_probs:
-                proba = self.predict_proba(mod_probs)
-            else:
-                proba = np.array([0.33, 0.33, 0.33])
-            results.append(proba)
-        
-        return np.array(results)
+        return self.predict_proba_batch(X[:, 0:3], X[:, 3:6], X[:, 6:9])
 
     def predict(self, X, true_label=None):
         
@@ -149,3 +175,21 @@ def preprocess(voice, phys, text):
     return voice, phys, text
 
 
+
+def stack_modalities(voice, phys, text):
+    """Align preprocessed frames on SampleID for PhysioDominantFusion.predict_proba_batch
+    
+    Returns the sample ids, the (phys, text, voice) (N, 3) probability arrays
+    and an (N, 3) presence mask; samples missing from a modality's file are
+    marked absent instead of being treated as zero probabilities.
+    """
+    prob_cols = ['low_prob', 'medium_prob', 'high_prob']
+    ids = phys.index.union(text.index).union(voice.index)
+    
+    arrays, present = [], []
+    for df in [phys, text, voice]:
+        aligned = df.reindex(ids)[prob_cols]
+        present.append(aligned.notna().all(axis=1).values)
+        arrays.append(aligned.fillna(0.0).values)
+    
+    return ids, arrays, np.column_stack(present)
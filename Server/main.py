@@ -1,32 +1,46 @@
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import numpy as np
-import pandas as pd
-import joblib
-import pickle
 import io
 import json
-from scipy import signal
-from scipy.stats import skew, kurtosis
-import pywt
-from typing import List, Optional, Dict, Any
-import shap
-import lime
-import lime.lime_tabular
-from sklearn.inspection import permutation_importance
-from sklearn.base import BaseEstimator, TransformerMixin
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
+import os
+import zipfile
+import asyncio
+import gc
+import logging
+import time
+from typing import Optional
 import warnings
 warnings.filterwarnings('ignore')
 
 # Import your existing fusion model
 from latefusion_final import PhysioDominantFusion
 
+# Configuration and feature names
+from features import CFG, ALL_FEATURE_NAMES
+from batch_features import count_windows, extract_batch_features, iter_batch_features
+from hrv import PeakIndex, peak_mode
+from signal_quality import assess_windows, gate_windows, quality_mode, profile_ranges
+from ingest import load_sensor_columns, file_format
+from feature_store import FeatureStore, recording_key
+from profiles import PROFILE_CFG, available_profiles, resolve_profile, resample_columns
+from streaming import StreamingSession
+from window_stream import OUTPUT_FORMATS, output_format, ndjson_lines, arrow_stream
+from explainers import XAIExplainer, DASS21_FEATURE_NAMES, XAI_CFG, explain_level
+from explanation_jobs import ExplanationJobs
+from dass21_table import DASS21Table
+from worker_pool import PredictionPool, ServerBusyError
+from components import ComponentRegistry
+from compiled_model import compile_model
+from model_sharing import SHARING_CFG, PHYSIO_MODEL_PATH, load_model, freeze, memory_summary
+from inference_batcher import INFERENCE_BATCH_CFG, InFlight, MicroBatcher
+from chunked_upload import WindowSample, use_chunked, spool_upload, spool_member, score_upload
+from observability import get_logger, stage, record_stage_timings, metrics, StageTimings
+
+logger = get_logger("api")
+
 # CORS Setup
 app = FastAPI(title="SafeSpace Stress Detection API with XAI", version="1.0.0")
 app.add_middleware(
@@ -37,542 +51,112 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration
-CFG = {
-    "orig_fs": 700,
-    "fs": 100,
-    "window_sec": 10,
-    "stride_sec": 5,
-    "sensors": ["ECG", "EDA", "EMG", "Temp"],
-}
+# Initialize XAI explainer
+xai_explainer = XAIExplainer()
 
-DOWN_F = CFG["orig_fs"] // CFG["fs"]
-STEP = CFG["window_sec"] * CFG["fs"]
-STRIDE = CFG["stride_sec"] * CFG["fs"]
-
-# Feature names for interpretability
-FEATURE_NAMES = {
-    "ECG": [
-        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
-        "q25", "q75", "mean_abs_diff", "rms",
-        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
-        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
-        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
-        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
-        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
-        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max",
-        "mean_rr", "std_rr", "rmssd", "heart_rate"
-    ],
-    "EDA": [
-        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
-        "q25", "q75", "mean_abs_diff", "rms",
-        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
-        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
-        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
-        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
-        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
-        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
-    ],
-    "EMG": [
-        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
-        "q25", "q75", "mean_abs_diff", "rms",
-        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
-        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
-        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
-        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
-        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
-        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
-    ],
-    "Temp": [
-        "mean", "std", "var", "skew", "kurtosis", "min", "max", "ptp", "median", 
-        "q25", "q75", "mean_abs_diff", "rms",
-        "vlow_power", "vlow_rel", "low_power", "low_rel", "mid_power", "mid_rel", 
-        "high_power", "high_rel", "freq_mean", "freq_std", "peak_freq",
-        "wav_d1_mean", "wav_d1_std", "wav_d1_var", "wav_d1_max", "wav_d2_mean", 
-        "wav_d2_std", "wav_d2_var", "wav_d2_max", "wav_d3_mean", "wav_d3_std", 
-        "wav_d3_var", "wav_d3_max", "wav_d4_mean", "wav_d4_std", "wav_d4_var", 
-        "wav_d4_max", "wav_a4_mean", "wav_a4_std", "wav_a4_var", "wav_a4_max"
-    ]
-}
+# Cache of extracted features keyed by recording content
+feature_store = FeatureStore()
 
-# Create flat feature names list
-ALL_FEATURE_NAMES = []
-for sensor in CFG["sensors"]:
-    for feature in FEATURE_NAMES[sensor]:
-        ALL_FEATURE_NAMES.append(f"{sensor}_{feature}")
-
-DASS21_FEATURE_NAMES = [
-    "DASS21_Q1_breathing_difficulty",
-    "DASS21_Q2_dry_mouth", 
-    "DASS21_Q3_positive_feelings",
-    "DASS21_Q4_breathing_shortness",
-    "DASS21_Q5_action_initiative",
-    "DASS21_Q6_overreact_tendency",
-    "DASS21_Q7_trembling_hands"
-]
-
-class XAIExplainer:
-    """Explainable AI component for stress detection models"""
-    
-    def __init__(self):
-        self.physio_explainer = None
-        self.dass21_explainer = None
-        self.feature_importance_cache = {}
-        
-    def setup_physio_explainer(self, model, X_background):
-        """Setup SHAP explainer for physiological model"""
-        try:
-            # Use a subset of background data for efficiency
-            background_sample = X_background[:min(100, len(X_background))]
-            
-            # Try TreeExplainer first (for tree-based models)
-            try:
-                self.physio_explainer = shap.TreeExplainer(model)
-                print("✓ TreeExplainer initialized for physiological model")
-            except:
-                # Fall back to KernelExplainer
-                def model_predict(X):
-                    return model.predict_proba(X)
-                self.physio_explainer = shap.KernelExplainer(model_predict, background_sample)
-                print("✓ KernelExplainer initialized for physiological model")
-                
-        except Exception as e:
-            print(f"⚠ Failed to initialize physio explainer: {e}")
-            
-    def setup_dass21_explainer(self, model, scaler, X_background):
-        """Setup SHAP explainer for DASS-21 model"""
-        try:
-            background_sample = X_background[:min(100, len(X_background))]
-            
-            def model_predict(X):
-                X_scaled = scaler.transform(X)
-                return model.predict_proba(X_scaled)
-                
-            self.dass21_explainer = shap.KernelExplainer(model_predict, background_sample)
-            print("✓ KernelExplainer initialized for DASS-21 model")
-            
-        except Exception as e:
-            print(f"⚠ Failed to initialize DASS-21 explainer: {e}")
-    
-    def explain_physio_prediction(self, X_sample, top_k=10):
-        """Generate explanations for physiological predictions"""
-        explanations = {
-            "available": False,
-            "method": "SHAP",
-            "feature_importance": [],
-            "summary": ""
-        }
-        
-        if self.physio_explainer is None:
-            return explanations
-            
-        try:
-            # Get SHAP values
-            shap_values = self.physio_explainer.shap_values(X_sample)
-            
-            # Handle multi-class output
-            if isinstance(shap_values, list):
-                # For multi-class, use the predicted class
-                predicted_class = np.argmax(X_sample.sum(axis=0))  # Simple heuristic
-                shap_values_class = shap_values[predicted_class]
-            else:
-                shap_values_class = shap_values
-                
-            # Average SHAP values across windows
-            mean_shap = np.mean(shap_values_class, axis=0)
-            
-            # Get top features
-            feature_importance = []
-            for i, importance in enumerate(mean_shap):
-                if i < len(ALL_FEATURE_NAMES):
-                    feature_importance.append({
-                        "feature": ALL_FEATURE_NAMES[i],
-                        "importance": float(importance),
-                        "abs_importance": float(abs(importance))
-                    })
-            
-            # Sort by absolute importance
-            feature_importance.sort(key=lambda x: x["abs_importance"], reverse=True)
-            
-            explanations.update({
-                "available": True,
-                "feature_importance": feature_importance[:top_k],
-                "summary": self._generate_physio_summary(feature_importance[:top_k])
-            })
-            
-        except Exception as e:
-            print(f"⚠ Failed to generate physio explanations: {e}")
-            explanations["error"] = str(e)
-            
-        return explanations
-    
-    def explain_dass21_prediction(self, X_sample, top_k=7):
-        """Generate explanations for DASS-21 predictions"""
-        explanations = {
-            "available": False,
-            "method": "SHAP",
-            "feature_importance": [],
-            "summary": ""
-        }
-        
-        if self.dass21_explainer is None:
-            return explanations
-            
-        try:
-            # Get SHAP values
-            shap_values = self.dass21_explainer.shap_values(X_sample)
-            
-            # Handle multi-class output
-            if isinstance(shap_values, list):
-                # Average across classes or use highest probability class
-                mean_shap = np.mean([sv[0] for sv in shap_values], axis=0)
-            else:
-                mean_shap = shap_values[0]
-            
-            # Get feature importance
-            feature_importance = []
-            for i, importance in enumerate(mean_shap):
-                if i < len(DASS21_FEATURE_NAMES):
-                    feature_importance.append({
-                        "feature": DASS21_FEATURE_NAMES[i],
-                        "importance": float(importance),
-                        "abs_importance": float(abs(importance)),
-                        "value": float(X_sample[0][i])
-                    })
-            
-            # Sort by absolute importance
-            feature_importance.sort(key=lambda x: x["abs_importance"], reverse=True)
-            
-            explanations.update({
-                "available": True,
-                "feature_importance": feature_importance[:top_k],
-                "summary": self._generate_dass21_summary(feature_importance[:top_k])
-            })
-            
-        except Exception as e:
-            print(f"⚠ Failed to generate DASS-21 explanations: {e}")
-            explanations["error"] = str(e)
-            
-        return explanations
-    
-    def explain_fusion_decision(self, fusion_input, fusion_probs):
-        """Generate explanations for fusion model decisions"""
-        explanations = {
-            "available": True,
-            "method": "Weight Analysis",
-            "modality_contributions": [],
-            "summary": ""
-        }
-        
-        try:
-            # Analyze modality contributions
-            modalities = ["physiological", "questionnaire", "voice"]
-            contributions = []
-            
-            for i, modality in enumerate(modalities):
-                if modality == "physiological":
-                    prob_dist = fusion_input["phys"]
-                elif modality == "questionnaire":
-                    prob_dist = fusion_input["text"]
-                else:  # voice
-                    prob_dist = fusion_input["voice"]
-                
-                # Calculate contribution metrics
-                entropy = -np.sum(prob_dist * np.log(prob_dist + 1e-10))
-                confidence = np.max(prob_dist)
-                predicted_class = np.argmax(prob_dist)
-                
-                contributions.append({
-                    "modality": modality,
-                    "probabilities": prob_dist.tolist(),
-                    "predicted_class": int(predicted_class),
-                    "confidence": float(confidence),
-                    "entropy": float(entropy),
-                    "contribution_score": float(confidence * (1 - entropy/np.log(3)))
-                })
-            
-            # Sort by contribution score
-            contributions.sort(key=lambda x: x["contribution_score"], reverse=True)
-            
-            explanations.update({
-                "modality_contributions": contributions,
-                "summary": self._generate_fusion_summary(contributions, fusion_probs)
-            })
-            
-        except Exception as e:
-            print(f"⚠ Failed to generate fusion explanations: {e}")
-            explanations["error"] = str(e)
-            
-        return explanations
+def load_recording(content, filename="data.csv", profile=None):
+    """Sensor columns of an uploaded recording at CFG["fs"]
     
-    def _generate_physio_summary(self, feature_importance):
-        """Generate human-readable summary for physiological explanations"""
-        if not feature_importance:
-            return "No physiological features available for explanation."
-        
-        top_features = feature_importance[:3]
-        summary_parts = []
-        
-        for feat in top_features:
-            feature_name = feat["feature"]
-            importance = feat["importance"]
-            
-            # Parse sensor and feature type
-            sensor = feature_name.split("_")[0]
-            feature_type = "_".join(feature_name.split("_")[1:])
-            
-            direction = "increases" if importance > 0 else "decreases"
-            summary_parts.append(f"{sensor} {feature_type} {direction} stress likelihood")
-        
-        return f"Key factors: {'; '.join(summary_parts[:2])}."
+    Returns:
+        (columns, n_samples)
+    """
+    profile = profile or resolve_profile()
+    with stage("parse"):
+        columns, n_samples = load_sensor_columns(content, filename)
     
-    def _generate_dass21_summary(self, feature_importance):
-        """Generate human-readable summary for DASS-21 explanations"""
-        if not feature_importance:
-            return "No questionnaire responses available for explanation."
-        
-        top_features = feature_importance[:2]
-        summary_parts = []
-        
-        for feat in top_features:
-            feature_name = feat["feature"].replace("DASS21_", "").replace("_", " ")
-            importance = feat["importance"]
-            value = feat["value"]
-            
-            impact = "increases" if importance > 0 else "decreases"
-            summary_parts.append(f"{feature_name} (score: {value:.1f}) {impact} stress")
-        
-        return f"Main questionnaire factors: {'; '.join(summary_parts)}."
+    if profile.needs_resampling:
+        with stage("resample"):
+            columns, n_samples = resample_columns(columns, n_samples, profile.source_fs)
     
-    def _generate_fusion_summary(self, contributions, fusion_probs):
-        """Generate human-readable summary for fusion explanations"""
-        predicted_class = np.argmax(fusion_probs)
-        confidence = np.max(fusion_probs)
-        class_names = ["Low", "Medium", "High"]
-        
-        # Find most contributing modality
-        top_modality = contributions[0]["modality"]
-        
-        summary = f"Predicted stress level: {class_names[predicted_class]} " \
-                 f"(confidence: {confidence:.2f}). "
-        summary += f"Primary evidence from {top_modality} signals."
-        
-        return summary
-
-# Initialize XAI explainer
-xai_explainer = XAIExplainer()
+    # Validate required columns
+    missing_sensors = [sensor for sensor in CFG["sensors"] if sensor not in columns]
+    if missing_sensors:
+        logger.warning(f"Missing sensors: {missing_sensors}")
+    return columns, n_samples
 
-# === Feature Extraction Functions ===
-def zscore(x):
-    """Z-score normalization with numerical stability"""
-    x = np.asarray(x)
-    std = x.std()
-    if std == 0:
-        return np.zeros_like(x)
-    return (x - x.mean()) / std
-
-def extract_time_features(signal_data):
-    """Extract time-domain features from signal"""
-    signal_data = np.asarray(signal_data).astype(float)
-    
-    # Handle edge cases
-    if len(signal_data) == 0:
-        return [0.0] * 13
-    
-    # Basic statistics
-    mean_val = np.mean(signal_data)
-    std_val = np.std(signal_data)
-    var_val = np.var(signal_data)
-    
-    # Handle constant signals
-    if std_val == 0:
-        skew_val = kurtosis_val = 0.0
-    else:
-        skew_val = skew(signal_data)
-        kurtosis_val = kurtosis(signal_data)
+def extract_recording_features(content, filename="data.csv", profile=None):
+    """Signal-quality flags and feature windows of an uploaded recording
     
-    return [
-        mean_val, std_val, var_val, skew_val, kurtosis_val,
-        np.min(signal_data), np.max(signal_data), np.ptp(signal_data),
-        np.median(signal_data), np.percentile(signal_data, 25),
-        np.percentile(signal_data, 75),
-        np.mean(np.abs(np.diff(signal_data))) if len(signal_data) > 1 else 0.0,
-        np.sqrt(np.mean(signal_data**2))
-    ]
-
-def extract_freq_features(signal_data, fs=100):
-    """Extract frequency-domain features using Welch's method"""
-    signal_data = np.asarray(signal_data).astype(float)
+    Windows that signal-quality gating would not score are not extracted
+    and keep all-zero feature rows.
     
-    if len(signal_data) < 8:
-        return [0.0] * 11
+    Returns:
+        (X, flags); flags is None when SIGNAL_QUALITY=off
+    """
+    profile = profile or resolve_profile()
+    columns, n_samples = load_recording(content, filename, profile)
+    n_windows = count_windows(n_samples, stride_size=profile.stride_size)
+    if n_windows == 0:
+        raise ValueError("No features extracted from data. Check data length and format.")
     
-    try:
-        freqs, psd = signal.welch(signal_data, fs=fs, nperseg=min(256, len(signal_data)//4))
-        bands = {
-            'very_low': (0.0, 0.04), 
-            'low': (0.04, 0.15), 
-            'mid': (0.15, 0.4), 
-            'high': (0.4, 0.5)
-        }
-        
-        total_power = np.sum(psd)
-        if total_power == 0:
-            return [0.0] * 11
-        
-        features = []
-        for low, high in bands.values():
-            mask = (freqs >= low) & (freqs <= high)
-            band_power = np.sum(psd[mask])
-            features.append(band_power)
-            features.append(band_power / total_power)  # Relative power
-        
-        # Additional frequency features
-        features.extend([
-            np.mean(freqs), 
-            np.std(freqs), 
-            freqs[np.argmax(psd)]  # Peak frequency
-        ])
-        
-        return features
-        
-    except Exception as e:
-        print(f"Warning: Frequency feature extraction failed: {e}")
-        return [0.0] * 11
-
-def extract_wavelet_features(signal_data):
-    """Extract wavelet-based features"""
-    signal_data = np.asarray(signal_data).astype(float)
+    peaks, flags, windows = None, None, None
+    if "ECG" in columns and peak_mode() == "recording":
+        with stage("features_ecg"):
+            peaks = PeakIndex.from_ecg(np.asarray(columns["ECG"], dtype=float)[:n_samples])
+    if quality_mode() != "off":
+        with stage("signal_quality"):
+            flags = assess_windows(columns, n_samples, stride_size=profile.stride_size, peaks=peaks,
+                                   ranges=profile_ranges(profile))
+        if quality_mode() in ("weight", "skip"):
+            windows, _, _ = gate_windows(flags, n_windows)
     
-    try:
-        coeffs = pywt.wavedec(signal_data, 'db4', level=4)
-        features = []
-        
-        for coeff in coeffs:
-            if len(coeff) > 0:
-                features.extend([
-                    np.mean(coeff),
-                    np.std(coeff),
-                    np.var(coeff),
-                    np.max(np.abs(coeff))
-                ])
-        
-        # Pad or truncate to consistent length
-        target_length = 20  # 5 levels * 4 features
-        if len(features) < target_length:
-            features.extend([0.0] * (target_length - len(features)))
-        else:
-            features = features[:target_length]
-            
-        return features
-        
-    except Exception as e:
-        print(f"Warning: Wavelet feature extraction failed: {e}")
-        return [0.0] * 20
+    # Extract features for all (usable) windows at once
+    X = extract_batch_features(columns, n_samples=n_samples, stride_size=profile.stride_size,
+                               peaks=peaks, windows=windows)
+    return X, flags
 
-def extract_ecg_features(signal_data, fs=100):
-    """Extract ECG-specific features (heart rate variability)"""
-    signal_data = np.asarray(signal_data).astype(float)
+def process_sensor_data(content, filename="data.csv", profile=None):
+    """Read an uploaded recording (CSV or binary columnar format) into feature windows
     
-    try:
-        # Find R-peaks
-        peaks, _ = signal.find_peaks(
-            signal_data, 
-            height=np.std(signal_data), 
-            distance=fs//3  # Minimum 200ms between peaks
-        )
-        
-        if len(peaks) > 1:
-            # Calculate RR intervals in milliseconds
-            rr_intervals = np.diff(peaks) / fs * 1000
-            
-            # HRV features
-            mean_rr = np.mean(rr_intervals)
-            std_rr = np.std(rr_intervals)
-            rmssd = np.sqrt(np.mean(np.diff(rr_intervals)**2))
-            heart_rate = len(peaks) / (len(signal_data) / fs) * 60
-            
-            return [mean_rr, std_rr, rmssd, heart_rate]
-        else:
-            return [0.0] * 4
-            
-    except Exception as e:
-        print(f"Warning: ECG feature extraction failed: {e}")
-        return [0.0] * 4
+    Args:
+        profile: SignalProfile of the recording (default: the default profile);
+            recordings at another rate are resampled to CFG["fs"] first
+    """
+    X, _ = extract_recording_features(content, filename, profile)
+    return X
 
-def extract_window_features(sigs):
-    """Extract all features for a window of signals"""
-    features = []
+def extract_features_cached(content, filename="data.csv", profile=None):
+    """Feature windows and signal-quality flags for an upload, reusing the feature store when possible
     
-    for sensor in CFG["sensors"]:
-        if sensor in sigs:
-            data = sigs[sensor]
-            
-            # Time-domain features
-            features.extend(extract_time_features(data))
-            
-            # Frequency-domain features
-            features.extend(extract_freq_features(data))
-            
-            # Wavelet features
-            features.extend(extract_wavelet_features(data))
-            
-            # ECG-specific features
-            if sensor == "ECG":
-                features.extend(extract_ecg_features(data))
-        else:
-            # If sensor data is missing, pad with zeros
-            features.extend([0.0] * 13)  # Time features
-            features.extend([0.0] * 11)  # Frequency features
-            features.extend([0.0] * 20)  # Wavelet features
-            if sensor == "ECG":
-                features.extend([0.0] * 4)  # ECG features
+    Returns:
+        (X, flags, cache_hit)
+    """
+    profile = profile or resolve_profile()
+    with stage("feature_cache"):
+        key = recording_key(content, profile)
+        X = feature_store.get(key)
+        flags = feature_store.get(f"{key}-quality") if quality_mode() != "off" else None
+    if X is not None and (flags is not None or quality_mode() == "off"):
+        logger.debug(f"Feature store hit: {key[:12]}")
+        return X, flags, True
     
-    return np.array(features)
-
-def process_csv_data(csv_buffer):
-    """Process CSV data into feature windows"""
     try:
-        data = pd.read_csv(csv_buffer)
-        
-        # Validate required columns
-        missing_sensors = [sensor for sensor in CFG["sensors"] if sensor not in data.columns]
-        if missing_sensors:
-            print(f"Warning: Missing sensors: {missing_sensors}")
-        
-        window_size = STEP
-        stride_size = STRIDE
-        all_features = []
-        
-        for start_idx in range(0, len(data) - window_size + 1, stride_size):
-            end_idx = start_idx + window_size
-            window_data = data.iloc[start_idx:end_idx]
-            
-            # Extract signals for each sensor
-            signals = {}
-            for sensor in CFG["sensors"]:
-                if sensor in window_data.columns:
-                    signals[sensor] = zscore(window_data[sensor].values)
-                else:
-                    signals[sensor] = np.zeros(window_size)
-            
-            # Extract features
-            features = extract_window_features(signals)
-            all_features.append(features)
-        
-        if not all_features:
-            raise ValueError("No features extracted from data. Check data length and format.")
-        
-        return np.array(all_features)
-        
+        X, flags = extract_recording_features(content, filename, profile)
     except Exception as e:
-        print(f"Error processing CSV data: {e}")
+        logger.debug(f"Error processing sensor data: {e}")
         raise
+    feature_store.put(key, X)
+    if flags is not None:
+        feature_store.put(f"{key}-quality", flags)
+    return X, flags, False
+
+def process_csv_data(csv_buffer):
+    """Process CSV data (a path or file-like object) into feature windows"""
+    if hasattr(csv_buffer, "read"):
+        content = csv_buffer.read()
+    else:
+        with open(csv_buffer, "rb") as f:
+            content = f.read()
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return process_sensor_data(content, "data.csv")
 
 def validate_and_parse_dass21(dass21_responses: str):
     """Validate and parse DASS-21 responses with comprehensive error handling"""
-    print(f"Raw DASS-21 input: '{dass21_responses}'")
-    print(f"Input type: {type(dass21_responses)}")
+    logger.debug(f"Raw DASS-21 input: '{dass21_responses}'")
     
     try:
         # Clean the input
@@ -581,42 +165,41 @@ def validate_and_parse_dass21(dass21_responses: str):
         # Try to parse as JSON first
         try:
             dass21_list = json.loads(dass21_responses)
-            print(f"Parsed as JSON: {dass21_list}")
+            logger.debug(f"Parsed as JSON: {dass21_list}")
         except json.JSONDecodeError:
             # Try to parse as comma-separated string
             try:
                 # Remove brackets if present
                 clean_input = dass21_responses.strip("[](){}")
                 dass21_list = [float(x.strip()) for x in clean_input.split(",")]
-                print(f"Parsed as comma-separated: {dass21_list}")
+                logger.debug(f"Parsed as comma-separated: {dass21_list}")
             except (ValueError, AttributeError) as e:
-                print(f"Failed to parse DASS-21 responses: {e}")
+                logger.debug(f"Failed to parse DASS-21 responses: {e}")
                 raise ValueError(f"Invalid DASS-21 format. Expected 7 comma-separated numbers or JSON array, got: {dass21_responses}")
         
         # Validate length
         if len(dass21_list) != 7:
-            print(f"Invalid DASS-21 length: {len(dass21_list)} (expected 7)")
+            logger.debug(f"Invalid DASS-21 length: {len(dass21_list)} (expected 7)")
             raise ValueError(f"DASS-21 must contain exactly 7 values, got {len(dass21_list)}")
         
         # Validate values are in range [0, 3]
         for i, val in enumerate(dass21_list):
             if not isinstance(val, (int, float)) or val < 0 or val > 3:
-                print(f"Invalid DASS-21 value at index {i}: {val}")
+                logger.debug(f"Invalid DASS-21 value at index {i}: {val}")
                 raise ValueError(f"DASS-21 values must be between 0 and 3, got {val} at index {i}")
         
         # Convert to floats
         dass21_list = [float(x) for x in dass21_list]
-        print(f"Validated DASS-21 responses: {dass21_list}")
+        logger.debug(f"Validated DASS-21 responses: {dass21_list}")
         return dass21_list
         
     except Exception as e:
-        print(f"DASS-21 validation failed: {e}")
+        logger.debug(f"DASS-21 validation failed: {e}")
         raise
 
 def validate_and_parse_voice_probs(voice_probs_str: str):
     """Validate and parse voice probabilities"""
-    print(f"Raw voice probabilities input: '{voice_probs_str}'")
-    print(f"Input type: {type(voice_probs_str)}")
+    logger.debug(f"Raw voice probabilities input: '{voice_probs_str}'")
     
     try:
         # Clean the input
@@ -625,227 +208,1202 @@ def validate_and_parse_voice_probs(voice_probs_str: str):
         # Try to parse as JSON first
         try:
             voice_probs = json.loads(voice_probs_str)
-            print(f"Parsed as JSON: {voice_probs}")
+            logger.debug(f"Parsed as JSON: {voice_probs}")
         except json.JSONDecodeError:
             # Try to parse as comma-separated string
             try:
                 # Remove brackets if present
                 clean_input = voice_probs_str.strip("[](){}")
                 voice_probs = [float(x.strip()) for x in clean_input.split(",")]
-                print(f"Parsed as comma-separated: {voice_probs}")
+                logger.debug(f"Parsed as comma-separated: {voice_probs}")
             except (ValueError, AttributeError) as e:
-                print(f"Failed to parse voice probabilities: {e}")
+                logger.debug(f"Failed to parse voice probabilities: {e}")
                 raise ValueError(f"Invalid voice probabilities format. Expected 3 comma-separated numbers or JSON array, got: {voice_probs_str}")
         
         # Validate length
         if len(voice_probs) != 3:
-            print(f"Invalid voice probabilities length: {len(voice_probs)} (expected 3)")
+            logger.debug(f"Invalid voice probabilities length: {len(voice_probs)} (expected 3)")
             raise ValueError(f"Voice probabilities must contain exactly 3 values, got {len(voice_probs)}")
         
         # Validate values are probabilities (0-1)
         for i, val in enumerate(voice_probs):
             if not isinstance(val, (int, float)) or val < 0 or val > 1:
-                print(f"Invalid voice probability value at index {i}: {val}")
+                logger.debug(f"Invalid voice probability value at index {i}: {val}")
                 raise ValueError(f"Voice probabilities must be between 0 and 1, got {val} at index {i}")
         
         # Validate probabilities sum to approximately 1
         prob_sum = sum(voice_probs)
         if abs(prob_sum - 1.0) > 0.01:  # Allow small floating point errors
-            print(f"Voice probabilities don't sum to 1: {prob_sum}")
+            logger.debug(f"Voice probabilities don't sum to 1: {prob_sum}")
             raise ValueError(f"Voice probabilities must sum to 1, got sum: {prob_sum}")
         
         # Convert to floats
         voice_probs = [float(x) for x in voice_probs]
-        print(f"Validated voice probabilities: {voice_probs}")
+        logger.debug(f"Validated voice probabilities: {voice_probs}")
         return voice_probs
         
     except Exception as e:
-        print(f"Voice probabilities validation failed: {e}")
+        logger.debug(f"Voice probabilities validation failed: {e}")
         raise
 
+def validate_and_parse_windows(windows_str: str):
+    """Validate and parse window indices for per-window explanations"""
+    windows_str = windows_str.strip()
+    try:
+        windows = json.loads(windows_str)
+        if isinstance(windows, int):
+            windows = [windows]
+    except json.JSONDecodeError:
+        clean_input = windows_str.strip("[](){}")
+        windows = [x.strip() for x in clean_input.split(",") if x.strip()]
+    try:
+        windows = [int(x) for x in windows]
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid explain_windows format. Expected comma-separated window indices or JSON array, got: {windows_str}")
+    if any(w < 0 for w in windows):
+        raise ValueError(f"Window indices must be non-negative, got {windows}")
+    return sorted(set(windows))
+
 # === Load Models ===
-try:
-    print("Loading models...")
-    physio_model = joblib.load("models/regularized_global_model.pkl")
-    dass21_model = joblib.load("models/stacking_classifier_model.pkl")
-    dass21_scaler = joblib.load("models/scaler.pkl")
-    
-    # Updated fusion model to handle voice modality
-    fusion_model = PhysioDominantFusion(
-        class_weights={0: 0.7, 1: 0.0, 2: 0.3}
+# Models and explainers are loaded on first use or by warm-up, depending on
+# STARTUP_MODE (see components.py); /ready reports their load state.
+components = ComponentRegistry()
+components.register("physio_model", lambda: load_model(PHYSIO_MODEL_PATH))
+# What predictions go through: the sklearn model, or its compiled form under PHYSIO_BACKEND
+components.register("physio_predictor", lambda: compile_model(components.get("physio_model")))
+components.register("dass21_model", lambda: load_model("models/stacking_classifier_model.pkl"))
+components.register("dass21_scaler", lambda: load_model("models/scaler.pkl"))
+# Precomputed DASS-21 lookup table (build with `python dass21_table.py`); None if absent
+components.register("dass21_table", DASS21Table.load)
+
+def _load_xai_explainer():
+    """Register the models with the XAI explainer and build its SHAP explainers
+
+    Kernel and permutation explainers use the k-means backgrounds persisted in
+    models/ (see `python explainers.py --help`). Without one, that modality's
+    explanations are reported unavailable rather than computed against noise.
+    """
+    xai_explainer.setup_physio_explainer(components.get("physio_model"))
+    xai_explainer.setup_dass21_explainer(
+        components.get("dass21_model"), components.get("dass21_scaler"),
+        lookup_table=components.get("dass21_table")
+    )
+    for name, build in (("physiological", xai_explainer.get_physio_explainer),
+                        ("DASS-21", xai_explainer.get_dass21_explainer)):
+        try:
+            build()
+        except Exception as e:
+            logger.error(f"{name} explanations unavailable: {e}", extra={"explainer": name})
+    return xai_explainer
+
+components.register("xai_explainer", _load_xai_explainer)
+
+# Updated fusion model to handle voice modality
+fusion_model = PhysioDominantFusion(
+    class_weights={0: 0.7, 1: 0.0, 2: 0.3}
+)
+
+if components.mode == "eager" or SHARING_CFG["enabled"]:
+    logger.info("Loading models...")
+    components.load_all()
+    logger.info("All models loaded successfully")
+
+def warm_up_worker():
+    """Warm-up hook run once in every prediction worker process"""
+    if components.mode != "lazy":
+        components.warm_up()
+
+@app.on_event("startup")
+def warm_up_components():
+    if components.mode == "warm" and not SHARING_CFG["enabled"]:
+        components.warm_up_in_background()
+
+# CPU-bound prediction work runs in worker processes that import this module;
+# with shared models they are forked from this process, models already loaded
+prediction_pool = PredictionPool(__name__, start_method="fork" if SHARING_CFG["enabled"] else None)
+
+@app.on_event("startup")
+def fork_prediction_pool():
+    if SHARING_CFG["enabled"]:
+        # Freeze and fork before the event loop starts any threads
+        logger.info("Froze loaded objects for copy-on-write sharing", extra={"frozen_objects": freeze()})
+        prediction_pool.start()
+        logger.info("Forked prediction workers", extra={"workers": prediction_pool.pids()})
+# Per-window prediction streaming (/predict/windows)
+WINDOW_STREAM_CFG = {
+    # Windows extracted and scored before each write to the response
+    "batch_size": int(os.environ.get("WINDOW_STREAM_BATCH", 64)),
+}
+
+# Explanations computed after the response for explain_async requests
+explanation_jobs = ExplanationJobs()
+
+@app.on_event("shutdown")
+def shutdown_prediction_pool():
+    prediction_pool.shutdown()
+
+def check_feature_dimensions(X, model):
+    """Reject feature matrices that do not have the columns the physiological model was trained on"""
+    expected = getattr(model, "n_features_in_", len(ALL_FEATURE_NAMES))
+    if X.ndim != 2 or X.shape[1] != expected:
+        raise ValueError(
+            f"Physiological features have shape {X.shape}, but the model expects {expected} features per window"
+        )
+
+def predict_dass21_proba(dass21_list):
+    """DASS-21 class probabilities, from the lookup table when the answers are integers"""
+    dass21_table = components.get("dass21_table")
+    if dass21_table is not None:
+        probs = dass21_table.predict_proba(dass21_list)
+        if probs is not None:
+            return probs
+    
+    # Non-integer answers (or no table): scale and run the stacking model
+    dass21_X = components.get("dass21_scaler").transform([dass21_list])
+    return components.get("dass21_model").predict_proba(dass21_X)[0]
+
+def predict_dass21_proba_batch(dass21_lists):
+    """DASS-21 probabilities for many subjects with a single stacking-model call"""
+    probs = [None] * len(dass21_lists)
+    dass21_table = components.get("dass21_table")
+    if dass21_table is not None:
+        probs = [dass21_table.predict_proba(dass21_list) for dass21_list in dass21_lists]
+    
+    # Everything the table cannot answer goes through the model together
+    missing = [i for i, p in enumerate(probs) if p is None]
+    if missing:
+        dass21_X = components.get("dass21_scaler").transform([dass21_lists[i] for i in missing])
+        for i, p in zip(missing, components.get("dass21_model").predict_proba(dass21_X)):
+            probs[i] = p
+    return np.array(probs)
+
+def select_explain_windows(budget, usable, n_windows):
+    """explain_budget with its window indices translated to rows of the scored windows
+    
+    Args:
+        usable: indices of the windows kept by signal-quality gating
+        n_windows: number of windows in the recording
+    """
+    windows = (budget or {}).get("windows") or []
+    if not windows:
+        return budget
+    if windows[-1] >= n_windows:
+        raise ValueError(f"explain_windows must be below the number of windows ({n_windows}), got {windows[-1]}")
+    rows = np.searchsorted(usable, windows)
+    skipped = [w for w, row in zip(windows, rows) if row >= len(usable) or usable[row] != w]
+    if skipped:
+        raise ValueError(f"explain_windows {skipped} failed the signal-quality checks and were not scored")
+    return {**budget, "windows": rows.tolist()}
+
+def restore_window_indices(explanations, usable):
+    """Map per-window attributions from rows of the scored windows back to recording windows"""
+    for entry in explanations.get("physiological", {}).get("window_attributions", []):
+        entry["window"] = int(usable[entry["window"]])
+    return explanations
+
+def explain_prediction(level, X_physio, dass21_list, fusion_input, fusion_probs, top_k=None, budget=None):
+    """Explanations at the given level (see EXPLAIN_LEVELS); SHAP is only loaded for top_k and full
+    
+    budget may set max_windows, time_budget_sec and windows (indices to attribute
+    individually) for the physiological explanation.
+    """
+    if level == "none":
+        return {}
+    try:
+        explanations = {}
+        if level in ("top_k", "full"):
+            xai = components.get("xai_explainer")
+            top_k = (top_k or XAI_CFG["top_k"]) if level == "top_k" else None
+            
+            # Explain physiological prediction
+            with stage("explain_physio"):
+                explanations["physiological"] = xai.explain_physio_prediction(
+                    X_physio, top_k=top_k, use_cache=level == "top_k", **(budget or {})
+                )
+            
+            # Explain DASS-21 prediction
+            with stage("explain_dass21"):
+                explanations["questionnaire"] = xai.explain_dass21_prediction(
+                    np.array([dass21_list]), top_k=top_k or len(DASS21_FEATURE_NAMES)
+                )
+        
+        # Explain fusion decision (no SHAP, so no explainer component needed)
+        with stage("explain_fusion"):
+            explanations["fusion"] = xai_explainer.explain_fusion_decision(fusion_input, fusion_probs)
+        return explanations
+    except Exception as e:
+        logger.warning(f"Explanation generation failed: {e}")
+        return {
+            name: {"available": False, "error": str(e)}
+            for name in ("physiological", "questionnaire", "fusion")
+        }
+
+def prepare_inputs(file_content, dass21_responses, voice_probabilities=None, filename="data.csv",
+                   signal_profile=None, sampling_rate=None):
+    """Validated model inputs of a /predict request: physiological features, DASS-21 and voice
+    
+    DASS-21 probabilities are filled in from the lookup table when it can
+    answer, and left as None for the stacking model otherwise.
+    """
+    try:
+        profile = resolve_profile(signal_profile, sampling_rate)
+        X_physio, flags, feature_cache_hit = extract_features_cached(file_content, filename, profile)
+        logger.debug(f"Physiological data shape: {X_physio.shape}")
+        
+        if X_physio.shape[0] == 0:
+            raise ValueError("No valid windows extracted from physiological data")
+        
+        # Only windows that pass signal-quality gating are scored
+        n_windows = X_physio.shape[0]
+        usable, window_weights, signal_quality = gate_windows(flags, n_windows)
+        X_physio = np.nan_to_num(X_physio[usable], nan=0.0, posinf=0.0, neginf=0.0)
+            
+    except Exception as e:
+        logger.debug(f"Physiological data processing failed: {e}")
+        raise ValueError(f"Failed to process physiological data: {str(e)}")
+
+    return {
+        "X_physio": X_physio,
+        "n_windows": n_windows,
+        "n_scored": X_physio.shape[0],
+        "usable_windows": usable,
+        "window_weights": window_weights,
+        "signal_quality": signal_quality,
+        "feature_cache_hit": feature_cache_hit,
+        "profile": profile,
+        **prepare_questionnaire_inputs(dass21_responses, voice_probabilities)
+    }
+
+def prepare_questionnaire_inputs(dass21_responses, voice_probabilities=None):
+    """Validated DASS-21 answers (with table probabilities when available) and voice probabilities"""
+    # === Process DASS-21 Data ===
+    try:
+        dass21_list = validate_and_parse_dass21(dass21_responses)
+        dass21_table = components.get("dass21_table")
+        dass21_probs = None
+        if dass21_table is not None:
+            with stage("predict_dass21"):
+                dass21_probs = dass21_table.predict_proba(dass21_list)
+    except Exception as e:
+        logger.debug(f"DASS-21 processing failed: {e}")
+        raise ValueError(f"DASS-21 processing failed: {str(e)}")
+
+    # === Process Voice Data (Optional) ===
+    voice_probs = None
+    if voice_probabilities:
+        try:
+            voice_probs = validate_and_parse_voice_probs(voice_probabilities)
+            voice_probs = np.array(voice_probs)
+            logger.debug(f"Voice probabilities: {voice_probs}")
+        except Exception as e:
+            logger.debug(f"Voice processing failed: {e}")
+            raise ValueError(f"Voice processing failed: {str(e)}")
+    else:
+        logger.debug("No voice probabilities provided, using default uniform distribution")
+        voice_probs = np.array([0.33, 0.34, 0.33])  # Default uniform distribution
+
+    return {
+        "dass21_list": dass21_list,
+        "dass21_probs": dass21_probs,
+        "voice_probs": voice_probs,
+        "voice_provided": bool(voice_probabilities)
+    }
+
+def average_physio_probs(inputs, physio_probs):
+    """Average of per-window probabilities across the scored windows, weighted by signal quality"""
+    return np.average(physio_probs, axis=0, weights=inputs["window_weights"])
+
+def finish_prediction(inputs, physio_probs_avg, dass21_probs, level, explain_top_k=None, explain_budget=None):
+    """Fusion, explanations and the response dict from the per-model probabilities"""
+    X_physio = inputs["X_physio"]
+    dass21_list = inputs["dass21_list"]
+    voice_probs = inputs["voice_probs"]
+    voice_provided = inputs["voice_provided"]
+    logger.debug(f"Physiological probabilities: {physio_probs_avg}")
+    logger.debug(f"DASS-21 probabilities: {dass21_probs}")
+
+    # === Fusion ===
+    try:
+        fusion_input = {
+            "phys": physio_probs_avg,
+            "text": dass21_probs,
+            "voice": voice_probs
+        }
+        
+        with stage("fusion"):
+            fusion_probs = fusion_model.predict_proba(fusion_input)
+            fusion_pred = int(fusion_model.predict(fusion_input))
+        
+        logger.debug(f"Fusion probabilities: {fusion_probs}, prediction: {fusion_pred}")
+        
+    except Exception as e:
+        logger.debug(f"Fusion failed: {e}")
+        raise ValueError(f"Fusion model failed: {str(e)}")
+
+    # === Explainability ===
+    usable = inputs["usable_windows"]
+    explain_budget = select_explain_windows(explain_budget, usable, inputs["n_windows"])
+    explanations = restore_window_indices(explain_prediction(
+        level, X_physio, dass21_list, fusion_input, fusion_probs, explain_top_k, explain_budget
+    ), usable)
+
+    # === Prepare Result ===
+    result = {
+        "success": True,
+        "predictions": {
+            "physio_probs": physio_probs_avg.tolist(),
+            "dass21_probs": dass21_probs.tolist(),
+            "voice_probs": voice_probs.tolist() if voice_provided else None,
+            "fusion_probs": fusion_probs.tolist(),
+            "fusion_pred": fusion_pred,
+            "prediction_label": ["Low", "Medium", "High"][fusion_pred],
+            "confidence": float(np.max(fusion_probs))
+        },
+        "explanations": explanations,
+        "metadata": {
+            "explain": level,
+            "physio_windows": inputs["n_windows"],
+            "physio_windows_scored": inputs["n_scored"],
+            "physio_features": len(ALL_FEATURE_NAMES),
+            "signal_quality": inputs["signal_quality"],
+            "feature_cache_hit": inputs["feature_cache_hit"],
+            "upload_chunked": inputs.get("upload_chunked", False),
+            "signal_profile": inputs["profile"].as_dict(),
+            "dass21_values": dass21_list,
+            "voice_provided": voice_provided,
+            "modalities_used": ["physiological", "questionnaire", "voice" if voice_provided else None]
+        }
+    }
+    
+    return result
+
+@record_stage_timings
+def run_prediction(file_content, dass21_responses, voice_probabilities=None, filename="data.csv",
+                   signal_profile=None, sampling_rate=None, explain=None, explain_top_k=None, explain_budget=None):
+    """
+    Run the CPU-bound prediction pipeline: CSV parsing, feature extraction,
+    model inference, fusion and explanations
+    
+    Executed in a PredictionPool worker process, so it must only take and
+    return picklable values. Per-stage timings are added to the metadata.
+    """
+    level = explain_level(explain)
+    inputs = prepare_inputs(file_content, dass21_responses, voice_probabilities, filename, signal_profile, sampling_rate)
+
+    # === Physiological Prediction ===
+    try:
+        physio_predictor = components.get("physio_predictor")
+        check_feature_dimensions(inputs["X_physio"], physio_predictor)
+        with stage("predict_physio"):
+            physio_probs = physio_predictor.predict_proba(inputs["X_physio"])
+    except Exception as e:
+        logger.debug(f"Physiological prediction failed: {e}")
+        raise ValueError(f"Physiological model prediction failed: {str(e)}")
+
+    return finish_prediction(inputs, average_physio_probs(inputs, physio_probs), predict_dass21(inputs), level,
+                             explain_top_k, explain_budget)
+
+def predict_dass21(inputs):
+    """DASS-21 probabilities from the lookup table, or from the stacking model"""
+    dass21_probs = inputs["dass21_probs"]
+    if dass21_probs is None:
+        try:
+            with stage("predict_dass21"):
+                dass21_probs = _dass21_predict_proba([inputs["dass21_list"]])[0]
+        except Exception as e:
+            logger.debug(f"DASS-21 processing failed: {e}")
+            raise ValueError(f"DASS-21 processing failed: {str(e)}")
+    return dass21_probs
+
+@record_stage_timings
+def run_chunked_prediction(path, dass21_responses, voice_probabilities=None, signal_profile=None,
+                           sampling_rate=None, explain=None, explain_top_k=None, explain_budget=None,
+                           keep_explain_sample=False):
+    """
+    run_prediction for a large upload spooled to path, read and scored chunk by chunk
+    
+    Memory stays bounded by UPLOAD_CFG["chunk_rows"] (see chunked_upload.py).
+    SHAP explanations are computed on a uniform sample of at most
+    XAI_CFG["max_windows"] scored windows, plus any explain_windows, collected
+    while the recording is scored. With keep_explain_sample, the sample is
+    returned under "explain_sample" for deferred explanations.
+    
+    Executed in a PredictionPool worker process.
+    """
+    level = explain_level(explain)
+    physio_predictor = components.get("physio_predictor")
+    requested_windows = (explain_budget or {}).get("windows") or []
+    sample = None
+    if level in ("top_k", "full") or keep_explain_sample or requested_windows:
+        sample = WindowSample(XAI_CFG["max_windows"], requested_windows, XAI_CFG["seed"])
+    
+    def predict_physio(X):
+        check_feature_dimensions(X, physio_predictor)
+        with stage("predict_physio"):
+            return physio_predictor.predict_proba(X)
+    
+    try:
+        profile = resolve_profile(signal_profile, sampling_rate)
+        physio = score_upload(path, profile, predict_physio, sample=sample)
+    except Exception as e:
+        logger.debug(f"Physiological data processing failed: {e}")
+        raise ValueError(f"Failed to process physiological data: {str(e)}")
+    
+    inputs = {
+        "X_physio": physio.get("explain_X"),
+        "n_windows": physio["n_windows"],
+        "n_scored": physio["n_scored"],
+        "usable_windows": physio.get("explain_windows"),
+        "signal_quality": physio["signal_quality"],
+        "feature_cache_hit": False,
+        "upload_chunked": True,
+        "profile": profile,
+        **prepare_questionnaire_inputs(dass21_responses, voice_probabilities)
+    }
+    result = finish_prediction(inputs, physio["physio_probs"], predict_dass21(inputs), level,
+                               explain_top_k, explain_budget)
+    if keep_explain_sample:
+        result["explain_sample"] = {
+            "windows": physio["explain_windows"], "X": physio["explain_X"], "n_windows": physio["n_windows"]
+        }
+    return result
+
+@record_stage_timings
+def prepare_prediction(file_content, dass21_responses, voice_probabilities=None, filename="data.csv",
+                       signal_profile=None, sampling_rate=None):
+    """
+    Inputs of a micro-batched prediction: everything before model inference
+    
+    Executed in a PredictionPool worker process; the models then run in the
+    serving process, batched with other requests (see predict_batched).
+    """
+    inputs = prepare_inputs(file_content, dass21_responses, voice_probabilities, filename, signal_profile, sampling_rate)
+    check_feature_dimensions(inputs["X_physio"], components.get("physio_predictor"))
+    return {"inputs": inputs, "metadata": {}}
+
+def _physio_predict_proba(X):
+    return components.get("physio_predictor").predict_proba(X)
+
+def _dass21_predict_proba(X):
+    return components.get("dass21_model").predict_proba(components.get("dass21_scaler").transform(X))
+
+# Model calls of concurrent requests, coalesced in the serving process. Batches
+# only wait for requests in prepare_prediction: other pool work (explanation
+# jobs, chunked uploads, batch archives) never joins a batch.
+preparing_predictions = InFlight()
+physio_batcher = MicroBatcher("physio", _physio_predict_proba, in_flight=preparing_predictions)
+dass21_batcher = MicroBatcher("dass21", _dass21_predict_proba, in_flight=preparing_predictions)
+
+async def predict_batched(file_content, dass21_responses, voice_probabilities=None, filename="data.csv",
+                          signal_profile=None, sampling_rate=None, explain=None):
+    """
+    run_prediction with model inference micro-batched across requests
+    
+    Feature extraction runs in the prediction pool; the physiological and
+    DASS-21 models then score this request together with any others that
+    are ready at the same time. Only explain levels without SHAP are
+    supported, since SHAP needs the models in the worker anyway.
+    """
+    with preparing_predictions:
+        prepared = await prediction_pool.run(
+            prepare_prediction, file_content, dass21_responses, voice_probabilities,
+            filename, signal_profile, sampling_rate
+        )
+    inputs = prepared["inputs"]
+    with StageTimings() as timings:
+        try:
+            with stage("predict_physio"):
+                physio_probs = await physio_batcher.predict_proba(inputs["X_physio"])
+        except Exception as e:
+            logger.debug(f"Physiological prediction failed: {e}")
+            raise ValueError(f"Physiological model prediction failed: {str(e)}")
+
+        dass21_probs = inputs["dass21_probs"]
+        if dass21_probs is None:
+            try:
+                with stage("predict_dass21"):
+                    dass21_probs = (await dass21_batcher.predict_proba([inputs["dass21_list"]]))[0]
+            except Exception as e:
+                logger.debug(f"DASS-21 processing failed: {e}")
+                raise ValueError(f"DASS-21 processing failed: {str(e)}")
+
+        result = finish_prediction(inputs, average_physio_probs(inputs, physio_probs), dass21_probs,
+                                   explain_level(explain))
+    result["metadata"]["stage_timings_ms"] = {**prepared["metadata"]["stage_timings_ms"], **timings.as_ms()}
+    return result
+
+def explain_scored_windows(X_physio, usable, n_windows, dass21_responses, predictions,
+                           explain=None, explain_top_k=None, explain_budget=None):
+    """Explanations for an already returned prediction, from the features of its scored windows
+    
+    Args:
+        usable: recording window index of each row of X_physio
+        n_windows: number of windows in the recording
+    """
+    explain_budget = select_explain_windows(explain_budget, usable, n_windows)
+    voice_probs = predictions["voice_probs"] or [0.33, 0.34, 0.33]  # Default uniform distribution
+    fusion_input = {
+        "phys": np.array(predictions["physio_probs"]),
+        "text": np.array(predictions["dass21_probs"]),
+        "voice": np.array(voice_probs)
+    }
+    dass21_list = validate_and_parse_dass21(dass21_responses)
+    return restore_window_indices(explain_prediction(
+        explain_level(explain), X_physio, dass21_list, fusion_input, np.array(predictions["fusion_probs"]),
+        explain_top_k, explain_budget
+    ), usable)
+
+@record_stage_timings
+def run_explanations(file_content, filename, signal_profile, sampling_rate, dass21_responses, predictions,
+                     explain=None, explain_top_k=None, explain_budget=None):
+    """
+    Explanations for a prediction already returned by run_prediction, for
+    explain_async requests. Features come from the feature store when it
+    holds the recording.
+    
+    Executed in a PredictionPool worker process.
+    """
+    profile = resolve_profile(signal_profile, sampling_rate)
+    X_physio, flags, _ = extract_features_cached(file_content, filename, profile)
+    usable, _, _ = gate_windows(flags, X_physio.shape[0])
+    explanations = explain_scored_windows(
+        np.nan_to_num(X_physio[usable], nan=0.0, posinf=0.0, neginf=0.0), usable, X_physio.shape[0],
+        dass21_responses, predictions, explain, explain_top_k, explain_budget
+    )
+    return {"explanations": explanations, "metadata": {}}
+
+@record_stage_timings
+def run_sample_explanations(explain_sample, dass21_responses, predictions, explain=None, explain_top_k=None,
+                            explain_budget=None):
+    """
+    Explanations for a prediction returned by run_chunked_prediction, from
+    its sample of scored windows, for explain_async requests
+    
+    Executed in a PredictionPool worker process.
+    """
+    explanations = explain_scored_windows(
+        explain_sample["X"], explain_sample["windows"], explain_sample["n_windows"],
+        dass21_responses, predictions, explain, explain_top_k, explain_budget
     )
+    return {"explanations": explanations, "metadata": {}}
+
+def iter_window_predictions(columns, n_samples, profile, dass21_probs=None, voice_probs=None, totals=None):
+    """Per-window predictions, one batch of windows at a time as features are extracted
+    
+    Yields dicts of per-window arrays (window, start_sec, end_sec, physio_probs
+    and, with DASS-21 probabilities, fusion_probs). totals, if given, collects
+    the window count and the sum of physio_probs for a summary.
+    """
+    physio_predictor = components.get("physio_predictor")
+    for start, X in iter_batch_features(columns, n_samples, stride_size=profile.stride_size,
+                                        batch_size=WINDOW_STREAM_CFG["batch_size"]):
+        X = np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+        check_feature_dimensions(X, physio_predictor)
+        with stage("predict_physio"):
+            physio_probs = physio_predictor.predict_proba(X)
+        window = np.arange(start, start + len(X))
+        batch = {
+            "window": window,
+            "start_sec": window * profile.stride_sec,
+            "end_sec": window * profile.stride_sec + CFG["window_sec"],
+            "physio_probs": physio_probs
+        }
+        if dass21_probs is not None:
+            with stage("fusion"):
+                batch["fusion_probs"] = fusion_model.predict_proba_batch(
+                    physio_probs, np.tile(dass21_probs, (len(X), 1)), np.tile(voice_probs, (len(X), 1))
+                )
+        if totals is not None:
+            totals["windows"] = totals.get("windows", 0) + len(X)
+            totals["physio_probs_sum"] = totals.get("physio_probs_sum", 0.0) + physio_probs.sum(axis=0)
+        yield batch
+
+def _find_zip_member(archive, filename):
+    """Resolve a subject's file name inside the archive, by path or base name"""
+    names = [name for name in archive.namelist() if not name.endswith('/')]
+    if filename in names:
+        return filename
+    matches = [name for name in names if name.rsplit('/', 1)[-1] == filename]
+    if len(matches) == 1:
+        return matches[0]
+    raise ValueError(f"File '{filename}' not found in archive" if not matches
+                     else f"File name '{filename}' is ambiguous in archive")
+
+@record_stage_timings
+def run_batch_prediction(archive_source, subjects_json, include_explanations=False):
+    """
+    Score many subjects at once: features for every subject are extracted in
+    one pass, each model is called once on the stacked matrices and the
+    fusion model fuses all subjects together
+    
+    archive_source is the zip archive's bytes, or the path it was spooled to.
+    Members of at least UPLOAD_CHUNKED_MIN_MB are extracted to a spool file
+    and scored chunk by chunk, like large /predict uploads.
+    
+    Executed in a PredictionPool worker process.
+    """
+    try:
+        subjects = json.loads(subjects_json)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"subjects must be a JSON array: {e}")
+    if not isinstance(subjects, list) or not subjects:
+        raise ValueError("subjects must be a non-empty JSON array")
+    
+    try:
+        if isinstance(archive_source, (bytes, bytearray, memoryview)):
+            archive_source = io.BytesIO(archive_source)
+        archive = zipfile.ZipFile(archive_source)
+    except zipfile.BadZipFile:
+        raise ValueError("physiological_files must be a zip archive of CSV files")
     
-    print("All models loaded successfully")
+    physio_predictor = components.get("physio_predictor")
     
-    # Initialize XAI explainers with some background data
-    # Note: In production, you would need actual background data
-    dummy_physio_data = np.random.rand(100, len(ALL_FEATURE_NAMES))
-    dummy_dass21_data = np.random.rand(100, 7) * 3
+    def predict_physio(X):
+        check_feature_dimensions(X, physio_predictor)
+        with stage("predict_physio"):
+            return physio_predictor.predict_proba(X)
+    
+    # === Validate subjects and extract features ===
+    results = [None] * len(subjects)
+    valid = []
+    with archive:
+        for i, subject in enumerate(subjects):
+            subject_id = str(i)
+            try:
+                if not isinstance(subject, dict) or "file" not in subject:
+                    raise ValueError("Each subject needs at least 'file' and 'dass21_responses'")
+                subject_id = str(subject.get("subject_id", subject["file"].rsplit('.', 1)[0]))
+                
+                dass21_responses = subject.get("dass21_responses")
+                if dass21_responses is None:
+                    raise ValueError("Missing dass21_responses")
+                if not isinstance(dass21_responses, str):
+                    dass21_responses = json.dumps(dass21_responses)
+                dass21_list = validate_and_parse_dass21(dass21_responses)
+                
+                voice_probabilities = subject.get("voice_probabilities")
+                if voice_probabilities:
+                    if not isinstance(voice_probabilities, str):
+                        voice_probabilities = json.dumps(voice_probabilities)
+                    voice_probs = np.array(validate_and_parse_voice_probs(voice_probabilities))
+                else:
+                    voice_probs = np.array([0.33, 0.34, 0.33])  # Default uniform distribution
+                
+                profile = resolve_profile(subject.get("signal_profile"), subject.get("sampling_rate"))
+                member = _find_zip_member(archive, subject["file"])
+                entry = {
+                    "index": i, "subject_id": subject_id, "dass21_list": dass21_list, "voice_probs": voice_probs,
+                    "voice_provided": bool(voice_probabilities), "profile": profile, "upload_chunked": False
+                }
+                if use_chunked(archive.getinfo(member).file_size, member):
+                    # Scored here, chunk by chunk, instead of in the stacked model call
+                    path = spool_member(archive, member)
+                    try:
+                        sample = WindowSample(XAI_CFG["max_windows"], seed=XAI_CFG["seed"]) if include_explanations else None
+                        physio = score_upload(path, profile, predict_physio, sample=sample)
+                    finally:
+                        os.remove(path)
+                    entry.update({
+                        "X_physio": None, "physio_probs": physio["physio_probs"], "explain_X": physio.get("explain_X"),
+                        "n_windows": physio["n_windows"], "n_scored": physio["n_scored"],
+                        "signal_quality": physio["signal_quality"], "feature_cache_hit": False, "upload_chunked": True
+                    })
+                else:
+                    X_physio, flags, feature_cache_hit = extract_features_cached(archive.read(member), member, profile)
+                    n_windows = X_physio.shape[0]
+                    usable, window_weights, signal_quality = gate_windows(flags, n_windows)
+                    X_physio = np.nan_to_num(X_physio[usable], nan=0.0, posinf=0.0, neginf=0.0)
+                    check_feature_dimensions(X_physio, physio_predictor)
+                    entry.update({
+                        "X_physio": X_physio, "explain_X": X_physio, "weights": window_weights,
+                        "n_windows": n_windows, "n_scored": X_physio.shape[0],
+                        "signal_quality": signal_quality, "feature_cache_hit": feature_cache_hit
+                    })
+                valid.append(entry)
+            except Exception as e:
+                logger.info(f"Subject {subject_id} failed: {e}", extra={"subject_id": subject_id})
+                results[i] = {
+                    "subject_id": subject_id,
+                    "success": False,
+                    "error": "Validation Error",
+                    "message": str(e),
+                    "error_type": "validation"
+                }
     
-    xai_explainer.setup_physio_explainer(physio_model, dummy_physio_data)
-    xai_explainer.setup_dass21_explainer(dass21_model, dass21_scaler, dummy_dass21_data)
+    if valid:
+        # === One model call per modality over all subjects ===
+        stacked = [entry for entry in valid if entry["X_physio"] is not None]
+        if stacked:
+            with stage("predict_physio"):
+                physio_probs_all = physio_predictor.predict_proba(np.vstack([entry["X_physio"] for entry in stacked]))
+            split_points = np.cumsum([entry["n_scored"] for entry in stacked])[:-1]
+            for entry, p in zip(stacked, np.split(physio_probs_all, split_points)):
+                entry["physio_probs"] = np.average(p, axis=0, weights=entry["weights"])
+        physio_probs = np.array([entry["physio_probs"] for entry in valid])
+        
+        with stage("predict_dass21"):
+            dass21_probs = predict_dass21_proba_batch([entry["dass21_list"] for entry in valid])
+        voice_probs = np.array([entry["voice_probs"] for entry in valid])
+        
+        # === Fuse all subjects at once ===
+        with stage("fusion"):
+            fusion_X = np.hstack([physio_probs, dass21_probs, voice_probs])
+            fusion_probs = fusion_model.predict_proba_from_features(fusion_X)
+            fusion_preds = np.argmax(fusion_probs, axis=1)
+        
+        if include_explanations:
+            components.get("xai_explainer")  # Registers the models with the explainer
+        for row, entry in enumerate(valid):
+            fusion_input = {"phys": physio_probs[row], "text": dass21_probs[row], "voice": voice_probs[row]}
+            fusion_pred = int(fusion_preds[row])
+            with stage("explain_fusion"):
+                explanations = {
+                    "fusion": xai_explainer.explain_fusion_decision(fusion_input, fusion_probs[row])
+                }
+            if include_explanations:
+                with stage("explain_physio"):
+                    explanations["physiological"] = xai_explainer.explain_physio_prediction(entry["explain_X"])
+                with stage("explain_dass21"):
+                    explanations["questionnaire"] = xai_explainer.explain_dass21_prediction(np.array([entry["dass21_list"]]))
+            
+            results[entry["index"]] = {
+                "subject_id": entry["subject_id"],
+                "success": True,
+                "predictions": {
+                    "physio_probs": physio_probs[row].tolist(),
+                    "dass21_probs": dass21_probs[row].tolist(),
+                    "voice_probs": voice_probs[row].tolist() if entry["voice_provided"] else None,
+                    "fusion_probs": fusion_probs[row].tolist(),
+                    "fusion_pred": fusion_pred,
+                    "prediction_label": ["Low", "Medium", "High"][fusion_pred],
+                    "confidence": float(np.max(fusion_probs[row]))
+                },
+                "explanations": explanations,
+                "metadata": {
+                    "physio_windows": entry["n_windows"],
+                    "physio_windows_scored": entry["n_scored"],
+                    "physio_features": len(ALL_FEATURE_NAMES),
+                    "signal_quality": entry["signal_quality"],
+                    "feature_cache_hit": entry["feature_cache_hit"],
+                    "upload_chunked": entry["upload_chunked"],
+                    "signal_profile": entry["profile"].as_dict(),
+                    "dass21_values": entry["dass21_list"],
+                    "voice_provided": entry["voice_provided"]
+                }
+            }
     
-except Exception as e:
-    print(f"Error loading models: {e}")
-    raise
+    succeeded = len(valid)
+    return {
+        "success": succeeded > 0,
+        "results": results,
+        "metadata": {
+            "subjects": len(subjects),
+            "succeeded": succeeded,
+            "failed": len(subjects) - succeeded,
+            "total_windows": int(sum(entry["n_windows"] for entry in valid))
+        }
+    }
+
+
+def _record_request(endpoint, start, result=None, upload_read_ms=None):
+    """Record a completed request's latency, stage breakdown and window count in the metrics"""
+    metrics.observe("request_latency_seconds", time.perf_counter() - start, endpoint=endpoint)
+    if result is None:
+        return
+    metadata = result["metadata"]
+    if upload_read_ms is not None:
+        metadata["stage_timings_ms"] = {"upload_read": round(upload_read_ms, 3), **metadata.get("stage_timings_ms", {})}
+    metrics.observe_stages(metadata.get("stage_timings_ms", {}))
+    windows = metadata.get("physio_windows", metadata.get("total_windows", 0))
+    metrics.inc("windows_total", windows, endpoint=endpoint)
+    quality = metadata.get("signal_quality") or {}
+    for sensor, report in quality.get("sensors", {}).items():
+        if report["present"]:
+            metrics.inc("quality_failed_windows_total", quality["windows_total"] - report["passed_windows"],
+                        endpoint=endpoint, sensor=sensor)
+
+def _record_error(endpoint, start, error_type):
+    metrics.inc("errors_total", endpoint=endpoint, error_type=error_type)
+    metrics.observe("request_latency_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: request, error and window counts, and latency
+    histograms per request and per pipeline stage
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the models and explainers are loaded, 503 otherwise
+
+    In lazy STARTUP_MODE the server is ready as soon as nothing has failed to load.
+    """
+    status = components.status()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
 
 
+@app.get("/memory")
+async def memory():
+    """
+    Memory of the serving process and each prediction worker: resident (RSS),
+    proportional (PSS), shared and private, in MB
+    """
+    processes = [("server", os.getpid())] + [("worker", pid) for pid in prediction_pool.pids()]
+    return {
+        "shared_models": SHARING_CFG["enabled"],
+        "mmap": SHARING_CFG["mmap"],
+        "gc_frozen_objects": gc.get_freeze_count(),
+        **memory_summary(processes)
+    }
+
+@app.get("/profiles")
+async def profiles():
+    """Signal profiles a recording can be sent with, and the model rate they are resampled to"""
+    return {
+        "default": PROFILE_CFG["default"],
+        "target_fs": CFG["fs"],
+        "profiles": available_profiles()
+    }
+
 
 @app.post("/predict")
 async def predict(
-    physiological_file: UploadFile = File(..., description="CSV file with physiological data"),
+    physiological_file: UploadFile = File(..., description="Physiological data: CSV, .npy, .npz, Parquet or Arrow IPC"),
     dass21_responses: str = Form(..., description="DASS-21 responses as comma-separated values or JSON array"),
-    voice_probabilities: Optional[str] = Form(None, description="Voice probabilities as comma-separated values or JSON array (optional)")
+    voice_probabilities: Optional[str] = Form(None, description="Voice probabilities as comma-separated values or JSON array (optional)"),
+    signal_profile: Optional[str] = Form(None, description="Signal profile of the recording device (optional)"),
+    sampling_rate: Optional[float] = Form(None, description="Sampling rate of the recording in Hz, overriding the profile's (optional)"),
+    explain: Optional[str] = Form(None, description="Explanation level: none, fusion, top_k or full"),
+    explain_top_k: Optional[int] = Form(None, description="Features per modality at the top_k level"),
+    explain_async: bool = Form(False, description="Return the prediction now and the explanations later under /explanations/{job_id}"),
+    explain_windows: Optional[str] = Form(None, description="Window indices to attribute individually, comma-separated or JSON array"),
+    explain_max_windows: Optional[int] = Form(None, description="Most windows SHAP averages over (capped by the server)"),
+    explain_time_budget: Optional[float] = Form(None, description="Seconds of SHAP time for the physiological explanation (capped by the server)")
 ):
     """
     Predict stress level using physiological data, DASS-21 responses, and optional voice probabilities
     
     Args:
-        physiological_file: CSV file with columns: ECG, EDA, EMG, Temp
+        physiological_file: CSV file with columns: ECG, EDA, EMG, Temp, or the same
+            columns as .npy/.npz arrays, Parquet or Arrow IPC
         dass21_responses: 7 values between 0-3, format: "[1,2,0,3,1,2,0]" or "1,2,0,3,1,2,0"
         voice_probabilities: 3 probabilities for [Low, Medium, High] classes, format: "[0.33,0.34,0.33]" or "0.33,0.34,0.33"
+        signal_profile: e.g. "wesad_chest" for 700 Hz chest recordings; recordings
+            not at the model rate are resampled on ingest
+        sampling_rate: source rate in Hz, for devices without a profile
+        explain: "none" skips explanations, "fusion" only explains the fusion
+            decision, "top_k" (default) adds cached top-k SHAP features and "full"
+            the SHAP importance of every feature
+        explain_async: with an explain level that uses SHAP, the response carries
+            a job ID instead of explanations; poll /explanations/{job_id}
+        explain_windows, explain_max_windows, explain_time_budget: per-window
+            attributions and SHAP budgets for long recordings
     
     Returns:
         JSON with individual model probabilities, fusion results, predictions, and explanations
     """
-    print("\n" + "="*50)
-    print("🚀 Starting prediction request")
-    print("="*50)
+    metrics.inc("requests_total", endpoint="/predict")
+    start = time.perf_counter()
     
     try:
         # === Validate File ===
-        if not physiological_file.filename.endswith('.csv'):
-            raise ValueError("Physiological file must be a CSV file")
+        file_format(physiological_file.filename)
+        resolve_profile(signal_profile, sampling_rate)
+        level = explain_level(explain)
+        deferred = explain_async and level in ("top_k", "full")
+        explain_budget = {
+            "max_windows": explain_max_windows,
+            "time_budget_sec": explain_time_budget,
+            "windows": validate_and_parse_windows(explain_windows) if explain_windows else None
+        }
+        if explain_max_windows is not None and explain_max_windows < 1:
+            raise ValueError(f"explain_max_windows must be at least 1, got {explain_max_windows}")
+        if explain_time_budget is not None and explain_time_budget <= 0:
+            raise ValueError(f"explain_time_budget must be positive, got {explain_time_budget}")
         
         # === Process Physiological Data ===
-        print("📊 Processing physiological data...")
-        file_content = await physiological_file.read()
-        buffer = io.StringIO(file_content.decode('utf-8'))
-        
-        try:
-            X_physio = process_csv_data(buffer)
-            X_physio = np.nan_to_num(X_physio, nan=0.0, posinf=0.0, neginf=0.0)
-            print(f"✅ Physiological data shape: {X_physio.shape}")
-            
-            if X_physio.shape[0] == 0:
-                raise ValueError("No valid windows extracted from physiological data")
-                
-        except Exception as e:
-            print(f"❌ Physiological data processing failed: {e}")
-            raise ValueError(f"Failed to process physiological data: {str(e)}")
+        read_start = time.perf_counter()
+        explain_sample = None
+        if use_chunked(physiological_file.size, physiological_file.filename):
+            # Large upload: spooled to disk and read back chunk by chunk in the worker
+            path = await spool_upload(physiological_file)
+            upload_read_ms = (time.perf_counter() - read_start) * 1000
+            try:
+                result = await prediction_pool.run(
+                    run_chunked_prediction, path, dass21_responses, voice_probabilities,
+                    signal_profile, sampling_rate, "none" if deferred else level, explain_top_k,
+                    explain_budget, deferred
+                )
+            finally:
+                os.remove(path)
+            explain_sample = result.pop("explain_sample", None)
+        else:
+            file_content = await physiological_file.read()
+            upload_read_ms = (time.perf_counter() - read_start) * 1000
+            if INFERENCE_BATCH_CFG["enabled"] and (deferred or level in ("none", "fusion")):
+                result = await predict_batched(
+                    file_content, dass21_responses, voice_probabilities,
+                    physiological_file.filename, signal_profile, sampling_rate,
+                    "none" if deferred else level
+                )
+            else:
+                result = await prediction_pool.run(
+                    run_prediction, file_content, dass21_responses, voice_probabilities,
+                    physiological_file.filename, signal_profile, sampling_rate,
+                    "none" if deferred else level, explain_top_k, explain_budget
+                )
 
-        # === Physiological Prediction ===
-        try:
-            physio_probs = physio_model.predict_proba(X_physio)
-            # Average across all windows
-            physio_probs_avg = physio_probs.mean(axis=0)
-            print(f"✅ Physiological probabilities: {physio_probs_avg}")
-        except Exception as e:
-            print(f"❌ Physiological prediction failed: {e}")
-            raise ValueError(f"Physiological model prediction failed: {str(e)}")
+        # === Deferred Explanations ===
+        if deferred:
+            # Refuse now rather than issue a job ID for a job that cannot start
+            explanation_jobs.check_capacity()
+            prediction_pool.check_capacity()
+            if explain_sample is not None:
+                job = prediction_pool.run(
+                    run_sample_explanations, explain_sample, dass21_responses, result["predictions"],
+                    level, explain_top_k, explain_budget
+                )
+            else:
+                job = prediction_pool.run(
+                    run_explanations, file_content, physiological_file.filename, signal_profile, sampling_rate,
+                    dass21_responses, result["predictions"], level, explain_top_k, explain_budget
+                )
+            job_id = explanation_jobs.submit(job, level)
+            result["explanations"] = {"job_id": job_id, "status": "pending", "url": f"/explanations/{job_id}"}
+            result["metadata"]["explain"] = level
 
-        # === Process DASS-21 Data ===
-        print("\n📋 Processing DASS-21 responses...")
-        try:
-            dass21_list = validate_and_parse_dass21(dass21_responses)
-            
-            # Scale DASS-21 responses
-            dass21_X = dass21_scaler.transform([dass21_list])
-            dass21_probs = dass21_model.predict_proba(dass21_X)[0]
-            print(f"✅ DASS-21 probabilities: {dass21_probs}")
-            
-        except Exception as e:
-            print(f"❌ DASS-21 processing failed: {e}")
-            raise ValueError(f"DASS-21 processing failed: {str(e)}")
+        # Recorded once the request can no longer fail, so a 503 is not counted twice
+        _record_request("/predict", start, result, upload_read_ms)
+        predictions = result["predictions"]
+        logger.info("Prediction complete", extra={
+            "windows": result["metadata"]["physio_windows"],
+            "prediction": predictions["prediction_label"],
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Prediction result: {json.dumps(result)}")
 
-        # === Process Voice Data (Optional) ===
-        voice_probs = None
-        if voice_probabilities:
-            print("\n🎤 Processing voice probabilities...")
-            try:
-                voice_probs = validate_and_parse_voice_probs(voice_probabilities)
-                voice_probs = np.array(voice_probs)
-                print(f"✅ Voice probabilities: {voice_probs}")
-            except Exception as e:
-                print(f"❌ Voice processing failed: {e}")
-                raise ValueError(f"Voice processing failed: {str(e)}")
-        else:
-            print("\n🎤 No voice probabilities provided, using default uniform distribution")
-            voice_probs = np.array([0.33, 0.34, 0.33])  # Default uniform distribution
+        return JSONResponse(content=result)
 
-        # === Fusion ===
-        print("\n🔄 Performing fusion...")
-        try:
-            fusion_input = {
-                "phys": physio_probs_avg,
-                "text": dass21_probs,
-                "voice": voice_probs
-            }
-            
-            fusion_probs = fusion_model.predict_proba(fusion_input)
-            fusion_pred = int(fusion_model.predict(fusion_input))
-            
-            print(f"✅ Fusion probabilities: {fusion_probs}")
-            print(f"✅ Fusion prediction: {fusion_pred}")
-            
-        except Exception as e:
-            print(f"❌ Fusion failed: {e}")
-            raise ValueError(f"Fusion model failed: {str(e)}")
+    except ServerBusyError as busy:
+        error_response = {
+            "success": False,
+            "error": "Server Busy",
+            "message": str(busy),
+            "error_type": "overloaded"
+        }
+        _record_error("/predict", start, "overloaded")
+        logger.warning(f"Server Busy: {busy}")
+        return JSONResponse(content=error_response, status_code=503, headers={"Retry-After": "1"})
+    
+    except ValueError as ve:
+        error_response = {
+            "success": False,
+            "error": "Validation Error",
+            "message": str(ve),
+            "error_type": "validation"
+        }
+        _record_error("/predict", start, "validation")
+        logger.warning(f"Validation Error: {ve}")
+        return JSONResponse(content=error_response, status_code=422)
+    
+    except Exception as e:
+        error_response = {
+            "success": False,
+            "error": "Server Error",
+            "message": str(e),
+            "error_type": "server"
+        }
+        _record_error("/predict", start, "server")
+        logger.exception(f"Unexpected Error: {e}")
+        return JSONResponse(content=error_response, status_code=500)
 
-        # === Explainability ===
-        print("\n🔍 Generating explanations...")
+
+@app.post("/predict/windows")
+async def predict_windows(
+    physiological_file: UploadFile = File(..., description="Physiological data: CSV, .npy, .npz, Parquet or Arrow IPC"),
+    dass21_responses: Optional[str] = Form(None, description="DASS-21 responses, to add per-window fusion (optional)"),
+    voice_probabilities: Optional[str] = Form(None, description="Voice probabilities as comma-separated values or JSON array (optional)"),
+    signal_profile: Optional[str] = Form(None, description="Signal profile of the recording device (optional)"),
+    sampling_rate: Optional[float] = Form(None, description="Sampling rate of the recording in Hz, overriding the profile's (optional)"),
+    output: str = Form("ndjson", description="ndjson or arrow")
+):
+    """
+    Stream a prediction for every window of a recording while it is being processed
+    
+    Windows are extracted and scored in batches of WINDOW_STREAM_CFG["batch_size"],
+    and each batch is written out as soon as it is scored, with start_sec and
+    end_sec derived from the stride. With output=ndjson, every line is one window
+    and the last line is a summary with the averaged prediction. With
+    output=arrow, the body is an Arrow IPC stream with one record batch per
+    batch of windows. Explanations are not computed.
+    
+    Errors found before streaming starts return the usual error JSON. Later
+    errors end an NDJSON stream with an error line.
+    """
+    metrics.inc("requests_total", endpoint="/predict/windows")
+    start = time.perf_counter()
+    
+    try:
+        # === Validate Request ===
+        fmt = output_format(output)
+        file_format(physiological_file.filename)
+        profile = resolve_profile(signal_profile, sampling_rate)
+        dass21_probs = voice_probs = None
+        if dass21_responses:
+            dass21_probs = await asyncio.to_thread(predict_dass21_proba, validate_and_parse_dass21(dass21_responses))
+            voice_probs = np.array(validate_and_parse_voice_probs(voice_probabilities) if voice_probabilities
+                                   else [0.33, 0.34, 0.33])  # Default uniform distribution
+        
+        # === Parse the recording before the response starts ===
+        file_content = await physiological_file.read()
+        columns, n_samples = await asyncio.to_thread(load_recording, file_content, physiological_file.filename, profile)
+        del file_content
+    
+    except ValueError as ve:
+        _record_error("/predict/windows", start, "validation")
+        logger.warning(f"Validation Error: {ve}")
+        return JSONResponse(content={
+            "success": False,
+            "error": "Validation Error",
+            "message": str(ve),
+            "error_type": "validation"
+        }, status_code=422)
+    
+    except Exception as e:
+        _record_error("/predict/windows", start, "server")
+        logger.exception(f"Unexpected Error: {e}")
+        return JSONResponse(content={
+            "success": False,
+            "error": "Server Error",
+            "message": str(e),
+            "error_type": "server"
+        }, status_code=500)
+    
+    totals = {}
+    
+    def batches():
         try:
-            # Explain physiological prediction
-            physio_explanation = xai_explainer.explain_physio_prediction(X_physio)
-            
-            # Explain DASS-21 prediction
-            dass21_explanation = xai_explainer.explain_dass21_prediction(np.array([dass21_list]))
-            
-            # Explain fusion decision
-            fusion_explanation = xai_explainer.explain_fusion_decision(fusion_input, fusion_probs)
-            
-            print("✅ Explanations generated successfully")
+            yield from iter_window_predictions(columns, n_samples, profile, dass21_probs, voice_probs, totals)
         except Exception as e:
-            print(f"⚠ Explanation generation failed: {e}")
-            physio_explanation = {"available": False, "error": str(e)}
-            dass21_explanation = {"available": False, "error": str(e)}
-            fusion_explanation = {"available": False, "error": str(e)}
+            metrics.inc("errors_total", endpoint="/predict/windows", error_type="server")
+            logger.exception(f"Window stream failed: {e}")
+            totals["error"] = str(e)
+        else:
+            metrics.observe("request_latency_seconds", time.perf_counter() - start, endpoint="/predict/windows")
+        metrics.inc("windows_total", totals.get("windows", 0), endpoint="/predict/windows")
+    
+    def summary():
+        if "error" in totals:
+            return {"success": False, "error": "Server Error", "message": totals["error"], "error_type": "server"}
+        result = {"success": True, "summary": True, "windows": totals.get("windows", 0), "signal_profile": profile.as_dict()}
+        if totals.get("windows"):
+            physio_probs = totals["physio_probs_sum"] / totals["windows"]
+            result["physio_probs"] = physio_probs.tolist()
+            if dass21_probs is not None:
+                fusion_probs = fusion_model.predict_proba({"phys": physio_probs, "text": dass21_probs, "voice": voice_probs})
+                fusion_pred = int(np.argmax(fusion_probs))
+                result.update({
+                    "fusion_probs": fusion_probs.tolist(),
+                    "fusion_pred": fusion_pred,
+                    "prediction_label": ["Low", "Medium", "High"][fusion_pred]
+                })
+        return result
+    
+    if fmt == "ndjson":
+        body = ndjson_lines(batches(), summary)
+    else:
+        body = arrow_stream(batches(), fusion=dass21_probs is not None, summary=summary)
+    return StreamingResponse(body, media_type=OUTPUT_FORMATS[fmt])
 
-        # === Prepare Result ===
-        result = {
-            "success": True,
-            "predictions": {
-                "physio_probs": physio_probs_avg.tolist(),
-                "dass21_probs": dass21_probs.tolist(),
-                "voice_probs": voice_probs.tolist() if voice_probabilities else None,
-                "fusion_probs": fusion_probs.tolist(),
-                "fusion_pred": fusion_pred,
-                "prediction_label": ["Low", "Medium", "High"][fusion_pred],
-                "confidence": float(np.max(fusion_probs))
-            },
-            "explanations": {
-                "physiological": physio_explanation,
-                "questionnaire": dass21_explanation,
-                "fusion": fusion_explanation
-            },
-            "metadata": {
-                "physio_windows": X_physio.shape[0],
-                "physio_features": X_physio.shape[1],
-                "dass21_values": dass21_list,
-                "voice_provided": voice_probabilities is not None,
-                "modalities_used": ["physiological", "questionnaire", "voice" if voice_probabilities else None]
-            }
-        }
 
-        # Print result to terminal
-        print("\n" + "="*30)
-        print("📊 PREDICTION RESULT")
-        print("="*30)
-        print(json.dumps(result, indent=2))
-        print("="*30)
+@app.get("/explanations/{job_id}")
+async def get_explanations(job_id: str):
+    """
+    Explanations of an explain_async prediction: 202 while pending, 200 once
+    done, failed or cancelled, 404 for unknown or expired job IDs
+    """
+    job = explanation_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={
+            "success": False,
+            "error": "Not Found",
+            "message": f"No explanation job '{job_id}' (jobs expire after they complete)",
+            "error_type": "not_found"
+        }, status_code=404)
+    return JSONResponse(content={"success": job["status"] == "done", **job},
+                        status_code=202 if job["status"] == "pending" else 200)
 
-        return JSONResponse(content=result)
 
+@app.post("/predict/batch")
+async def predict_batch(
+    physiological_files: UploadFile = File(..., description="Zip archive with one physiological file (CSV or binary) per subject"),
+    subjects: str = Form(..., description="JSON array of subjects: file, dass21_responses, optional subject_id, voice_probabilities, signal_profile and sampling_rate"),
+    include_explanations: bool = Form(False, description="Also compute per-subject SHAP explanations")
+):
+    """
+    Predict stress levels for many subjects in one request
+    
+    Args:
+        physiological_files: zip of CSV files with columns: ECG, EDA, EMG, Temp
+        subjects: e.g. '[{"subject_id": "S2", "file": "S2.csv", "dass21_responses": [1,2,0,3,1,2,0],
+                  "voice_probabilities": [0.2,0.5,0.3], "signal_profile": "wesad_chest"}]'
+        include_explanations: SHAP explanations per subject (fusion explanations are always included)
+    
+    Returns:
+        JSON with one result per subject, in request order; subjects that fail
+        validation get an error entry without failing the whole batch
+    """
+    metrics.inc("requests_total", endpoint="/predict/batch")
+    start = time.perf_counter()
+    
+    try:
+        if not physiological_files.filename.endswith('.zip'):
+            raise ValueError("physiological_files must be a zip archive")
+        
+        read_start = time.perf_counter()
+        if use_chunked(physiological_files.size, physiological_files.filename):
+            # Large archive: spooled to disk and opened from there in the worker
+            path = await spool_upload(physiological_files)
+            upload_read_ms = (time.perf_counter() - read_start) * 1000
+            try:
+                result = await prediction_pool.run(run_batch_prediction, path, subjects, include_explanations)
+            finally:
+                os.remove(path)
+        else:
+            zip_content = await physiological_files.read()
+            upload_read_ms = (time.perf_counter() - read_start) * 1000
+            result = await prediction_pool.run(
+                run_batch_prediction, zip_content, subjects, include_explanations
+            )
+        _record_request("/predict/batch", start, result, upload_read_ms)
+        
+        metadata = result["metadata"]
+        logger.info("Batch complete", extra={
+            "subjects": metadata["subjects"],
+            "succeeded": metadata["succeeded"],
+            "windows": metadata["total_windows"],
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+        
+        return JSONResponse(content=result, status_code=200 if result["success"] else 422)
+    
+    except ServerBusyError as busy:
+        error_response = {
+            "success": False,
+            "error": "Server Busy",
+            "message": str(busy),
+            "error_type": "overloaded"
+        }
+        _record_error("/predict/batch", start, "overloaded")
+        logger.warning(f"Server Busy: {busy}")
+        return JSONResponse(content=error_response, status_code=503, headers={"Retry-After": "1"})
+    
     except ValueError as ve:
         error_response = {
             "success": False,
@@ -853,7 +1411,8 @@ async def predict(
             "message": str(ve),
             "error_type": "validation"
         }
-        print(f"❌ Validation Error: {str(ve)}")
+        _record_error("/predict/batch", start, "validation")
+        logger.warning(f"Validation Error: {ve}")
         return JSONResponse(content=error_response, status_code=422)
     
     except Exception as e:
@@ -863,8 +1422,108 @@ async def predict(
             "message": str(e),
             "error_type": "server"
         }
-        print(f"❌ Unexpected Error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        _record_error("/predict/batch", start, "server")
+        logger.exception(f"Unexpected Error: {e}")
         return JSONResponse(content=error_response, status_code=500)
 
+
+@app.websocket("/predict/stream")
+async def predict_stream(websocket: WebSocket):
+    """
+    Stream physiological samples and receive a prediction for every completed window
+    
+    Protocol (JSON messages):
+        1. Client sends the session config:
+           {"dass21_responses": [1,2,0,3,1,2,0], "voice_probabilities": [0.33,0.34,0.33]}
+           voice_probabilities is optional, as is signal_profile. Samples must be
+           sent at the model rate (fs in the ready message); streams are not resampled.
+        2. Client sends sample chunks of any length:
+           {"samples": {"ECG": [...], "EDA": [...], "EMG": [...], "Temp": [...]}}
+           The server replies with one message per newly completed window containing
+           per-window and running-average physiological and fusion probabilities.
+        3. Client sends {"end": true} to receive the session summary and close.
+    """
+    await websocket.accept()
+    metrics.inc("requests_total", endpoint="/predict/stream")
+    logger.info("Streaming session opened")
+    
+    try:
+        # === Session Setup ===
+        config = await websocket.receive_json()
+        dass21_responses = config.get("dass21_responses")
+        if dass21_responses is None:
+            raise ValueError("Session config must include dass21_responses")
+        if not isinstance(dass21_responses, str):
+            dass21_responses = json.dumps(dass21_responses)
+        dass21_list = validate_and_parse_dass21(dass21_responses)
+        dass21_probs = await asyncio.to_thread(predict_dass21_proba, dass21_list)
+        
+        voice_probabilities = config.get("voice_probabilities")
+        if voice_probabilities:
+            if not isinstance(voice_probabilities, str):
+                voice_probabilities = json.dumps(voice_probabilities)
+            voice_probs = np.array(validate_and_parse_voice_probs(voice_probabilities))
+        else:
+            voice_probs = np.array([0.33, 0.34, 0.33])  # Default uniform distribution
+        
+        profile = resolve_profile(config.get("signal_profile"), config.get("sampling_rate"))
+        if profile.needs_resampling:
+            raise ValueError(
+                f"Streams must be sent at {CFG['fs']} Hz; profile '{profile.name}' records at {profile.source_fs} Hz"
+            )
+        
+        # Loading the model (lazy startup) must not block the event loop either
+        physio_predictor = await asyncio.to_thread(components.get, "physio_predictor")
+        session = StreamingSession(physio_predictor, fusion_model, dass21_probs, voice_probs, profile)
+        await websocket.send_json({
+            "success": True,
+            "ready": True,
+            "window_sec": CFG["window_sec"],
+            "stride_sec": profile.stride_sec,
+            "fs": CFG["fs"],
+            "sensors": CFG["sensors"],
+            "dass21_probs": dass21_probs.tolist()
+        })
+        
+        # === Sample Loop ===
+        while True:
+            message = await websocket.receive_json()
+            if message.get("end"):
+                await websocket.send_json({"success": True, "done": True, **session.summary()})
+                break
+            
+            push_start = time.perf_counter()
+            window_results = await asyncio.to_thread(session.push, message.get("samples"))
+            if window_results:
+                metrics.observe("stage_latency_seconds", time.perf_counter() - push_start, stage="stream_push")
+                metrics.inc("windows_total", len(window_results), endpoint="/predict/stream")
+            for window_result in window_results:
+                await websocket.send_json({"success": True, **window_result})
+        
+        await websocket.close()
+        logger.info("Streaming session closed", extra={"windows": session.windows_processed})
+    
+    except WebSocketDisconnect:
+        logger.info("Streaming client disconnected")
+    
+    except ValueError as ve:
+        metrics.inc("errors_total", endpoint="/predict/stream", error_type="validation")
+        logger.warning(f"Streaming Validation Error: {ve}")
+        await websocket.send_json({
+            "success": False,
+            "error": "Validation Error",
+            "message": str(ve),
+            "error_type": "validation"
+        })
+        await websocket.close(code=1008)
+    
+    except Exception as e:
+        metrics.inc("errors_total", endpoint="/predict/stream", error_type="server")
+        logger.exception(f"Unexpected Streaming Error: {e}")
+        await websocket.send_json({
+            "success": False,
+            "error": "Server Error",
+            "message": str(e),
+            "error_type": "server"
+        })
+        await websocket.close(code=1011)
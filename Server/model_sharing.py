@@ -0,0 +1,111 @@
+"""Copy-on-write sharing of models between serving processes
+
+With SHARED_MODELS=1 the serving process loads every model and SHAP
+explainer before it forks its prediction workers (or before gunicorn
+--preload forks its workers), so their memory pages are shared instead of
+copied per worker. gc.freeze() moves everything loaded so far out of the
+collector's reach. Without it, a collection in a worker would write to the
+object headers and copy those pages into the worker.
+
+Reference counting still touches object headers, but large numpy buffers are
+never written and stay shared. With MODEL_MMAP=1, joblib models are loaded
+with mmap_mode="r" from an uncompressed copy under MODEL_MMAP_DIR. Their
+arrays are then pages of the page cache, shared by every process on the
+host, including spawned workers and separate containers. Arrays that a
+class copies while it is unpickled, such as the nodes of sklearn trees,
+still end up in private memory.
+
+memory_report() reads /proc/<pid>/smaps_rollup (Linux) to show how much of
+each process's resident memory is actually shared.
+"""
+import gc
+import glob
+import os
+import joblib
+
+from observability import get_logger
+
+logger = get_logger("model_sharing")
+
+# Model sharing configuration
+SHARING_CFG = {
+    # Load everything before forking workers, freeze the GC and fork the pool
+    "enabled": os.environ.get("SHARED_MODELS", "0") != "0",
+    # Memory-map model arrays from uncompressed joblib copies (default: with SHARED_MODELS)
+    "mmap": os.environ.get("MODEL_MMAP", os.environ.get("SHARED_MODELS", "0")) != "0",
+    "mmap_dir": os.environ.get("MODEL_MMAP_DIR", "models/mmap"),
+}
+
+# The physiological model served by main.py and scored by batch_score.py
+PHYSIO_MODEL_PATH = "models/regularized_global_model.pkl"
+
+def mmap_artifact(path, mmap_dir=None):
+    """Uncompressed joblib copy of a model file, rebuilt when the source changes
+
+    joblib can only memory-map arrays stored uncompressed, so the copy is
+    keyed by the source's size and modification time.
+    """
+    mmap_dir = mmap_dir or SHARING_CFG["mmap_dir"]
+    stat = os.stat(path)
+    base = os.path.splitext(os.path.basename(path))[0]
+    target = os.path.join(mmap_dir, f"{base}-{stat.st_size}-{int(stat.st_mtime)}.joblib")
+    if os.path.exists(target):
+        return target
+    os.makedirs(mmap_dir, exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    joblib.dump(joblib.load(path), tmp_path)
+    os.replace(tmp_path, target)
+    # Copies of earlier versions of the same file
+    for stale in glob.glob(os.path.join(mmap_dir, f"{base}-*.joblib")):
+        if stale != target:
+            os.remove(stale)
+    logger.info(f"Wrote memory-mappable copy of {path}", extra={"artifact": target})
+    return target
+
+def load_model(path):
+    """joblib.load, memory-mapping the model's arrays when MODEL_MMAP is on"""
+    if not SHARING_CFG["mmap"]:
+        return joblib.load(path)
+    return joblib.load(mmap_artifact(path), mmap_mode="r")
+
+def freeze():
+    """Move every tracked object to the permanent generation; returns how many are frozen"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+def memory_report(pid=None):
+    """Resident, proportional, shared and private memory of a process, in MB
+
+    pss_mb splits shared pages between the processes that map them, so PSS
+    summed over processes is their real footprint, while summed RSS counts
+    shared pages once per process.
+    """
+    path = f"/proc/{pid or 'self'}/smaps_rollup"
+    try:
+        with open(path) as f:
+            fields = dict(line.split(":", 1) for line in f if line.count(":") == 1 and line.rstrip().endswith("kB"))
+    except OSError as e:
+        return {"available": False, "error": str(e)}
+    kb = {name: int(value.split()[0]) for name, value in fields.items()}
+    rss = kb.get("Rss", 0)
+    shared = kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)
+    return {
+        "available": True,
+        "rss_mb": round(rss / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+        "private_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+        "swap_mb": round(kb.get("Swap", 0) / 1024, 1),
+        "shared_fraction": round(shared / rss, 3) if rss else 0.0
+    }
+
+def memory_summary(processes):
+    """memory_report of every (role, pid) pair, with RSS and PSS totals"""
+    reports = [{"role": role, "pid": pid, **memory_report(pid)} for role, pid in processes]
+    available = [r for r in reports if r["available"]]
+    return {
+        "processes": reports,
+        "total_rss_mb": round(sum(r["rss_mb"] for r in available), 1),
+        "total_pss_mb": round(sum(r["pss_mb"] for r in available), 1)
+    }
@@ -0,0 +1,256 @@
+"""Structured logging, per-stage timings and Prometheus metrics
+
+Pipeline stages are timed with `with stage("features_freq"): ...` wherever
+they run. Timings accumulate into the StageTimings of the current request
+(held in a context variable, so nothing is threaded through call signatures)
+and are returned in the response metadata. The serving process records them
+into latency histograms exposed at /metrics, which also covers work done in
+pool workers, since their timings travel back with the result.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Observability configuration
+OBS_CFG = {
+    "log_level": os.environ.get("LOG_LEVEL", "INFO").upper(),
+    # "text" for humans, "json" for one JSON object per line
+    "log_format": os.environ.get("LOG_FORMAT", "text"),
+    # Set to 0 to turn stage timers and metrics into no-ops
+    "metrics_enabled": os.environ.get("METRICS_ENABLED", "1") != "0",
+}
+
+# Histogram buckets in seconds, from sub-millisecond stages to long recordings
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets for histograms of counts rather than durations
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+METRIC_PREFIX = "safespace_"
+
+METRIC_HELP = {
+    "requests_total": ("counter", "Requests received, by endpoint"),
+    "errors_total": ("counter", "Failed requests, by endpoint and error_type"),
+    "windows_total": ("counter", "Physiological windows scored, by endpoint"),
+    "quality_failed_windows_total": ("counter", "Windows failing a signal-quality check, by endpoint and sensor"),
+    "explanation_jobs_total": ("counter", "Finished explain_async jobs, by status"),
+    "request_latency_seconds": ("histogram", "End-to-end request latency, by endpoint"),
+    "stage_latency_seconds": ("histogram", "Latency of each pipeline stage, by stage"),
+    "inference_queue_depth": ("gauge", "Requests waiting for a micro-batched model call, by model"),
+    "inference_batch_requests": ("histogram", "Requests coalesced into one model call, by model"),
+    "inference_batch_rows": ("histogram", "Rows in one micro-batched model call, by model"),
+}
+
+# Histograms whose buckets are not LATENCY_BUCKETS
+METRIC_BUCKETS = {
+    "inference_batch_requests": SIZE_BUCKETS,
+    "inference_batch_rows": SIZE_BUCKETS,
+}
+
+# === Logging ===
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def _record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_record_fields(record)
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with `extra` fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+def configure_logging(level=None, fmt=None):
+    """Install the handler on the "safespace" logger (idempotent)"""
+    root = logging.getLogger("safespace")
+    root.setLevel(level or OBS_CFG["log_level"])
+    root.propagate = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if (fmt or OBS_CFG["log_format"]) == "json" else TextFormatter())
+    root.handlers[:] = [handler]
+    return root
+
+def get_logger(name):
+    """Logger under the "safespace" hierarchy; configures logging on first use"""
+    if not logging.getLogger("safespace").handlers:
+        configure_logging()
+    return logging.getLogger(f"safespace.{name}")
+
+# === Stage timings ===
+
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+class StageTimings:
+    """Wall time per stage for one request; stages entered repeatedly accumulate
+
+    Use as a context manager to make it the target of stage() calls.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self._token = None
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def as_ms(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.seconds.items()}
+
+    def __enter__(self):
+        self._token = _current_timings.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_timings.reset(self._token)
+        return False
+
+@contextmanager
+def stage(name):
+    """Time a block into the current request's StageTimings (no-op outside a request)"""
+    timings = _current_timings.get()
+    if timings is None or not OBS_CFG["metrics_enabled"]:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def record_stage_timings(fn):
+    """Run fn under a fresh StageTimings and add the breakdown to its result
+
+    fn must return a result dict with a "metadata" dict; the timings are added
+    as metadata["stage_timings_ms"].
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with StageTimings() as timings:
+            result = fn(*args, **kwargs)
+        result["metadata"]["stage_timings_ms"] = timings.as_ms()
+        return result
+    return wrapper
+
+# === Metrics ===
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Metrics:
+    """In-process counters, gauges and histograms rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, enabled=None):
+        self.buckets = tuple(buckets)
+        self.enabled = OBS_CFG["metrics_enabled"] if enabled is None else enabled
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += amount
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def _buckets(self, name):
+        return METRIC_BUCKETS.get(name, self.buckets)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = (name, _label_key(labels))
+            buckets = self._buckets(name)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe_stages(self, stage_timings_ms):
+        """Record a request's stage breakdown (as returned in metadata)"""
+        for name, ms in stage_timings_ms.items():
+            self.observe("stage_latency_seconds", ms / 1000, stage=name)
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+
+        lines = []
+        described = set()
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = METRIC_HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {text}")
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters + gauges:
+            describe(name)
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name)
+            for bound, bucket_count in zip(self._buckets(name), counts):
+                le = _format_labels(labels, ("le", _format_value(bound)))
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{le} {bucket_count}")
+            lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+# Metrics of the serving process
+metrics = Metrics()
@@ -0,0 +1,191 @@
+"""Signal profiles: the sampling rate and stride a recording is sent with
+
+The physiological model was trained on CFG["fs"] Hz signals cut into
+CFG["window_sec"] windows. A profile declares the rate a device records at, and
+uploads at any other rate are resampled to CFG["fs"] on ingest with an
+anti-aliased polyphase filter, all sensors in one vectorised call. Profiles
+can also use a different stride, which changes the number of windows but not
+what each window means to the model. The window length is fixed by the model.
+
+A profile also declares the units its sensors record in, which the
+signal-quality range check depends on (see signal_quality.profile_ranges):
+"units": "wesad_chest" for the WESAD chest units the model was trained on,
+and/or its own "quality_ranges". Profiles with neither skip the range check.
+
+Built-in profiles are in SIGNAL_PROFILES. Per-device profiles can be added
+with a JSON file at SIGNAL_PROFILES_PATH, e.g.
+    {"polar_h10": {"source_fs": 130, "description": "Polar H10 chest strap",
+                   "quality_ranges": {"ECG": [-5, 5]}}}
+"""
+import json
+import os
+from fractions import Fraction
+import numpy as np
+from scipy import signal
+
+from features import CFG
+from observability import get_logger
+
+logger = get_logger("profiles")
+
+SIGNAL_PROFILES = {
+    "default": {
+        "source_fs": CFG["fs"],
+        "units": "wesad_chest",
+        "description": "Recordings already at the model rate, in the model's units"
+    },
+    "wesad_chest": {
+        "source_fs": CFG["orig_fs"],
+        "units": "wesad_chest",
+        "description": "RespiBAN chest device as in WESAD (700 Hz)"
+    },
+}
+
+PROFILE_CFG = {
+    "path": os.environ.get("SIGNAL_PROFILES_PATH"),
+    "default": os.environ.get("SIGNAL_PROFILE", "default"),
+    # Largest denominator for the up/down ratio of the polyphase filter
+    "max_denominator": 1000,
+}
+
+def _load_profiles():
+    profiles = {name: dict(profile) for name, profile in SIGNAL_PROFILES.items()}
+    path = PROFILE_CFG["path"]
+    if path:
+        try:
+            with open(path) as f:
+                profiles.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load signal profiles from {path}: {e}")
+    return profiles
+
+_PROFILES = _load_profiles()
+
+class SignalProfile:
+    """Source sampling rate, stride and sensor units of a recording"""
+
+    def __init__(self, name, source_fs, stride_sec=None, units=None, quality_ranges=None):
+        self.name = name
+        self.source_fs = float(source_fs)
+        self.stride_sec = CFG["stride_sec"] if stride_sec is None else stride_sec
+        self.units = units
+        self.quality_ranges = quality_ranges
+        if self.source_fs <= 0:
+            raise ValueError(f"Sampling rate must be positive, got {source_fs}")
+        if self.stride_size <= 0:
+            raise ValueError(f"Stride must be at least one sample, got {self.stride_sec} s")
+
+    @property
+    def stride_size(self):
+        """Stride in samples at the model rate"""
+        return int(round(self.stride_sec * CFG["fs"]))
+
+    @property
+    def needs_resampling(self):
+        return self.source_fs != CFG["fs"]
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "source_fs": self.source_fs,
+            "target_fs": CFG["fs"],
+            "window_sec": CFG["window_sec"],
+            "stride_sec": self.stride_sec
+        }
+
+def available_profiles():
+    return dict(_PROFILES)
+
+def resolve_profile(name=None, sampling_rate=None):
+    """Profile for a request: a named profile, optionally with its rate overridden
+
+    Raises:
+        ValueError: unknown profile name or invalid sampling rate
+    """
+    name = name or PROFILE_CFG["default"]
+    if name not in _PROFILES:
+        raise ValueError(f"Unknown signal profile '{name}'. Available: {sorted(_PROFILES)}")
+    profile = _PROFILES[name]
+    source_fs = profile["source_fs"] if sampling_rate is None else sampling_rate
+    try:
+        source_fs = float(source_fs)
+    except (TypeError, ValueError):
+        raise ValueError(f"Sampling rate must be a number, got {sampling_rate!r}")
+    return SignalProfile(name, source_fs, profile.get("stride_sec"), profile.get("units"),
+                         profile.get("quality_ranges"))
+
+def resample_columns(columns, n_samples, source_fs, target_fs=CFG["fs"]):
+    """Resample every sensor column to target_fs with an anti-aliased polyphase filter
+
+    Returns:
+        (columns, n_samples) at target_fs
+    """
+    if source_fs == target_fs or not columns:
+        return columns, n_samples
+    ratio = Fraction(target_fs / source_fs).limit_denominator(PROFILE_CFG["max_denominator"])
+    sensors = list(columns)
+    stacked = np.stack([columns[sensor] for sensor in sensors])
+    resampled = signal.resample_poly(stacked, ratio.numerator, ratio.denominator, axis=-1)
+    return {sensor: resampled[i] for i, sensor in enumerate(sensors)}, resampled.shape[-1]
+
+class ChunkedResampler:
+    """resample_columns for a recording that arrives in chunks
+
+    Every chunk is resampled together with a margin of neighbouring input
+    samples wider than the polyphase filter, and only outputs whose filter
+    support lies inside the segment are emitted. Segments start on multiples
+    of the down factor, so the outputs match resampling the whole recording
+    at once while only a chunk plus the margin is held in memory.
+    """
+
+    def __init__(self, source_fs, target_fs=CFG["fs"]):
+        ratio = Fraction(target_fs / source_fs).limit_denominator(PROFILE_CFG["max_denominator"])
+        self.up, self.down = ratio.numerator, ratio.denominator
+        # resample_poly's filter reaches 10 * max(up, down) upsampled samples each way
+        reach = -(-10 * max(self.up, self.down) // self.up) + self.down
+        self.margin = -(-reach // self.down) * self.down
+        self.sensors = None
+        self.pending = None  # Input not yet discarded, starting at input index self.offset
+        self.offset = 0
+        self.emitted = 0  # Output samples emitted so far
+
+    def _input_start(self, output_index):
+        """Segment start (a multiple of down) that leaves the margin before output_index"""
+        start = max(0, output_index * self.down // self.up - self.margin)
+        return start - start % self.down
+
+    def _emit(self, stop):
+        """Outputs emitted..stop-1, as a (n_sensors, n) array"""
+        if stop <= self.emitted:
+            return np.empty((len(self.sensors), 0))
+        start = self._input_start(self.emitted)
+        segment = self.pending[:, start - self.offset:]
+        resampled = signal.resample_poly(segment, self.up, self.down, axis=-1)
+        first = start * self.up // self.down
+        out = resampled[:, self.emitted - first:stop - first]
+        self.emitted = stop
+        # Keep only the input still needed for the margin of the next outputs
+        keep_from = self._input_start(self.emitted)
+        self.pending = self.pending[:, keep_from - self.offset:]
+        self.offset = keep_from
+        return out
+
+    def push(self, columns):
+        """Add a chunk ({sensor: samples}); returns the resampled columns ready so far"""
+        if self.sensors is None:
+            self.sensors = list(columns)
+            self.pending = np.empty((len(self.sensors), 0))
+        chunk = np.stack([np.asarray(columns[sensor], dtype=float) for sensor in self.sensors])
+        self.pending = np.concatenate((self.pending, chunk), axis=1)
+        total_in = self.offset + self.pending.shape[1]
+        # Outputs whose filter support ends before the last input received
+        ready = max(0, (total_in - self.margin) * self.up // self.down)
+        return dict(zip(self.sensors, self._emit(ready)))
+
+    def flush(self):
+        """The remaining outputs once the last chunk has been pushed"""
+        if self.sensors is None:
+            return {}
+        total_in = self.offset + self.pending.shape[1]
+        n_out = -(-total_in * self.up // self.down)
+        return dict(zip(self.sensors, self._emit(n_out)))
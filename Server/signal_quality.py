@@ -0,0 +1,212 @@
+"""Signal-quality gating of physiological windows before feature extraction
+
+Each sensor of each window gets a set of failure flags from cheap vectorised
+checks over the raw signal at the model rate:
+    - flat: peak-to-peak amplitude below flat_ptp (disconnected electrode)
+    - clipping: more than clip_ratio of the samples at the window's minimum
+      or maximum (a saturated amplifier)
+    - out_of_range: more than max_out_of_range of the samples outside the
+      sensor's physiological range, in the units of the recording's signal
+      profile (see profile_ranges); skipped for sensors without a range
+    - heart_rate: ECG R-peak rate outside heart_rate_bpm, from the
+      recording's PeakIndex
+Missing sensors are zero-filled by the pipeline and are not counted as
+failures. Depending on SIGNAL_QUALITY, windows that fail are skipped (no
+features, no model call, no weight in the average), down-weighted by the
+fraction of their sensors that pass, or only reported.
+"""
+import json
+import os
+import numpy as np
+
+from features import CFG, STEP, STRIDE
+from hrv import PeakIndex
+from observability import get_logger
+
+logger = get_logger("signal_quality")
+
+QUALITY_MODES = ("off", "report", "weight", "skip")
+
+# Failure flags, one bit each
+FLAT, CLIPPING, OUT_OF_RANGE, HEART_RATE = 1, 2, 4, 8
+MISSING = 128
+CHECKS = {"flat": FLAT, "clipping": CLIPPING, "out_of_range": OUT_OF_RANGE, "heart_rate": HEART_RATE}
+
+# Signal-quality configuration
+QUALITY_CFG = {
+    # "off", "report" (flags only), "weight" (down-weight failing windows) or "skip"
+    "mode": os.environ.get("SIGNAL_QUALITY", "skip"),
+    "flat_ptp": 1e-6,
+    "clip_ratio": 0.05,
+    "max_out_of_range": 0.1,
+    "heart_rate_bpm": (30, 220),
+    # Physiological range of each sensor in WESAD chest units (mV, uS, degrees C), for
+    # profiles with "units": "wesad_chest"; overridable as JSON in SIGNAL_QUALITY_RANGES
+    "ranges": {"ECG": (-5.0, 5.0), "EMG": (-5.0, 5.0), "EDA": (0.0, 100.0), "Temp": (20.0, 45.0)},
+    # Checks run per sensor; slow, quantised signals are not checked for flat lines or clipping
+    "checks": {
+        "ECG": ("flat", "clipping", "out_of_range", "heart_rate"),
+        "EMG": ("flat", "clipping", "out_of_range"),
+        "EDA": ("flat", "out_of_range"),
+        "Temp": ("out_of_range",),
+    },
+    # Windows checked per block, bounding the temporary (windows, samples) masks
+    "block_windows": 1024,
+}
+if os.environ.get("SIGNAL_QUALITY_RANGES"):
+    QUALITY_CFG["ranges"].update(json.loads(os.environ["SIGNAL_QUALITY_RANGES"]))
+
+def quality_mode():
+    """Validated gating mode from QUALITY_CFG"""
+    mode = QUALITY_CFG["mode"].lower()
+    if mode not in QUALITY_MODES:
+        raise ValueError(f"Unknown signal quality mode '{mode}'. Expected one of {QUALITY_MODES}")
+    return mode
+
+def profile_ranges(profile=None):
+    """Physiological range of each sensor for recordings of a SignalProfile
+
+    QUALITY_CFG["ranges"] applies to profiles in WESAD chest units, updated
+    with the profile's own quality_ranges. A profile in other or unknown
+    units only has the ranges it declares; other sensors are not range-checked.
+    Without a profile, QUALITY_CFG["ranges"] is used.
+    """
+    if profile is None:
+        return dict(QUALITY_CFG["ranges"])
+    ranges = dict(QUALITY_CFG["ranges"]) if profile.units == "wesad_chest" else {}
+    ranges.update(profile.quality_ranges or {})
+    return ranges
+
+def quality_params(profile=None):
+    """Everything the flags depend on, for cache keys"""
+    return {
+        "mode": quality_mode(),
+        "ranges": profile_ranges(profile),
+        **{key: QUALITY_CFG[key] for key in ("flat_ptp", "clip_ratio", "max_out_of_range", "heart_rate_bpm", "checks")}
+    }
+
+def _window_counts(mask, n_windows, window_size, stride_size):
+    """Number of True samples in every window, from one cumulative sum over the signal"""
+    cumulative = np.concatenate(([0], np.cumsum(mask)))
+    starts = np.arange(n_windows) * stride_size
+    return cumulative[starts + window_size] - cumulative[starts]
+
+def assess_windows(columns, n_samples, fs=CFG["fs"], window_size=STEP, stride_size=STRIDE, peaks=None,
+                   ranges=None):
+    """Failure flags of every window and sensor
+
+    Args:
+        columns: sensor name -> 1-D raw signal at the model rate
+        peaks: optional PeakIndex of the ECG, detected here if not given
+        ranges: sensor -> (low, high) for the out_of_range check, usually
+            profile_ranges(profile); default QUALITY_CFG["ranges"]
+
+    Returns:
+        (n_windows, len(CFG["sensors"])) uint8 array of CHECKS bits, with
+        MISSING set for sensors absent from columns
+    """
+    n_windows = 0 if n_samples < window_size else (n_samples - window_size) // stride_size + 1
+    flags = np.zeros((n_windows, len(CFG["sensors"])), dtype=np.uint8)
+    if n_windows == 0:
+        return flags
+    block = QUALITY_CFG["block_windows"]
+    ranges = QUALITY_CFG["ranges"] if ranges is None else ranges
+    for i, sensor in enumerate(CFG["sensors"]):
+        if sensor not in columns:
+            flags[:, i] = MISSING
+            continue
+        checks = QUALITY_CFG["checks"].get(sensor, ())
+        x = np.asarray(columns[sensor], dtype=float)[:n_samples]
+        if "out_of_range" in checks and sensor in ranges:
+            low, high = ranges[sensor]
+            outside = _window_counts((x < low) | (x > high), n_windows, window_size, stride_size)
+            flags[outside > QUALITY_CFG["max_out_of_range"] * window_size, i] |= OUT_OF_RANGE
+        if "flat" not in checks and "clipping" not in checks:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(x, window_size)[::stride_size][:n_windows]
+        for start in range(0, n_windows, block):
+            w = windows[start:start + block]
+            low, high = w.min(axis=-1), w.max(axis=-1)
+            flat = high - low <= QUALITY_CFG["flat_ptp"]
+            if "flat" in checks:
+                flags[start:start + block, i][flat] |= FLAT
+            if "clipping" in checks:
+                at_limits = ((w == low[:, None]) | (w == high[:, None])).sum(axis=-1)
+                clipped = ~flat & (at_limits > QUALITY_CFG["clip_ratio"] * window_size)
+                flags[start:start + block, i][clipped] |= CLIPPING
+        if "heart_rate" in checks:
+            peaks = peaks if peaks is not None else PeakIndex.from_ecg(x, fs)
+            lo, hi = peaks.bounds(np.arange(n_windows) * stride_size, window_size)
+            bpm = (hi - lo) * 60 * fs / window_size
+            min_bpm, max_bpm = QUALITY_CFG["heart_rate_bpm"]
+            implausible = ((bpm < min_bpm) | (bpm > max_bpm)) & (flags[:, i] & FLAT == 0)
+            flags[implausible, i] |= HEART_RATE
+    return flags
+
+def window_weights(flags, mode=None, fallback=True):
+    """Weight of every window in the recording's average: 1 passes, 0 is skipped
+
+    "weight" gives each window the fraction of its present sensors that pass,
+    "skip" gives 0 to any window with a failing sensor, and "off" and "report"
+    weigh every window equally. If no window would keep any weight, all windows
+    are used as before (unless fallback is False, for a part of a recording),
+    since the alternative is no prediction at all.
+    """
+    mode = mode or quality_mode()
+    n_windows = flags.shape[0]
+    if mode in ("off", "report"):
+        return np.ones(n_windows)
+    present = (flags & MISSING) == 0
+    failed = present & (flags != 0)
+    if mode == "weight":
+        n_present = present.sum(axis=1)
+        weights = np.where(n_present > 0, 1 - failed.sum(axis=1) / np.maximum(n_present, 1), 1.0)
+    else:
+        weights = (~failed.any(axis=1)).astype(float)
+    if fallback and n_windows and not weights.any():
+        return np.ones(n_windows)
+    return weights
+
+def quality_summary(flags, weights, mode=None):
+    """Per-sensor pass rates and failure counts, and the windows that were used"""
+    mode = mode or quality_mode()
+    sensors = {}
+    for i, sensor in enumerate(CFG["sensors"]):
+        column = flags[:, i]
+        if (column & MISSING).any():
+            sensors[sensor] = {"present": False}
+            continue
+        passed = int((column == 0).sum())
+        sensors[sensor] = {
+            "present": True,
+            "passed_windows": passed,
+            "pass_rate": round(passed / len(column), 4) if len(column) else 1.0,
+            "failures": {name: int((column & bit != 0).sum()) for name, bit in CHECKS.items()
+                         if name in QUALITY_CFG["checks"].get(sensor, ())}
+        }
+    failed = ((flags != 0) & ((flags & MISSING) == 0)).any(axis=1)
+    return {
+        "mode": mode,
+        "windows_total": int(len(flags)),
+        "windows_failed": int(failed.sum()),
+        "windows_used": int((weights > 0).sum()),
+        # Every window failed, so all were used rather than none
+        "fallback": bool(mode in ("weight", "skip") and len(flags) and (weights > 0).all() and failed.all()),
+        "sensors": sensors
+    }
+
+def gate_windows(flags, n_windows, mode=None):
+    """Windows to score and their weights
+
+    Args:
+        flags: assess_windows output, or None when quality was not assessed
+
+    Returns:
+        (usable, weights, summary): indices of the windows with a positive
+        weight, their weights and the quality_summary (None without flags)
+    """
+    if flags is None:
+        return np.arange(n_windows), np.ones(n_windows), None
+    weights = window_weights(flags, mode)
+    usable = np.flatnonzero(weights > 0)
+    return usable, weights[usable], quality_summary(flags, weights, mode)
@@ -0,0 +1,157 @@
+"""Incremental windowing and prediction for live sensor streams"""
+import numpy as np
+
+from features import CFG, STEP, STRIDE, zscore, extract_window_features
+from hrv import StreamingPeakDetector, peak_mode
+
+class SignalRingBuffer:
+    """Fixed-size ring buffer holding the most recent window of every sensor
+
+    Samples are pushed in arbitrary chunk sizes; a window is emitted each time
+    another stride of samples completes it, matching the windows that
+    process_csv_data would produce for the same recording.
+    """
+
+    def __init__(self, sensors=None, window_size=STEP, stride_size=STRIDE):
+        self.sensors = list(sensors or CFG["sensors"])
+        self.window_size = window_size
+        self.stride_size = stride_size
+        self.buffer = np.zeros((len(self.sensors), window_size))
+        self.total_samples = 0
+        self.next_window_end = window_size
+
+    def _write(self, chunk):
+        """Write a (n_sensors, n) chunk that fits before the next window end"""
+        n = chunk.shape[1]
+        head = self.total_samples % self.window_size
+        first = min(n, self.window_size - head)
+        self.buffer[:, head:head + first] = chunk[:, :first]
+        if first < n:
+            self.buffer[:, :n - first] = chunk[:, first:]
+        self.total_samples += n
+
+    def _window(self):
+        """Current buffer contents in time order, as a sensor -> signal dict"""
+        head = self.total_samples % self.window_size
+        ordered = np.concatenate((self.buffer[:, head:], self.buffer[:, :head]), axis=1)
+        return dict(zip(self.sensors, ordered))
+
+    def push(self, chunk):
+        """Append a (n_sensors, n) chunk and return the windows it completes"""
+        chunk = np.asarray(chunk, dtype=float)
+        windows = []
+        pos = 0
+        while pos < chunk.shape[1]:
+            take = min(chunk.shape[1] - pos, self.next_window_end - self.total_samples)
+            self._write(chunk[:, pos:pos + take])
+            pos += take
+            if self.total_samples == self.next_window_end:
+                windows.append(self._window())
+                self.next_window_end += self.stride_size
+        return windows
+
+class StreamingSession:
+    """Per-connection state for streaming physiological prediction
+
+    Only newly completed windows are featurised and scored, so every stride
+    costs the same regardless of how long the session has been running.
+    With ECG_PEAK_MODE=recording, ECG R-peaks are detected once as samples
+    arrive, in a StreamingPeakDetector shared by all windows.
+    """
+
+    def __init__(self, physio_model, fusion_model, dass21_probs, voice_probs, profile=None):
+        self.physio_model = physio_model
+        self.fusion_model = fusion_model
+        self.dass21_probs = np.asarray(dass21_probs, dtype=float)
+        self.voice_probs = np.asarray(voice_probs, dtype=float)
+        # Streams arrive at the model rate; a profile only changes the stride
+        self.stride_sec = CFG["stride_sec"] if profile is None else profile.stride_sec
+        self.ring = SignalRingBuffer(stride_size=STRIDE if profile is None else profile.stride_size)
+        self.peaks = StreamingPeakDetector() if peak_mode() == "recording" else None
+        self.windows_processed = 0
+        self.physio_probs_sum = np.zeros(3)
+
+    def _parse_samples(self, samples):
+        """Convert a {sensor: [values]} message into a (n_sensors, n) chunk"""
+        if not isinstance(samples, dict) or not samples:
+            raise ValueError("samples must be a non-empty object mapping sensor names to value arrays")
+        unknown = [sensor for sensor in samples if sensor not in self.ring.sensors]
+        if unknown:
+            raise ValueError(f"Unknown sensors: {unknown}. Expected any of {self.ring.sensors}")
+
+        lengths = {len(values) for values in samples.values()}
+        if len(lengths) != 1:
+            raise ValueError("All sensors in a message must have the same number of samples")
+        n = lengths.pop()
+
+        # Sensors not sent by the device are zero-filled, as in process_csv_data
+        chunk = np.zeros((len(self.ring.sensors), n))
+        for i, sensor in enumerate(self.ring.sensors):
+            if sensor in samples:
+                chunk[i] = np.asarray(samples[sensor], dtype=float)
+        return chunk
+
+    def _fuse(self, physio_probs):
+        fusion_input = {
+            "phys": physio_probs,
+            "text": self.dass21_probs,
+            "voice": self.voice_probs
+        }
+        return self.fusion_model.predict_proba(fusion_input)
+
+    def push(self, samples):
+        """Feed new samples and return one result per newly completed window"""
+        results = []
+        chunk = self._parse_samples(samples)
+        peaks = None
+        if self.peaks is not None:
+            self.peaks.push(chunk[self.ring.sensors.index("ECG")])
+            peaks = self.peaks.peaks()
+        for window in self.ring.push(chunk):
+            signals = {sensor: zscore(data) for sensor, data in window.items()}
+            ecg_features = None
+            if peaks is not None:
+                ecg_features = peaks.window_features([self.windows_processed * self.ring.stride_size])[0]
+            features = extract_window_features(signals, ecg_features)
+            features = np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+            physio_probs = self.physio_model.predict_proba(features.reshape(1, -1))[0]
+
+            self.physio_probs_sum += physio_probs
+            self.windows_processed += 1
+            running_physio = self.physio_probs_sum / self.windows_processed
+
+            fusion_probs = self._fuse(physio_probs)
+            running_fusion = self._fuse(running_physio)
+            window_index = self.windows_processed - 1
+            results.append({
+                "window": window_index,
+                "start_sec": window_index * self.stride_sec,
+                "end_sec": window_index * self.stride_sec + CFG["window_sec"],
+                "physio_probs": physio_probs.tolist(),
+                "fusion_probs": fusion_probs.tolist(),
+                "fusion_pred": int(np.argmax(fusion_probs)),
+                "running_physio_probs": running_physio.tolist(),
+                "running_fusion_probs": running_fusion.tolist(),
+                "running_fusion_pred": int(np.argmax(running_fusion))
+            })
+        if self.peaks is not None:
+            # Only the windows still to come need their peaks
+            self.peaks.discard_before(self.ring.next_window_end - self.ring.window_size)
+        return results
+
+    def summary(self):
+        """Running-average result for the whole session so far"""
+        summary = {
+            "windows_processed": self.windows_processed,
+            "samples_received": self.ring.total_samples
+        }
+        if self.windows_processed:
+            running_physio = self.physio_probs_sum / self.windows_processed
+            running_fusion = self._fuse(running_physio)
+            summary.update({
+                "physio_probs": running_physio.tolist(),
+                "fusion_probs": running_fusion.tolist(),
+                "fusion_pred": int(np.argmax(running_fusion)),
+                "prediction_label": ["Low", "Medium", "High"][int(np.argmax(running_fusion))]
+            })
+        return summary
@@ -0,0 +1,75 @@
+"""Batched feature extraction against the per-window reference implementation"""
+import numpy as np
+import pytest
+
+from features import CFG, STEP, STRIDE, FEATURE_NAMES, ALL_FEATURE_NAMES, zscore, extract_window_features
+from batch_features import N_ECG_FEATURES, extract_batch_features, iter_feature_blocks
+from hrv import HRV_CFG, PeakIndex
+from profiles import resolve_profile
+
+
+@pytest.fixture
+def columns():
+    """Five minutes of synthetic sensors, with a flat-line stretch and Temp missing"""
+    rng = np.random.default_rng(42)
+    n_samples = 5 * 60 * CFG["fs"] + 123
+    t = np.arange(n_samples) / CFG["fs"]
+    columns = {
+        "ECG": np.sin(2 * np.pi * 1.2 * t) ** 15 + 0.05 * rng.standard_normal(n_samples),
+        "EDA": np.round(100 * (2 + 0.1 * np.sin(2 * np.pi * 0.05 * t))),  # quantised, with plateaus
+        "EMG": rng.standard_normal(n_samples),
+    }
+    columns["EMG"][2000:4000] = 0.0
+    return columns
+
+
+@pytest.fixture
+def window_peaks(monkeypatch):
+    # The reference detects R-peaks per window
+    monkeypatch.setitem(HRV_CFG, "peak_mode", "window")
+
+
+def reference_features(columns):
+    n_samples = len(columns["ECG"])
+    rows = []
+    for start in range(0, n_samples - STEP + 1, STRIDE):
+        signals = {sensor: zscore(columns[sensor][start:start + STEP]) if sensor in columns else np.zeros(STEP)
+                   for sensor in CFG["sensors"]}
+        rows.append(extract_window_features(signals))
+    return np.array(rows)
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_matches_per_window_reference(columns, window_peaks, incremental):
+    reference = reference_features(columns)
+    batched = extract_batch_features(columns, incremental=incremental)
+    assert batched.shape == reference.shape == (len(reference), len(ALL_FEATURE_NAMES))
+    np.testing.assert_allclose(batched, reference, rtol=1e-9, atol=1e-9)
+
+
+def test_recording_peaks_only_change_hrv_columns(columns):
+    reference = reference_features(columns)
+    recording = extract_batch_features(columns, peaks=PeakIndex.from_ecg(columns["ECG"]))
+    other = np.ones(recording.shape[1], dtype=bool)
+    other[len(FEATURE_NAMES["ECG"]) - N_ECG_FEATURES:len(FEATURE_NAMES["ECG"])] = False
+    np.testing.assert_allclose(recording[:, other], reference[:, other], rtol=1e-9, atol=1e-9)
+
+
+def test_window_subset_matches_full_extraction(columns):
+    peaks = PeakIndex.from_ecg(columns["ECG"])
+    full = extract_batch_features(columns, peaks=peaks)
+    subset = np.arange(0, len(full), 3)
+    partial = extract_batch_features(columns, peaks=peaks, windows=subset)
+    np.testing.assert_allclose(partial[subset], full[subset], rtol=1e-9, atol=1e-9)
+    assert not np.delete(partial, subset, axis=0).any()
+
+
+def test_feature_blocks_match_whole_recording(columns, window_peaks):
+    # Chunks that do not line up with window boundaries
+    n_samples = len(columns["ECG"])
+    chunks = ({sensor: x[start:start + 7_777] for sensor, x in columns.items()}
+              for start in range(0, n_samples, 7_777))
+    blocks = list(iter_feature_blocks(chunks, resolve_profile()))
+    assert [first for first, _ in blocks] == list(np.cumsum([0] + [len(X) for _, X in blocks[:-1]]))
+    np.testing.assert_allclose(np.vstack([X for _, X in blocks]), extract_batch_features(columns),
+                               rtol=1e-9, atol=1e-9)
@@ -0,0 +1,153 @@
+"""Chunked scoring of large uploads against whole-file processing, and its peak memory"""
+import multiprocessing
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import CFG
+from batch_features import count_windows, extract_batch_features
+from hrv import HRV_CFG, PeakIndex
+from ingest import load_sensor_columns
+from profiles import resolve_profile
+from signal_quality import QUALITY_CFG, assess_windows, gate_windows
+from chunked_upload import WindowSample, score_upload
+
+# Recording sizes (MB) compared by the peak-memory test, e.g. "64,2048" for a 2 GB run
+MEMORY_TEST_SIZES_MB = [int(size) for size in os.environ.get("CHUNKED_MEMORY_TEST_MB", "16,256").split(",")]
+
+
+def _write_recording(path, size_bytes, rows_per_block=100_000):
+    """Synthetic 100 Hz recording of about size_bytes, written block by block
+
+    One block is formatted and repeated; with the default block length both
+    sines complete whole periods, so the signal stays continuous.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(rows_per_block) / CFG["fs"]
+    block = pd.DataFrame({
+        "ECG": np.sin(2 * np.pi * 1.2 * t) ** 15 + 0.05 * rng.standard_normal(rows_per_block),
+        "EDA": 2 + 0.1 * np.sin(2 * np.pi * 0.05 * t),
+        "EMG": 0.1 * rng.standard_normal(rows_per_block),
+        "Temp": 33 + 0.01 * rng.standard_normal(rows_per_block),
+    })
+    text = block.to_csv(index=False, header=False, float_format="%.5f")
+    written = 0
+    with open(path, "w") as f:
+        f.write(",".join(CFG["sensors"]) + "\n")
+        while written < size_bytes:
+            f.write(text)
+            written += len(text)
+
+
+def _stand_in_model(X):
+    """Softmax of three feature columns, in place of the physiological model"""
+    logits = X[:, :3] - X[:, :3].max(axis=1, keepdims=True)
+    return np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process since the last _reset_peak_rss, in MB (Linux)"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise OSError("VmHWM not reported")
+
+
+def _reset_peak_rss():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def _measure(path, queue):
+    """Score a recording in this (fresh) process and report its peak RSS above the start"""
+    _reset_peak_rss()
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    result = score_upload(path, resolve_profile(), _stand_in_model)
+    queue.put((result["n_windows"], _peak_rss_mb() - baseline, time.perf_counter() - start))
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    """25 minutes at 100 Hz with a flat ECG stretch and out-of-range temperature"""
+    rng = np.random.default_rng(0)
+    n_samples = 25 * 60 * CFG["fs"] + 321
+    t = np.arange(n_samples) / CFG["fs"]
+    frame = pd.DataFrame({
+        "ECG": np.sin(2 * np.pi * 1.2 * t) ** 15 + 0.05 * rng.standard_normal(n_samples),
+        "EDA": 2 + 0.1 * np.sin(2 * np.pi * 0.05 * t),
+        "EMG": 0.1 * rng.standard_normal(n_samples),
+        "Temp": 33 + 0.01 * rng.standard_normal(n_samples),
+    })
+    frame.loc[20_000:50_000, "ECG"] = 0.0
+    frame.loc[90_000:95_000, "Temp"] = 80.0
+    path = tmp_path_factory.mktemp("chunked") / "recording.csv"
+    frame.to_csv(path, index=False, float_format="%.6f")
+    return str(path)
+
+
+def whole_file_probs(path, profile):
+    """Weighted window average as /predict computes it from the whole upload"""
+    with open(path, "rb") as f:
+        columns, n_samples = load_sensor_columns(f.read(), os.path.basename(path))
+    peaks = PeakIndex.from_ecg(columns["ECG"][:n_samples]) if HRV_CFG["peak_mode"] == "recording" else None
+    flags = None if QUALITY_CFG["mode"] == "off" else assess_windows(columns, n_samples, peaks=peaks)
+    usable, weights, summary = gate_windows(flags, count_windows(n_samples))
+    X = extract_batch_features(columns, n_samples, peaks=peaks, windows=usable)[usable]
+    probs = _stand_in_model(np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0))
+    return np.average(probs, axis=0, weights=weights), summary
+
+
+@pytest.mark.parametrize("mode", ["skip", "weight", "off"])
+@pytest.mark.parametrize("peak_mode, chunk_rows", [("window", 50_000), ("window", 7_777), ("recording", 10**7)])
+def test_chunked_matches_whole_file(recording, monkeypatch, mode, peak_mode, chunk_rows):
+    monkeypatch.setitem(QUALITY_CFG, "mode", mode)
+    monkeypatch.setitem(HRV_CFG, "peak_mode", peak_mode)
+    profile = resolve_profile()
+    expected, summary = whole_file_probs(recording, profile)
+    result = score_upload(recording, profile, _stand_in_model, chunk_rows=chunk_rows)
+    np.testing.assert_allclose(result["physio_probs"], expected, rtol=1e-9, atol=1e-12)
+    assert result["signal_quality"] == summary
+    if summary is not None:
+        assert summary["windows_failed"] > 0
+        assert result["n_scored"] == summary["windows_used"]
+
+
+def test_window_sample_is_bounded_and_keeps_requested_windows():
+    sample = WindowSample(10, keep=[3, 97])
+    for start in range(0, 100, 7):
+        windows = np.arange(start, min(start + 7, 100))
+        sample.add(windows, windows[:, None] * np.ones((1, 4)))
+    windows, X = sample.result()
+    assert len(sample) == 10
+    assert {3, 97} <= set(windows.tolist()) and len(windows) <= 12
+    assert list(windows) == sorted(windows)
+    np.testing.assert_array_equal(X[:, 0], windows)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/clear_refs"), reason="needs Linux peak-RSS accounting")
+def test_peak_memory_does_not_grow_with_recording_size(tmp_path):
+    sizes_mb = MEMORY_TEST_SIZES_MB
+    if shutil.disk_usage(tmp_path).free < 1.2 * sum(sizes_mb) * 2**20:
+        pytest.skip("not enough disk space for the synthetic recordings")
+    context = multiprocessing.get_context("spawn")
+    growth = []
+    for size_mb in sizes_mb:
+        path = str(tmp_path / f"{size_mb}mb.csv")
+        _write_recording(path, size_mb * 2**20)
+        queue = context.Queue()
+        # A fresh process per size, so the peak is this recording's alone
+        process = context.Process(target=_measure, args=(path, queue))
+        process.start()
+        n_windows, peak_growth, _ = queue.get()
+        process.join()
+        os.remove(path)
+        assert process.exitcode == 0 and n_windows > 0
+        growth.append(peak_growth)
+    # Bounded by the chunk size: a larger recording may not need meaningfully more memory
+    assert max(growth) <= 1.25 * min(growth) + 32, f"Peak memory grew with recording size: {growth}"
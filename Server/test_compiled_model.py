@@ -0,0 +1,80 @@
+"""Flat inference backend against sklearn's predict_proba"""
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from compiled_model import check_parity, compile_flat, compile_model, probe_inputs
+
+N_FEATURES = 20
+
+MODELS = {
+    "random_forest": lambda: RandomForestClassifier(n_estimators=30, max_depth=8, random_state=0),
+    "extra_trees": lambda: ExtraTreesClassifier(n_estimators=20, random_state=0),
+    "decision_tree": lambda: DecisionTreeClassifier(random_state=0),
+    "scaled_forest": lambda: make_pipeline(StandardScaler(), RandomForestClassifier(n_estimators=10, random_state=0)),
+    "logistic_regression": lambda: make_pipeline(StandardScaler(), LogisticRegression(C=0.1, max_iter=500)),
+}
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((400, N_FEATURES))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int) + (X[:, 2] > 0.5)
+    return X, y
+
+
+@pytest.mark.parametrize("name", MODELS)
+def test_flat_backend_matches_sklearn(data, name):
+    model = MODELS[name]().fit(*data)
+    compiled = compile_model(model, backend="flat", strict=True)
+    assert compiled is not model and compiled.backend == "flat"
+    assert check_parity(model, compiled, n_samples=2000, seed=1) <= 1e-9
+    np.testing.assert_array_equal(compiled.classes_, model.classes_)
+
+
+def test_binary_logistic_regression(data):
+    X, y = data
+    model = LogisticRegression().fit(X, y > 0)
+    assert check_parity(model, compile_flat(model), n_samples=500) <= 1e-9
+
+
+@pytest.mark.parametrize("name", ["random_forest", "scaled_forest"])
+def test_probes_sit_on_split_thresholds(data, name):
+    model = MODELS[name]().fit(*data)
+    compiled = compile_flat(model)
+    features, thresholds = compiled.split_values()
+    X = probe_inputs(compiled, N_FEATURES, 200)
+    # Half the probe rows take every split feature's values from its thresholds
+    for column in np.unique(features):
+        candidates = thresholds[features == column]
+        assert np.isin(X[:100, column], candidates).all()
+    if name == "scaled_forest":
+        # Mapped back through the scaler, the thresholds are the forest's own splits
+        scaler, forest = model.steps[0][1], compile_flat(model.steps[1][1])
+        scaled = (thresholds - scaler.mean_[features]) / scaler.scale_[features]
+        np.testing.assert_allclose(scaled, forest.split_values()[1], atol=1e-9)
+    assert check_parity(model, compiled, n_samples=200) <= 1e-9
+
+
+def test_parity_failure_is_reported(data):
+    model = MODELS["random_forest"]().fit(*data)
+    compiled = compile_flat(model)
+    compiled.leaf_probs = compiled.leaf_probs[:, ::-1].copy()
+    with pytest.raises(ValueError, match="differs from sklearn"):
+        check_parity(model, compiled, n_samples=200)
+
+
+def test_unsupported_models_fall_back_to_sklearn(data):
+    model = GaussianNB().fit(*data)
+    assert compile_model(model, backend="flat") is model
+    assert compile_model(model, backend="sklearn") is model
+    with pytest.raises(ValueError):
+        compile_model(model, backend="flat", strict=True)
+    with pytest.raises(ValueError):
+        compile_model(model, backend="tensorrt")
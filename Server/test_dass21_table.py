@@ -0,0 +1,69 @@
+"""DASS-21 lookup table against the live model"""
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from dass21_table import N_ITEMS, N_VECTORS, DASS21Table, all_answer_vectors, build_dass21_table, encode_dass21
+
+
+class StandInExplainer:
+    """Deterministic per-vector attributions in place of SHAP"""
+
+    def dass21_shap_values(self, values):
+        return np.asarray(values, dtype=float) - 1.5
+
+
+@pytest.fixture
+def models(tmp_path):
+    """A fitted stand-in model and scaler, persisted like the served ones"""
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 4, size=(300, N_ITEMS)).astype(float)
+    y = np.digitize(X.sum(axis=1), [8, 14])
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(max_iter=1000).fit(scaler.transform(X), y)
+    model_paths = (str(tmp_path / "model.pkl"), str(tmp_path / "scaler.pkl"))
+    joblib.dump(model, model_paths[0])
+    joblib.dump(scaler, model_paths[1])
+    return model, scaler, model_paths
+
+
+def test_table_matches_the_live_model(models, tmp_path):
+    model, scaler, model_paths = models
+    path = str(tmp_path / "table.npz")
+    build_dass21_table(model, scaler, path=path, model_paths=model_paths)
+    table = DASS21Table.load(path, model_paths)
+
+    X = all_answer_vectors()
+    assert len(np.unique(X, axis=0)) == N_VECTORS
+    assert [encode_dass21(x) for x in X[::997]] == list(range(0, N_VECTORS, 997))
+    live = np.vstack([model.predict_proba(scaler.transform(x[None, :])) for x in X[::97]])
+    np.testing.assert_allclose(np.array([table.predict_proba(x) for x in X[::97]]), live, rtol=0, atol=1e-12)
+    assert table.shap_values(X[5]) is None
+
+
+def test_non_integer_answers_are_not_in_the_table(models, tmp_path):
+    model, scaler, model_paths = models
+    table = build_dass21_table(model, scaler, path=str(tmp_path / "table.npz"), model_paths=model_paths)
+    for values in ([0, 1, 2, 3, 0, 1, 2.5], [0, 1, 2, 3, 0, 1, 4], [-1, 0, 0, 0, 0, 0, 0], [0, 1, 2]):
+        assert encode_dass21(values) is None
+        assert table.predict_proba(values) is None
+
+
+def test_shap_values_are_stored(models, tmp_path):
+    model, scaler, model_paths = models
+    path = str(tmp_path / "table.npz")
+    build_dass21_table(model, scaler, StandInExplainer(), path=path, model_paths=model_paths)
+    table = DASS21Table.load(path, model_paths)
+    x = np.array([3, 0, 2, 1, 0, 3, 2], dtype=float)
+    np.testing.assert_allclose(table.shap_values(x), x - 1.5)
+
+
+def test_stale_table_is_ignored(models, tmp_path):
+    model, scaler, model_paths = models
+    path = str(tmp_path / "table.npz")
+    build_dass21_table(model, scaler, path=path, model_paths=model_paths)
+    joblib.dump(LogisticRegression(C=0.1).fit(np.eye(N_ITEMS), np.arange(N_ITEMS) % 3), model_paths[0])
+    assert DASS21Table.load(path, model_paths) is None
+    assert DASS21Table.load(str(tmp_path / "missing.npz"), model_paths) is None
@@ -0,0 +1,63 @@
+"""Explainer configuration and background handling"""
+import sys
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+from explainers import XAIExplainer, build_explainer, save_background, weighted_rows
+
+
+@pytest.fixture
+def dass21(tmp_path):
+    """Stand-in DASS-21 model and scaler, and a config pointing at tmp_path"""
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 4, size=(200, 7)).astype(float)
+    y = np.digitize(X.sum(axis=1), [8, 14])
+    scaler = StandardScaler().fit(X)
+    model = LogisticRegression(max_iter=1000).fit(scaler.transform(X), y)
+    return model, scaler, X, {"dass21_background_path": str(tmp_path / "dass21_background.npz")}
+
+
+def test_unknown_explainer_kind_is_rejected():
+    with pytest.raises(ValueError, match="dass21_explainer"):
+        XAIExplainer({"dass21_explainer": "lime"})
+
+
+def test_weighted_rows_follow_the_weights():
+    data = np.arange(6.0).reshape(3, 2)
+    rows = weighted_rows(data, [0.5, 0.3, 0.001], n_rows=8)
+    np.testing.assert_array_equal(rows, np.repeat(data, [5, 3, 1], axis=0))
+
+
+def test_missing_background_reports_unavailable(dass21):
+    model, scaler, _, config = dass21
+    xai = XAIExplainer(config)
+    xai.setup_dass21_explainer(model, scaler)
+    with pytest.raises(ValueError, match="No background data"):
+        xai.get_dass21_explainer()
+    explanation = xai.explain_dass21_prediction(np.array([[0, 1, 2, 3, 0, 1, 2]]))
+    assert not explanation["available"] and config["dass21_background_path"] in explanation["error"]
+
+
+def test_persisted_background_is_used(dass21):
+    model, scaler, X, config = dass21
+    save_background(X, config["dass21_background_path"], k=10)
+    xai = XAIExplainer(config)
+    xai.setup_dass21_explainer(model, scaler)
+    explanation = xai.explain_dass21_prediction(np.array([[0, 1, 2, 3, 0, 1, 2]]))
+    assert explanation["available"] and len(explanation["feature_importance"]) == 7
+
+
+def test_kernel_explainer_without_dense_data(dass21, monkeypatch):
+    model, scaler, X, _ = dass21
+    data, weights = X[:4], np.array([0.7, 0.1, 0.1, 0.1])
+
+    def predict(X):
+        return model.predict_proba(scaler.transform(X))
+
+    monkeypatch.setitem(sys.modules, "shap.utils._legacy", None)
+    explainer = build_explainer("kernel", model, predict, (data, weights))
+    expected = np.average(predict(weighted_rows(data, weights)), axis=0)
+    np.testing.assert_allclose(explainer.expected_value, expected)
@@ -0,0 +1,40 @@
+"""Feature store tiers, eviction and defaults"""
+import os
+import time
+
+import numpy as np
+
+from feature_store import FEATURE_STORE_CFG, FeatureStore
+
+
+def test_off_without_a_directory(monkeypatch):
+    monkeypatch.setitem(FEATURE_STORE_CFG, "directory", None)
+    store = FeatureStore()
+    assert not store.enabled
+    store.put("key", np.ones((2, 3)))
+    assert store.get("key") is None
+
+
+def test_round_trip_through_disk(tmp_path):
+    X = np.arange(12.0).reshape(4, 3)
+    FeatureStore(str(tmp_path)).put("key", X)
+    np.testing.assert_array_equal(FeatureStore(str(tmp_path)).get("key"), X)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = FeatureStore(str(tmp_path), max_disk_bytes=2500, memory_entries=0)
+    for i, key in enumerate(("a", "b", "c")):
+        store.put(key, np.zeros(100))  # 928 bytes each
+        os.utime(tmp_path / f"{key}.npy", (i, i))
+    store._evict()
+    assert sorted(os.listdir(tmp_path)) == ["b.npy", "c.npy"]
+
+
+def test_sweeps_stale_temporary_files(tmp_path):
+    stale, fresh = tmp_path / "crashed.tmp", tmp_path / "writing.tmp"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    old = time.time() - FEATURE_STORE_CFG["stale_tmp_sec"] - 60
+    os.utime(stale, (old, old))
+    FeatureStore(str(tmp_path)).put("key", np.ones(3))
+    assert sorted(os.listdir(tmp_path)) == ["key.npy", "writing.tmp"]
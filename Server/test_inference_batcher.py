@@ -0,0 +1,86 @@
+"""Micro-batched predict_proba calls from concurrent requests"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from inference_batcher import InFlight, MicroBatcher
+
+
+class StandIn:
+    """Row-wise stand-in model that records the shape of every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, X):
+        self.calls.append(len(X))
+        if np.isnan(X).any():
+            raise ValueError("NaN in features")
+        return np.column_stack([X.sum(axis=1), X[:, 0], -X[:, 0]])
+
+
+def run_concurrently(batcher, matrices, in_flight):
+    """predict_proba for every matrix at once, while in_flight counts them as still preparing"""
+    async def request(X):
+        with in_flight:
+            await asyncio.sleep(0)  # preparation
+        return await batcher.predict_proba(X)
+
+    async def main():
+        return await asyncio.gather(*(request(X) for X in matrices), return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def matrices():
+    rng = np.random.default_rng(0)
+    return [rng.random((n, 4)) for n in (3, 1, 7, 2, 5)]
+
+
+def test_concurrent_requests_share_one_call_and_get_their_own_rows(matrices):
+    model, in_flight = StandIn(), InFlight()
+    batcher = MicroBatcher("test", model, in_flight=in_flight, max_wait_ms=1000)
+    results = run_concurrently(batcher, matrices, in_flight)
+    assert model.calls == [sum(len(X) for X in matrices)]
+    for X, probs in zip(matrices, results):
+        np.testing.assert_array_equal(probs, model(X))
+    assert in_flight() == 0
+
+
+def test_max_rows_splits_batches(matrices):
+    model, in_flight = StandIn(), InFlight()
+    batcher = MicroBatcher("test", model, in_flight=in_flight, max_wait_ms=1000, max_rows=8)
+    results = run_concurrently(batcher, matrices, in_flight)
+    assert all(rows <= 8 for rows in model.calls) and sum(model.calls) == sum(len(X) for X in matrices)
+    for X, probs in zip(matrices, results):
+        np.testing.assert_array_equal(probs, model(X))
+
+
+def test_a_failing_request_does_not_fail_the_others(matrices):
+    matrices[2] = matrices[2].copy()
+    matrices[2][4, 1] = np.nan
+    model, in_flight = StandIn(), InFlight()
+    batcher = MicroBatcher("test", model, in_flight=in_flight, max_wait_ms=1000)
+    results = run_concurrently(batcher, matrices, in_flight)
+    assert isinstance(results[2], ValueError)
+    for i, (X, probs) in enumerate(zip(matrices, results)):
+        if i != 2:
+            np.testing.assert_array_equal(probs, model(X))
+
+
+def test_idle_batcher_does_not_wait():
+    model = StandIn()
+    batcher = MicroBatcher("test", model, in_flight=InFlight(), max_wait_ms=10_000)
+
+    async def main():
+        return await asyncio.wait_for(batcher.predict_proba(np.ones((2, 4))), timeout=1)
+
+    np.testing.assert_array_equal(asyncio.run(main()), model(np.ones((2, 4))))
+
+
+def test_rejects_non_matrix_input():
+    batcher = MicroBatcher("test", StandIn())
+    with pytest.raises(ValueError):
+        asyncio.run(batcher.predict_proba(np.ones(4)))
@@ -0,0 +1,66 @@
+"""Vectorised fusion against the row-by-row predict_proba"""
+import numpy as np
+import pytest
+
+from latefusion_final import PhysioDominantFusion
+
+MODALITIES = ["phys", "text", "voice"]
+
+
+@pytest.fixture
+def fusion():
+    return PhysioDominantFusion(class_weights={0: 0.7, 1: 0.0, 2: 0.3})
+
+
+def random_probs(rng, n):
+    probs = rng.random((n, 3))
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def reference(fusion, blocks, present):
+    """predict_proba on each row, with the modalities present in that row"""
+    rows = []
+    for i in range(len(present)):
+        mod_probs = {mod: blocks[j][i] for j, mod in enumerate(MODALITIES) if present[i, j]}
+        rows.append(fusion.predict_proba(mod_probs) if mod_probs else np.array([0.33, 0.33, 0.33]))
+    return np.array(rows)
+
+
+def test_random_rows_are_bit_identical(fusion):
+    rng = np.random.default_rng(0)
+    blocks = [random_probs(rng, 500) for _ in MODALITIES]
+    expected = reference(fusion, blocks, np.ones((500, 3), dtype=bool))
+    assert np.array_equal(fusion.predict_proba_batch(*blocks), expected)
+    assert np.array_equal(fusion.predict_proba_from_features(np.hstack(blocks)), expected)
+
+
+def test_missing_modalities_are_bit_identical(fusion):
+    rng = np.random.default_rng(1)
+    blocks = [random_probs(rng, 300) for _ in MODALITIES]
+    # Absent modalities arrive as all-zero rows, as in the fusion feature matrix
+    present = rng.random((300, 3)) < 0.6
+    present[:8] = False  # rows with no modality at all
+    blocks = [np.where(present[:, j:j + 1], block, 0.0) for j, block in enumerate(blocks)]
+    expected = reference(fusion, blocks, present)
+    assert np.array_equal(fusion.predict_proba_batch(*blocks), expected)
+    np.testing.assert_array_equal(expected[:8], np.full((8, 3), 0.33))
+
+    # A modality absent for every row can be passed as None
+    expected = reference(fusion, [blocks[0], blocks[1], None], present & [True, True, False])
+    assert np.array_equal(fusion.predict_proba_batch(blocks[0], blocks[1], None), expected)
+
+
+def test_present_mask_overrides_zero_detection(fusion):
+    rng = np.random.default_rng(2)
+    blocks = [random_probs(rng, 200) for _ in MODALITIES]
+    blocks[2][:50] = 0.0  # a present modality whose probabilities are all zero
+    present = rng.random((200, 3)) < 0.7
+    present[:50, 2] = True
+    present[:50, 0] = True  # with another modality, so the row still normalises
+    expected = reference(fusion, blocks, present)
+    assert np.array_equal(fusion.predict_proba_batch(*blocks, present=present), expected)
+
+
+def test_rejects_misshapen_blocks(fusion):
+    with pytest.raises(ValueError):
+        fusion.predict_proba_batch(np.ones((4, 3)), np.ones((3, 3)))
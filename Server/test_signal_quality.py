@@ -0,0 +1,124 @@
+"""Signal-quality flags, window weights and profile ranges"""
+import numpy as np
+import pytest
+
+from features import CFG, STEP, STRIDE
+from batch_features import count_windows
+from profiles import SignalProfile, resolve_profile
+from signal_quality import (
+    QUALITY_CFG, FLAT, CLIPPING, OUT_OF_RANGE, HEART_RATE, MISSING,
+    assess_windows, window_weights, quality_summary, gate_windows, profile_ranges
+)
+
+SENSOR = {sensor: i for i, sensor in enumerate(CFG["sensors"])}
+N_SAMPLES = 3 * 60 * CFG["fs"]
+
+
+def windows_of(start, stop):
+    """Windows overlapping samples [start, stop)"""
+    return [w for w in range(count_windows(N_SAMPLES)) if w * STRIDE < stop and w * STRIDE + STEP > start]
+
+
+@pytest.fixture
+def columns():
+    """Three minutes of clean signals in WESAD chest units"""
+    rng = np.random.default_rng(1)
+    t = np.arange(N_SAMPLES) / CFG["fs"]
+    return {
+        "ECG": np.sin(2 * np.pi * 1.2 * t) ** 15 + 0.05 * rng.standard_normal(N_SAMPLES),
+        "EDA": 2 + 0.1 * np.sin(2 * np.pi * 0.05 * t),
+        "EMG": 0.1 * rng.standard_normal(N_SAMPLES),
+        "Temp": 33 + 0.01 * rng.standard_normal(N_SAMPLES),
+    }
+
+
+def test_clean_signals_pass(columns):
+    flags = assess_windows(columns, N_SAMPLES)
+    assert flags.shape == (count_windows(N_SAMPLES), len(CFG["sensors"]))
+    assert not flags.any()
+
+
+def test_each_check_flags_only_the_affected_windows(columns):
+    columns["EMG"][3000:6000] = 0.0
+    columns["ECG"][9000:11000] = np.clip(columns["ECG"][9000:11000], -0.2, 0.2)
+    columns["Temp"][12000:14000] = 80.0
+    flags = assess_windows(columns, N_SAMPLES)
+
+    # Windows inside a bad stretch fail; windows that only touch its edge may or may not
+    flat = np.flatnonzero(flags[:, SENSOR["EMG"]] & FLAT)
+    assert set(windows_of(3500, 5500)) <= set(flat) <= set(windows_of(3000, 6000))
+    clipped = np.flatnonzero(flags[:, SENSOR["ECG"]] & CLIPPING)
+    assert set(windows_of(9500, 10500)) <= set(clipped) <= set(windows_of(9000, 11000))
+    out_of_range = np.flatnonzero(flags[:, SENSOR["Temp"]] & OUT_OF_RANGE)
+    assert set(out_of_range) == set(windows_of(12000, 14000))
+    # Untouched sensors and windows stay clean
+    assert not flags[:, SENSOR["EDA"]].any()
+    assert not flags[windows_of(0, 2500)].any()
+
+
+def test_heart_rate_outside_plausible_range(columns):
+    t = np.arange(N_SAMPLES) / CFG["fs"]
+    columns["ECG"] = np.sin(2 * np.pi * 0.3 * t) ** 15  # 18 bpm
+    flags = assess_windows(columns, N_SAMPLES)
+    assert (flags[:, SENSOR["ECG"]] & HEART_RATE).all()
+
+
+def test_missing_sensors_are_marked_and_not_failed(columns):
+    del columns["Temp"]
+    flags = assess_windows(columns, N_SAMPLES)
+    assert (flags[:, SENSOR["Temp"]] == MISSING).all()
+    np.testing.assert_array_equal(window_weights(flags, "skip"), np.ones(len(flags)))
+
+
+def test_blocked_checks_match_a_single_block(columns, monkeypatch):
+    columns["EMG"][3000:6000] = 0.0
+    columns["ECG"][9000:11000] = np.clip(columns["ECG"][9000:11000], -0.2, 0.2)
+    expected = assess_windows(columns, N_SAMPLES)
+    monkeypatch.setitem(QUALITY_CFG, "block_windows", 5)
+    np.testing.assert_array_equal(assess_windows(columns, N_SAMPLES), expected)
+
+
+def test_ranges_follow_the_signal_profile(columns):
+    columns["Temp"][:] = 90.0  # e.g. a device reporting Fahrenheit
+    wesad = assess_windows(columns, N_SAMPLES, ranges=profile_ranges(resolve_profile("wesad_chest")))
+    assert (wesad[:, SENSOR["Temp"]] & OUT_OF_RANGE).all()
+
+    device = SignalProfile("device", 130)
+    assert profile_ranges(device) == {}
+    assert not assess_windows(columns, N_SAMPLES, ranges=profile_ranges(device)).any()
+
+    fahrenheit = SignalProfile("device", 130, quality_ranges={"Temp": (68, 113)})
+    assert not assess_windows(columns, N_SAMPLES, ranges=profile_ranges(fahrenheit)).any()
+    assert profile_ranges(SignalProfile("device", 100, units="wesad_chest", quality_ranges={"Temp": (68, 113)})) == {
+        **QUALITY_CFG["ranges"], "Temp": (68, 113)
+    }
+
+
+def test_window_weights_by_mode():
+    flags = np.zeros((4, len(CFG["sensors"])), dtype=np.uint8)
+    flags[1, SENSOR["ECG"]] = FLAT
+    flags[2, [SENSOR["ECG"], SENSOR["EMG"]]] = OUT_OF_RANGE
+    flags[3, SENSOR["Temp"]] = MISSING
+    np.testing.assert_array_equal(window_weights(flags, "skip"), [1, 0, 0, 1])
+    np.testing.assert_allclose(window_weights(flags, "weight"), [1, 0.75, 0.5, 1])
+    for mode in ("off", "report"):
+        np.testing.assert_array_equal(window_weights(flags, mode), np.ones(4))
+
+
+def test_every_window_failing_falls_back_to_all():
+    flags = np.full((3, len(CFG["sensors"])), FLAT, dtype=np.uint8)
+    np.testing.assert_array_equal(window_weights(flags, "skip"), np.ones(3))
+    np.testing.assert_array_equal(window_weights(flags, "skip", fallback=False), np.zeros(3))
+    assert quality_summary(flags, window_weights(flags, "skip"), "skip")["fallback"]
+
+
+def test_gate_windows_and_summary():
+    flags = np.zeros((5, len(CFG["sensors"])), dtype=np.uint8)
+    flags[[1, 3], SENSOR["EMG"]] = FLAT | CLIPPING
+    usable, weights, summary = gate_windows(flags, 5, "skip")
+    np.testing.assert_array_equal(usable, [0, 2, 4])
+    np.testing.assert_array_equal(weights, np.ones(3))
+    assert summary["windows_failed"] == 2 and summary["windows_used"] == 3 and not summary["fallback"]
+    assert summary["sensors"]["EMG"]["failures"] == {"flat": 2, "clipping": 2, "out_of_range": 0}
+    usable, weights, summary = gate_windows(None, 5)
+    assert list(usable) == list(range(5)) and summary is None
@@ -0,0 +1,34 @@
+"""Prediction pool workers and their reported PIDs"""
+import asyncio
+import os
+
+import pytest
+
+from worker_pool import PredictionPool, ServerBusyError
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_workers_report_their_pids(start_method):
+    pool = PredictionPool("os", workers=2, max_pending=4, start_method=start_method)
+    try:
+        assert pool.pids() == []
+        pool.start()
+
+        async def main():
+            return await asyncio.gather(*(pool.run(os.getpid) for _ in range(4)))
+
+        task_pids = set(asyncio.run(main()))
+        if start_method == "fork":
+            assert len(pool.pids()) == 2
+        assert task_pids <= set(pool.pids()) and os.getpid() not in pool.pids()
+    finally:
+        pool.shutdown()
+    assert pool.pids() == []
+
+
+def test_full_queue_is_refused():
+    pool = PredictionPool("os", workers=0, max_pending=0)
+    with pytest.raises(ServerBusyError):
+        pool.check_capacity()
+    with pytest.raises(ServerBusyError):
+        asyncio.run(pool.run(os.getpid))
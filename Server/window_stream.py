@@ -0,0 +1,113 @@
+"""Serialisation of per-window predictions for /predict/windows
+
+Predictions arrive as batches of windows while feature extraction is still
+running. Each batch is written out as soon as it is scored, either as NDJSON
+(one JSON object per window, then a summary line) or as an Arrow IPC stream
+(one record batch per batch of windows, then an empty trailer batch with the
+summary as JSON in its custom metadata), so the full result set is never
+held in memory. pyarrow is only needed for Arrow output.
+"""
+import io
+import json
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+OUTPUT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+CLASS_NAMES = ["Low", "Medium", "High"]
+
+def output_format(name):
+    """Validated output format name"""
+    name = (name or "ndjson").lower()
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{name}'. Expected one of {tuple(OUTPUT_FORMATS)}")
+    if name == "arrow" and pa is None:
+        raise ValueError("Arrow output requires the 'pyarrow' package")
+    return name
+
+def batch_records(batch):
+    """One dict per window of a prediction batch"""
+    records = []
+    fusion_probs = batch.get("fusion_probs")
+    for row, window in enumerate(batch["window"]):
+        record = {
+            "window": int(window),
+            "start_sec": float(batch["start_sec"][row]),
+            "end_sec": float(batch["end_sec"][row]),
+            "physio_probs": batch["physio_probs"][row].tolist(),
+            "physio_pred": int(np.argmax(batch["physio_probs"][row]))
+        }
+        if fusion_probs is not None:
+            fusion_pred = int(np.argmax(fusion_probs[row]))
+            record.update({
+                "fusion_probs": fusion_probs[row].tolist(),
+                "fusion_pred": fusion_pred,
+                "prediction_label": CLASS_NAMES[fusion_pred]
+            })
+        records.append(record)
+    return records
+
+def ndjson_lines(batches, summary=None):
+    """NDJSON lines for every window, then the summary (a callable, run after the last batch)"""
+    for batch in batches:
+        yield "".join(json.dumps(record) + "\n" for record in batch_records(batch)).encode()
+    if summary is not None:
+        yield (json.dumps(summary()) + "\n").encode()
+
+def window_schema(fusion):
+    """Arrow schema of the per-window predictions, with fusion columns when DASS-21 responses were given"""
+    fields = [("window", pa.int64()), ("start_sec", pa.float64()), ("end_sec", pa.float64())]
+    for prefix in ("physio", "fusion") if fusion else ("physio",):
+        fields += [(f"{prefix}_{name.lower()}", pa.float64()) for name in CLASS_NAMES]
+        fields.append((f"{prefix}_pred", pa.int64()))
+    return pa.schema(fields)
+
+def _record_batch(batch, schema):
+    columns = {
+        "window": batch["window"],
+        "start_sec": batch["start_sec"],
+        "end_sec": batch["end_sec"],
+    }
+    for prefix in ("physio", "fusion"):
+        probs = batch.get(f"{prefix}_probs")
+        if probs is None:
+            continue
+        for i, name in enumerate(CLASS_NAMES):
+            columns[f"{prefix}_{name.lower()}"] = probs[:, i]
+        columns[f"{prefix}_pred"] = np.argmax(probs, axis=1)
+    return pa.RecordBatch.from_pydict(columns, schema=schema)
+
+def arrow_stream(batches, fusion=False, summary=None):
+    """Arrow IPC stream bytes: the schema, one message per batch, the summary trailer and the end-of-stream marker
+
+    The stream is valid even without windows. The summary (a callable, run
+    after the last batch) goes in the custom metadata of a last, empty
+    record batch, under "summary"; read it with
+    RecordBatchStreamReader.read_next_batch_with_custom_metadata().
+    """
+    schema = window_schema(fusion)
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def flush():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield flush()
+    for batch in batches:
+        writer.write_batch(_record_batch(batch, schema))
+        yield flush()
+    if summary is not None:
+        trailer = pa.RecordBatch.from_pydict({field.name: [] for field in schema}, schema=schema)
+        writer.write_batch(trailer, custom_metadata={"summary": json.dumps(summary())})
+    writer.close()
+    yield flush()
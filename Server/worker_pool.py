@@ -0,0 +1,112 @@
+"""Process pool for CPU-bound prediction work with bounded queueing
+
+Feature extraction (NumPy/SciPy) and SHAP hold the GIL for most of a request,
+so they run in worker processes instead of on the asyncio event loop. Each
+worker imports the serving module once at start-up and runs its
+warm_up_worker hook, which loads the models in that process; tasks only
+carry the request payload.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Pool configuration
+POOL_CFG = {
+    # Worker processes; 0 runs tasks in a thread of the serving process instead
+    "workers": int(os.environ.get("PREDICT_WORKERS", os.cpu_count() or 1)),
+    # Requests allowed in flight (running + queued) before answering 503
+    "max_pending": int(os.environ.get("PREDICT_MAX_PENDING", 2 * (os.cpu_count() or 1))),
+    # "spawn" avoids forking a process that already runs event-loop threads
+    "start_method": os.environ.get("PREDICT_START_METHOD", "spawn"),
+}
+
+class ServerBusyError(Exception):
+    """Raised when the prediction queue is full"""
+
+def _init_worker(module_name, started=None):
+    """Report the worker's PID, import the serving module and run its warm-up hook once"""
+    if started is not None:
+        started.put(os.getpid())
+    module = importlib.import_module(module_name)
+    warm_up = getattr(module, "warm_up_worker", None)
+    if warm_up is not None:
+        warm_up()
+
+class PredictionPool:
+    """Runs blocking functions off the event loop with a cap on pending work"""
+
+    def __init__(self, module_name, workers=None, max_pending=None, start_method=None):
+        self.module_name = module_name
+        self.workers = POOL_CFG["workers"] if workers is None else workers
+        self.max_pending = POOL_CFG["max_pending"] if max_pending is None else max_pending
+        self.start_method = start_method or POOL_CFG["start_method"]
+        self.pending = 0
+        self._executor = None
+        self._started = None
+        self._pids = set()
+
+    def _get_executor(self):
+        """Process pool, created on first use (never inside worker processes)"""
+        if self.workers <= 0:
+            return None  # Default thread pool of the event loop
+        if self._executor is None:
+            context = multiprocessing.get_context(self.start_method)
+            # Workers report their PIDs here as they start
+            self._started = context.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.module_name, self._started)
+            )
+        return self._executor
+
+    def start(self):
+        """Start every worker now; with "fork" they then share the parent's loaded models"""
+        executor = self._get_executor()
+        if executor is not None:
+            # fork starts all workers on the first task, other methods start them on demand
+            for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+            if self.start_method == "fork":
+                while len(self._pids) < self.workers:
+                    self._pids.add(self._started.get())
+
+    def pids(self):
+        """Process IDs of the workers started so far"""
+        if self._started is None:
+            return []
+        while not self._started.empty():
+            self._pids.add(self._started.get())
+        return sorted(self._pids)
+
+    def check_capacity(self):
+        """Raise ServerBusyError if run() would be refused now"""
+        if self.pending >= self.max_pending:
+            raise ServerBusyError(
+                f"Too many requests in progress ({self.pending}/{self.max_pending}), try again shortly"
+            )
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, or raise ServerBusyError if the queue is full
+
+        fn must be a module-level function of the serving module so that
+        workers can resolve it by name.
+        """
+        self.check_capacity()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._started.close()
+            self._started = None
+            self._pids = set()